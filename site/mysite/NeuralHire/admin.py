@@ -1,7 +1,38 @@
 from django.contrib import admin
-from .models import Job
+from .models import Job, City, SavedSearch, SavedSearchMatch
 
 # Register your models here.
 class AuthorAdmin(admin.ModelAdmin):
-    pass
-admin.site.register(Job, AuthorAdmin)
\ No newline at end of file
+    list_display = ('title', 'company', 'city', 'money', 'predicted_money')
+
+    def get_queryset(self, request):
+        # The change list never shows the 768-float vectors
+        return super().get_queryset(request).defer('content_embedding', 'shadow_embedding')
+admin.site.register(Job, AuthorAdmin)
+
+
+class CityAdmin(admin.ModelAdmin):
+    list_display = ('name', 'region')
+    search_fields = ('name', 'region')
+admin.site.register(City, CityAdmin)
+
+
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'active', 'min_score', 'last_job_id', 'created_at')
+    list_filter = ('active',)
+    search_fields = ('query',)
+    raw_id_fields = ('resume',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('embedding')
+admin.site.register(SavedSearch, SavedSearchAdmin)
+
+
+class SavedSearchMatchAdmin(admin.ModelAdmin):
+    list_display = ('saved_search', 'job', 'score', 'created_at')
+    raw_id_fields = ('saved_search', 'job')
+
+    def get_queryset(self, request):
+        return (super().get_queryset(request).select_related('saved_search', 'job')
+                .defer('saved_search__embedding', 'job__content_embedding', 'job__shadow_embedding'))
+admin.site.register(SavedSearchMatch, SavedSearchMatchAdmin)
@@ -0,0 +1,175 @@
+# alerts.py
+import heapq
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from NeuralHire.models import Job, Resume, SavedSearch, SavedSearchMatch
+from NeuralHire.rollout import live_model_source, searchable_jobs
+from NeuralHire.search import JOB_FIELDS, SearchFilters
+from NeuralHire.search_cache import get_catalogue
+from utils.dedup import vacancy_id
+from utils.embeddings import CHUNK_MEAN_WEIGHT, embed_query, embed_texts_versioned, resume_chunks, use_model
+
+ALERT_BATCH = 5000  # New jobs scored against all saved searches per matrix product
+MAX_MATCHES_PER_RUN = 50  # Best new matches recorded per saved search and run
+ALERT_FIELDS = JOB_FIELDS + ('link',)
+RESUME_VECTOR_FIELDS = ('summary_embedding', 'chunk_embeddings', 'embedding_version')
+
+
+def resume_vectors_stale(resume, embedding_version):
+    """True when the resume's chunk vectors are missing or of another model than the live job vectors."""
+    return not resume.chunk_embeddings or resume.embedding_version != embedding_version
+
+
+def embed_resume(resume):
+    """
+    Re-embed a stored resume with the current model, as upload_resume embeds it: the
+    summary first, then its sections (the OCR chunks are not kept). Sets the
+    RESUME_VECTOR_FIELDS without saving.
+    """
+    texts = resume_chunks({'full_summary': resume.full_summary, 'skills': resume.skills,
+                           'experience': resume.experience, 'preferences': resume.preferences})
+    matrix, version = embed_texts_versioned(texts) if texts else (None, None)
+    if matrix is None:
+        resume.summary_embedding, resume.chunk_embeddings, resume.embedding_version = None, None, ''
+        return
+    resume.summary_embedding = matrix[0].tolist() if texts[0] == str(resume.full_summary or '').strip() else None
+    resume.chunk_embeddings = matrix.tolist()
+    resume.embedding_version = version
+
+
+def saved_search_vectors(saved):
+    """
+    The vectors a saved search is scored with: the query vector, or for a resume search
+    the resume's chunk vectors (summary first), scored as upload_resume scores them.
+    """
+    if saved.resume_id and not saved.query and saved.resume.chunk_embeddings:
+        return saved.resume.chunk_embeddings
+    return [saved.embedding]
+
+
+def embed_saved_search(query='', resume=None):
+    """
+    Vector of a saved search: the query as a search query, or the first chunk vector of
+    the resume (embed_resume it first when resume_vectors_stale). Returns (vector or None,
+    model version tag).
+    """
+    if query:
+        return embed_query(query)
+    if resume is not None and resume.chunk_embeddings:
+        return resume.chunk_embeddings[0], resume.embedding_version
+    return None, None
+
+
+def saved_search_scores(similarities, starts):
+    """
+    Per-search scores from a (vectors, jobs) similarity matrix whose rows are the vectors
+    of consecutive saved searches, starting at `starts`: a single vector scores as is,
+    chunks are combined as in utils.embeddings.combine_chunk_scores.
+    """
+    counts = np.diff(np.append(starts, len(similarities)))
+    best = np.maximum.reduceat(similarities, starts, axis=0)
+    mean = np.add.reduceat(similarities, starts, axis=0) / counts[:, None]
+    return np.where(counts[:, None] > 1, (1 - CHUNK_MEAN_WEIGHT) * best + CHUNK_MEAN_WEIGHT * mean, best)
+
+
+async def acreate_saved_search(query, resume, filters, vector, embedding_version, owner=''):
+    """Store a search of the session `owner`; it is matched against jobs imported from now on."""
+    last = await Job.objects.aaggregate(last_id=Max('id'))
+    return await SavedSearch.objects.acreate(
+        query=query, resume=resume, filters=filters.as_dict(),
+        embedding=[float(value) for value in vector], embedding_version=embedding_version,
+        last_job_id=last['last_id'] or 0, owner=owner,
+    )
+
+
+def refresh_saved_vectors(searches, embedding_version):
+    """
+    Re-embed the saved searches (and the resumes of resume searches) whose vectors came
+    from another model than the live job vectors (after a cutover), with the live model.
+    Returns the number of saved searches re-embedded.
+    """
+    resumes = {saved.resume_id: saved.resume for saved in searches if saved.resume_id and not saved.query}
+    stale_resumes = [resume for resume in resumes.values() if resume_vectors_stale(resume, embedding_version)]
+    stale_resume_ids = {resume.pk for resume in stale_resumes}
+    stale = [saved for saved in searches if saved.embedding is None or saved.embedding_version != embedding_version
+             or (saved.resume_id in stale_resume_ids and not saved.query)]
+    if not stale:
+        return 0
+    use_model(live_model_source())
+    for resume in stale_resumes:
+        embed_resume(resume)
+    Resume.objects.bulk_update(stale_resumes, RESUME_VECTOR_FIELDS)
+    for saved in stale:
+        saved.embedding, version = embed_saved_search(saved.query, saved.resume)
+        saved.embedding_version = version or embedding_version
+    SavedSearch.objects.bulk_update(stale, ['embedding', 'embedding_version'])
+    return len(stale)
+
+
+def match_new_jobs(batch_size=ALERT_BATCH, progress=None):
+    """
+    Match the jobs added since the saved searches last ran. Each batch of new jobs is
+    scored against every saved vector in one (vectors x jobs) matrix product, so the
+    cost grows with new jobs x saved searches rather than with full searches per user.
+    Jobs at or below a search's last_job_id, under its min_score or outside its filters
+    are skipped; a vacancy matched before (relisted under a new id) is not recorded again.
+    Returns (jobs scored, matches recorded).
+    """
+    catalogue = get_catalogue()
+    searches = list(SavedSearch.objects.filter(active=True).select_related('resume').order_by('id'))
+    refresh_saved_vectors(searches, catalogue.embedding_version)
+    searches = [saved for saved in searches if saved.embedding is not None]
+    if not searches:
+        return 0, 0
+
+    # One row per saved vector: a query search has one, a resume search one per chunk
+    vector_sets = [saved_search_vectors(saved) for saved in searches]
+    vectors = np.array([vector for vector_set in vector_sets for vector in vector_set], dtype=np.float32)
+    starts = np.cumsum([0] + [len(vector_set) for vector_set in vector_sets[:-1]])
+    watermarks = np.array([saved.last_job_id for saved in searches], dtype=np.int64)
+    min_scores = np.array([saved.min_score for saved in searches], dtype=np.float32)
+    filters = [SearchFilters(**saved.filters) for saved in searches]
+    filtered = [i for i, search_filters in enumerate(filters) if search_filters]
+
+    jobs = searchable_jobs(catalogue.embedding_version).order_by('id')
+    best = [[] for _ in searches]  # Min-heaps of (score, job id, vacancy)
+    scored = 0
+    last_id = int(watermarks.min())
+    while True:
+        rows = list(jobs.filter(id__gt=last_id).values(*ALERT_FIELDS)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+
+        ids = np.fromiter((job['id'] for job in rows), dtype=np.int64, count=len(rows))
+        similarities = vectors @ np.array([job['content_embedding'] for job in rows], dtype=np.float32).T
+        scores = saved_search_scores(similarities, starts)
+        allowed = (ids[None, :] > watermarks[:, None]) & (scores >= min_scores[:, None])
+        columns = {}  # Filter columns of this batch, shared by the searches
+        for i in filtered:
+            allowed[i] &= filters[i].rows_mask(rows, columns)
+
+        for i, j in zip(*np.nonzero(allowed)):
+            job = rows[j]
+            entry = (float(scores[i, j]), job['id'], vacancy_id(job['link']) or f"job:{job['id']}")
+            if len(best[i]) < MAX_MATCHES_PER_RUN:
+                heapq.heappush(best[i], entry)
+            elif entry > best[i][0]:
+                heapq.heapreplace(best[i], entry)
+
+        scored += len(rows)
+        if progress:
+            progress(scored)
+
+    matches = [
+        SavedSearchMatch(saved_search=saved, job_id=job_id, vacancy=vacancy, score=score)
+        for saved, entries in zip(searches, best) for score, job_id, vacancy in entries
+    ]
+    with transaction.atomic():
+        before = SavedSearchMatch.objects.count()
+        SavedSearchMatch.objects.bulk_create(matches, ignore_conflicts=True)
+        recorded = SavedSearchMatch.objects.count() - before
+        SavedSearch.objects.filter(id__in=[saved.id for saved in searches],
+                                   last_job_id__lt=last_id).update(last_job_id=last_id)
+    return scored, recorded
@@ -0,0 +1,93 @@
+# cities.py
+from NeuralHire.models import City, Job
+from NeuralHire.search_cache import aget_catalogue_version
+from utils.cities import CITIES, CityMatcher, city_variants, parse_city
+
+_matcher = None  # (catalogue version, CityMatcher) for the web process
+
+
+def seed_cities():
+    """
+    Create the canonical cities of utils.cities.CITIES that are not in the table yet,
+    and refresh the stored variants of those that are (after inflection fixes).
+    """
+    canonical = {(name, region): city_variants(name) for name, region in CITIES}
+    existing = {(city.name, city.region): city for city in City.objects.filter(name__in=[n for n, _ in CITIES])}
+    stale = []
+    for key, city in existing.items():
+        if key in canonical and city.variants != canonical[key]:
+            city.variants = canonical[key]
+            stale.append(city)
+    City.objects.bulk_update(stale, ['variants'])
+    City.objects.bulk_create([
+        City(name=name, region=region, variants=variants)
+        for (name, region), variants in canonical.items() if (name, region) not in existing
+    ])
+
+
+def _matcher_entries(cities):
+    return [(city['id'], city['name'], city['region'], city['variants']) for city in cities]
+
+
+def load_city_matcher():
+    return CityMatcher(_matcher_entries(City.objects.values('id', 'name', 'region', 'variants')))
+
+
+async def aget_city_matcher(version=None):
+    """
+    Matcher over the City table. Cities only change on import, which bumps the
+    catalogue version, so the matcher is reloaded only when the version moves.
+    """
+    global _matcher
+    if version is None:
+        version = await aget_catalogue_version()
+    if _matcher is None or _matcher[0] != version:
+        cities = [city async for city in City.objects.values('id', 'name', 'region', 'variants')]
+        _matcher = (version, CityMatcher(_matcher_entries(cities)))
+    return _matcher[1]
+
+
+class CityResolver:
+    """
+    Resolves scraped city strings to City ids at import time, creating a City
+    (with generated inflections) for places missing from the table.
+    """
+
+    def __init__(self):
+        seed_cities()
+        self.matcher = load_city_matcher()
+        self.created = 0
+
+    def resolve(self, raw):
+        """City id for a scraped city string, or None when it is not a place."""
+        code = self.matcher.match(raw)
+        if code is not None:
+            return code
+        parsed = parse_city(raw)
+        if parsed is None:
+            return None
+
+        name, region = parsed
+        city, created = City.objects.get_or_create(
+            name=name, region=region, defaults={'variants': city_variants(name)}
+        )
+        self.created += created
+        # Later rows with the same city resolve from the matcher
+        self.matcher.add(city.id, city.name, city.region, city.variants)
+        return city.id
+
+    def name(self, code):
+        return self.matcher.names.get(code)
+
+
+def backfill_job_cities(resolver=None):
+    """Resolve city_ref for every job from its scraped city string. Returns the number updated."""
+    resolver = resolver or CityResolver()
+    updated = []
+    for job in Job.objects.only('id', 'city', 'city_ref'):
+        code = resolver.resolve(job.city)
+        if code != job.city_ref_id:
+            job.city_ref_id = code
+            updated.append(job)
+    Job.objects.bulk_update(updated, ['city_ref'], batch_size=1000)
+    return len(updated)
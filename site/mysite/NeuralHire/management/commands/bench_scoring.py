@@ -0,0 +1,92 @@
+# management/commands/bench_scoring.py
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from NeuralHire.search import SearchState
+from NeuralHire.snapshot import load_current_snapshot
+from utils.ranking import sharded_top_k, top_k_indices
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # Optional: without it, set OPENBLAS_NUM_THREADS=1 / OMP_NUM_THREADS=1
+    threadpool_limits = None
+
+
+def random_matrix(size, dims, seed):
+    """Normalised float32 rows, generated in blocks to keep the float64 temporaries small."""
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((size, dims), dtype=np.float32)
+    for start in range(0, size, 100_000):
+        block = rng.standard_normal((min(100_000, size - start), dims), dtype=np.float32)
+        matrix[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return matrix
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sharded parallel scoring (thread pool, per-shard top k, heap merge) against core count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[250_000, 1_000_000])
+        parser.add_argument('--threads', type=int, nargs='+',
+                            default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+        parser.add_argument('--k', type=int, default=100)
+        parser.add_argument('--dims', type=int, default=768)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--snapshot', action='store_true',
+                            help='Score the live embedding snapshot (memory-mapped) instead of random rows')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # One BLAS thread per shard: the speedup should come from the shards alone
+        limits = threadpool_limits(limits=1) if threadpool_limits else nullcontext()
+        if threadpool_limits is None:
+            self.stdout.write(self.style.WARNING(
+                "threadpoolctl is not installed: run with OPENBLAS_NUM_THREADS=1 for clean numbers"
+            ))
+        self.stdout.write(f"{os.cpu_count()} CPUs available")
+
+        with limits:
+            if options['snapshot']:
+                snapshot = load_current_snapshot()
+                if snapshot is None:
+                    raise CommandError('No embedding snapshot; run export_snapshot first.')
+                self._run(snapshot.embeddings, options)
+            else:
+                for size in options['sizes']:
+                    self._run(random_matrix(size, options['dims'], options['seed']), options)
+
+    def _run(self, matrix, options):
+        rng = np.random.default_rng(options['seed'] + 1)
+        # Queries as embed_query returns them (lists of Python floats), through the same
+        # conversion as a search, so a dtype mismatch with the matrix shows up here
+        raw = rng.standard_normal((options['queries'], matrix.shape[1]))
+        raw /= np.linalg.norm(raw, axis=1, keepdims=True)
+        queries = [SearchState('', vector.tolist()).query_vectors[0] for vector in raw]
+        k = options['k']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{len(matrix)} jobs x {matrix.shape[1]} dims ({matrix.nbytes / 2 ** 20:.0f} MiB), "
+            f"{len(queries)} queries ({queries[0].dtype}), k={k}"
+        ))
+
+        expected = [set(top_k_indices(matrix @ query, k)) for query in queries]
+        self.stdout.write(f"{'threads':>7} {'p50 ms':>8} {'speedup':>8} {'efficiency':>10}")
+        baseline = None
+        for threads in options['threads']:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                timings = []
+                for query, top in zip(queries, expected):
+                    start = time.perf_counter()
+                    indices, _ = sharded_top_k(lambda s, e: matrix[s:e] @ query, len(matrix), k, executor, threads)
+                    timings.append(time.perf_counter() - start)
+                    if set(indices) != top:
+                        raise CommandError(f"Sharded top {k} differs from the single-threaded one")
+
+            p50 = 1000 * float(np.median(timings))
+            baseline = baseline or p50
+            speedup = baseline / p50
+            self.stdout.write(f"{threads:>7} {p50:>8.1f} {speedup:>7.2f}x {speedup / threads:>10.0%}")
@@ -0,0 +1,228 @@
+# management/commands/bench_search.py
+import csv
+import hashlib
+import logging
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+
+from NeuralHire import views
+from NeuralHire.models import Job
+from NeuralHire.search import SearchFilters, SearchState, text_search_pipeline
+from utils import embeddings
+from utils.cities import CITIES, CityMatcher, city_variants, parse_city
+
+DEFAULT_JOBS_CSV = Path(settings.BASE_DIR).parent.parent / 'model' / 'jobs.csv'
+EMBEDDING_DIM = 768
+
+DEFAULT_QUERIES = [
+    'Python SQL JavaScript',
+    'повар горячего цеха',
+    'водитель категории C',
+    'продавец-консультант без опыта',
+    'бухгалтер 1С',
+    'охранник сменный график',
+    'менеджер по продажам удаленно',
+    'технолог HACCP',
+    'курьер студент',
+    'оператор call-центра',
+]
+
+
+
+class StubEncoder:
+    """Deterministic stand-in for SentenceTransformer: text hash -> unit vector."""
+
+    def encode(self, texts, normalize_embeddings=True, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.array([self._vector(t) for t in ([texts] if single else texts)])
+        return vectors[0] if single else vectors
+
+    @staticmethod
+    def _vector(text):
+        seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+        return vector / np.linalg.norm(vector)
+
+
+class StubReranker:
+    """Stand-in for the cross-encoder: word overlap, costed per pair like a real model call."""
+
+    def predict(self, pairs):
+        scores = []
+        for query, text in pairs:
+            query_words = set(query.lower().split())
+            text_words = set(text.lower().split())
+            scores.append(len(query_words & text_words) / (len(query_words) or 1))
+        return np.array(scores)
+
+
+def load_job_rows(path):
+    with open(path, encoding='utf8') as file:
+        return [row for row in csv.DictReader(file) if row.get('title')]
+
+
+def parse_money(raw):
+    """Salary column of jobs.csv -> int, -1 for "по договорённости" (as import_jobs stores it)."""
+    raw = (raw or '').strip()
+    return int(float(raw)) if raw.replace('.', '', 1).isdigit() else -1
+
+
+def city_matcher_for(rows):
+    """In-memory stand-in for the City table: the canonical cities plus those found in rows."""
+    matcher = CityMatcher((code, name, region, city_variants(name))
+                          for code, (name, region) in enumerate(CITIES, start=1))
+    for row in rows:
+        parsed = parse_city(row.get('city'))
+        if parsed and matcher.match(row['city']) is None:
+            name, region = parsed
+            matcher.add(len(matcher) + 1, name, region, city_variants(name))
+    return matcher
+
+
+def synthetic_catalogue(rows, size, seed=0, city_matcher=None):
+    """
+    Build `size` jobs shaped like Job.objects.values(...): real texts sampled from
+    jobs.csv, random normalised 768-d embeddings.
+    """
+    city_matcher = city_matcher or city_matcher_for(rows)
+    row_cities = [city_matcher.match(row.get('city')) for row in rows]
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(rows), size=size)
+    matrix = rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    jobs_data = []
+    for job_id, (pick, vector) in enumerate(zip(picks, matrix), start=1):
+        row = rows[pick]
+        jobs_data.append({
+            'id': job_id,
+            'content_embedding': vector,
+            'title': row.get('title', ''),
+            'knoladge': row.get('knoladge', ''),
+            'city': row.get('city', ''),
+            'city_ref': row_cities[pick],
+            'company': row.get('company', ''),
+            'addition': row.get('addition', ''),
+            'money': parse_money(row.get('money')),
+            'link': row.get('link', ''),
+        })
+    return jobs_data
+
+
+def percentile(values, q):
+    return 1000 * float(np.percentile(values, q)) if values else 0.0
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the text search pipeline stages on a synthetic job catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+        parser.add_argument('--csv', type=str, default=str(DEFAULT_JOBS_CSV),
+                            help='CSV with realistic job texts (model/jobs.csv)')
+        parser.add_argument('--queries', type=str, help='File with one query per line')
+        parser.add_argument('--rounds', type=int, default=3, help='Times the query set is replayed')
+        parser.add_argument('--addition', type=str, default='',
+                            help='Apply this addition filter to every query')
+        parser.add_argument('--min-salary', type=int,
+                            help='Apply this minimum salary filter (thousands of rubles) to every query')
+        parser.add_argument('--city', type=str, nargs='+', default=[], help='Apply this city filter to every query')
+        parser.add_argument('--compression', type=str, default=None,
+                            help='Score on compressed embeddings, e.g. pca256-int8 (see utils.compression)')
+        parser.add_argument('--real-models', action='store_true',
+                            help='Use the real embedding model and cross-encoder instead of stubs')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        queries = DEFAULT_QUERIES
+        if options['queries']:
+            with open(options['queries'], encoding='utf8') as file:
+                queries = [line.strip() for line in file if line.strip()]
+
+        if not options['real_models']:
+            embeddings._model = StubEncoder()
+            embeddings._reranker = StubReranker()
+
+        # The benchmark reports its own timings; keep per-stage log lines out of the output
+        logging.getLogger('neuralhire.timing').setLevel(logging.WARNING)
+
+        rows = load_job_rows(options['csv'])
+        selected_additions = [options['addition']] if options['addition'] else []
+        city_matcher = city_matcher_for(rows)
+        city_ids = None
+        if options['city']:
+            city_ids = {code for code in map(city_matcher.match, options['city']) if code is not None}
+        filters = SearchFilters(min_salary=options['min_salary'], include_negotiable=False, city_ids=city_ids)
+
+        for size in options['sizes']:
+            jobs_data = synthetic_catalogue(rows, size, seed=options['seed'], city_matcher=city_matcher)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"\n{size} jobs, {len(queries)} queries x {options['rounds']} rounds"
+            ))
+            self._run(jobs_data, queries * options['rounds'], selected_additions, filters, options['compression'])
+
+    def _run(self, jobs_data, queries, selected_additions, filters, compression):
+        jobs_by_id = {j['id']: j for j in jobs_data}
+        pipeline = text_search_pipeline(compression=compression)
+        stages = ['embed'] + [stage.name for stage in pipeline.stages] + ['render']
+        timings = {stage: [] for stage in stages}
+        totals = []
+
+        tracemalloc.start()
+        for user_query in queries:
+            query_start = time.perf_counter()
+
+            start = time.perf_counter()
+            query_embedding, _ = embeddings.embed_query(user_query)
+            timings['embed'].append(time.perf_counter() - start)
+
+            state = SearchState(user_query, query_embedding, selected_additions, jobs_data=jobs_data,
+                                filters=filters)
+            for stage, seconds in async_to_sync(self._timed_stages)(pipeline, state):
+                timings[stage].append(seconds)
+
+            start = time.perf_counter()
+            final_jobs = [self._job(jobs_by_id[job_id]) for job_id in state.ids]
+            render_to_string('neuralhire/results.html', {
+                'user_query': user_query,
+                'jobs': final_jobs,
+                'additions': views.list_of_additions,
+            })
+            timings['render'].append(time.perf_counter() - start)
+
+            totals.append(time.perf_counter() - query_start)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(f"{'stage':<15} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+        for stage in stages:
+            values = timings[stage]
+            self.stdout.write(f"{stage:<15} {percentile(values, 50):>10.2f} {percentile(values, 95):>10.2f}")
+        self.stdout.write(f"{'total':<15} {percentile(totals, 50):>10.2f} {percentile(totals, 95):>10.2f}")
+        self.stdout.write(f"throughput: {len(totals) / sum(totals):.1f} queries/s (single worker)")
+        self.stdout.write(f"peak traced memory: {peak / 2 ** 20:.1f} MiB")
+
+    @staticmethod
+    async def _timed_stages(pipeline, state):
+        """Run the pipeline, returning (stage name, seconds) for each stage."""
+        timings = []
+        start = time.perf_counter()
+        async for stage in pipeline.iter_stages(state):
+            timings.append((stage.name, time.perf_counter() - start))
+            start = time.perf_counter()
+        pipeline.finish(state)
+        return timings
+
+    @staticmethod
+    def _job(item):
+        return Job(
+            id=item['id'], title=item['title'], knoladge=item['knoladge'], city=item['city'],
+            company=item['company'], addition=item['addition'], link=item['link'], money=item['money'],
+        )
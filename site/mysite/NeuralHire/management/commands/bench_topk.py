@@ -0,0 +1,65 @@
+# management/commands/bench_topk.py
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from utils.ranking import top_k_indices, additions_mask
+
+ADDITIONS = ['Опыт не нужен', 'Удаленная работа', 'Доступно студентам', 'Сменный график']
+
+
+def sort_all(scores, additions, selected, k):
+    """Previous approach: a dict per job, Python filter, full sort, slice."""
+    scored = []
+    for index, score in enumerate(scores):
+        job_additions = additions[index]
+        if selected and not any(sel in job_additions for sel in selected):
+            continue
+        scored.append({'index': index, 'score': score})
+    scored.sort(key=lambda x: x['score'], reverse=True)
+    return [item['index'] for item in scored[:k]]
+
+
+def select_top(scores, additions, selected, k):
+    """NumPy pipeline: mask -> score vector -> argpartition -> sort of k items."""
+    mask = additions_mask(additions, selected) if selected else None
+    return top_k_indices(scores, k, mask=mask).tolist()
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark: full Python sort vs argpartition top-k on the scoring stage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--k', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--filter', action='store_true', help='Apply an additions filter')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        selected = ADDITIONS[:1] if options['filter'] else []
+
+        self.stdout.write(f"{'jobs':>10} {'sort (ms)':>12} {'top-k (ms)':>12} {'speedup':>9}")
+        for size in options['sizes']:
+            scores = rng.standard_normal(size).astype(np.float32)
+            additions = [str(rng.choice(ADDITIONS, size=2, replace=False).tolist()) for _ in range(size)]
+
+            expected = sort_all(scores, additions, selected, k)
+            result = select_top(scores, additions, selected, k)
+            if not np.allclose(scores[expected], scores[result]):
+                self.stdout.write(self.style.ERROR(f"Mismatch at {size} jobs"))
+                return
+
+            old_ms = self._time(sort_all, scores, additions, selected, k, options['repeat'])
+            new_ms = self._time(select_top, scores, additions, selected, k, options['repeat'])
+            self.stdout.write(f"{size:>10} {old_ms:>12.2f} {new_ms:>12.2f} {old_ms / new_ms:>8.1f}x")
+
+    @staticmethod
+    def _time(func, scores, additions, selected, k, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(scores, additions, selected, k)
+            timings.append(time.perf_counter() - start)
+        return 1000 * min(timings)
@@ -0,0 +1,71 @@
+# management/commands/check_embeddings.py
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Func
+from NeuralHire.models import Job
+from NeuralHire.rollout import live_model_source, set_live_model
+from NeuralHire.search_cache import bump_catalogue_version, get_catalogue
+from NeuralHire.snapshot import export_snapshot
+from utils.embeddings import EMBEDDING_DIM, model_version
+
+
+class Command(BaseCommand):
+    help = ('Check that the job vectors, the recorded live model and the model this host would '
+            'embed queries with share one version')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', action='store_true',
+                            help='Tag untagged vectors of the right dimension with the live model version '
+                                 '(once, for vectors made before versions were tracked)')
+
+    def handle(self, *args, **options):
+        catalogue = get_catalogue()
+        source = live_model_source(catalogue)
+        local_tag = model_version(source)
+        live_tag = catalogue.embedding_version or local_tag
+
+        self.stdout.write(f"Live model: {catalogue.embedding_model or '(not recorded)'} "
+                          f"{catalogue.embedding_version or ''}")
+        self.stdout.write(f"Query model on this host: {source} ({local_tag})")
+        problems = 0
+        if catalogue.embedding_version and local_tag != catalogue.embedding_version:
+            problems += 1
+            self.stdout.write(self.style.ERROR(
+                "The model files on this host differ from the model of the live vectors: searches will be refused. "
+                "Restore them or re-embed (reembed_jobs --shadow, then cutover_embeddings)."
+            ))
+
+        jobs = Job.objects.filter(content_embedding__isnull=False)
+        dims = jobs.annotate(dims=Func(F('content_embedding'), 1, function='array_length')) \
+            .values('dims').annotate(jobs=Count('id')).order_by('dims')
+        for row in dims:
+            style = self.style.SUCCESS if row['dims'] == EMBEDDING_DIM else self.style.ERROR
+            self.stdout.write(style(f"  {row['jobs']} jobs with {row['dims']}-dim vectors"))
+            problems += row['dims'] != EMBEDDING_DIM
+
+        self.stdout.write("Live vectors by model version:")
+        for row in jobs.values('embedding_version').annotate(jobs=Count('id')).order_by('-jobs'):
+            tag = row['embedding_version'] or '(untagged)'
+            searchable = not catalogue.embedding_version or row['embedding_version'] == catalogue.embedding_version
+            style = self.style.SUCCESS if searchable else self.style.WARNING
+            self.stdout.write(style(f"  {tag}: {row['jobs']} jobs" + ("" if searchable else " (not searched)")))
+            problems += not searchable
+
+        shadow = Job.objects.exclude(shadow_version='').values('shadow_version').annotate(jobs=Count('id'))
+        for row in shadow:
+            self.stdout.write(f"  shadow {row['shadow_version']}: {row['jobs']} jobs")
+
+        if options['adopt']:
+            adopted = jobs.filter(embedding_version='').annotate(
+                dims=Func(F('content_embedding'), 1, function='array_length')
+            ).filter(dims=EMBEDDING_DIM).update(embedding_version=live_tag)
+            if not catalogue.embedding_version:
+                set_live_model(source)
+            version = bump_catalogue_version()
+            self.stdout.write(self.style.SUCCESS(
+                f"Tagged {adopted} vectors as {live_tag}; catalogue version is now {version}."
+            ))
+            self.stdout.write(f"Embedding snapshot {export_snapshot().name} is live.")
+        elif problems:
+            self.stdout.write(self.style.WARNING(f"{problems} problem(s) found."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Embeddings are consistent."))
@@ -1,12 +1,23 @@
-# management/commands/import_jobs.py
-import pandas as pd
+# management/commands/check_jobs.py
+import time
 from django.core.management.base import BaseCommand
-from NeuralHire.models import Job
-from utils.embeddings import embed_text
+from NeuralHire.alerts import ALERT_BATCH, match_new_jobs
+
 
 class Command(BaseCommand):
-    def handle(self, *args, **options):
-        print(Job.objects.all().count())
+    help = 'Match the jobs imported since the last run against every saved search and record the new matches'
 
-        for i in Job.objects.all():
-            print(i, i.money)
\ No newline at end of file
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ALERT_BATCH,
+                            help='New jobs scored against all saved searches per matrix product')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        scored, recorded = match_new_jobs(
+            batch_size=options['batch_size'],
+            progress=lambda done: self.stdout.write(f"Scored {done} new jobs ({time.perf_counter() - start:.1f} s)..."),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {scored} new jobs against the saved searches: {recorded} new matches "
+            f"({time.perf_counter() - start:.1f} s)."
+        ))
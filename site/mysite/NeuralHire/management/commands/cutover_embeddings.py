@@ -0,0 +1,31 @@
+# management/commands/cutover_embeddings.py
+from django.core.management.base import BaseCommand, CommandError
+from NeuralHire.rollout import cutover, live_model_source
+from NeuralHire.snapshot import export_snapshot
+from utils.embeddings import model_version, resolve_model_source
+
+
+class Command(BaseCommand):
+    help = ('Atomically make the shadow vectors of a model live (after reembed_jobs --shadow); '
+            'the previous vectors move to the shadow column for a rollback')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, required=True,
+                            help='Hub name or directory of the model the shadow vectors were made with')
+        parser.add_argument('--allow-partial', action='store_true',
+                            help='Switch even if some jobs have no vector of the new model (they drop out of search)')
+
+    def handle(self, *args, **options):
+        source = resolve_model_source(options['model'])
+        previous = live_model_source()
+        try:
+            switched, missing = cutover(source, allow_partial=options['allow_partial'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Live model is now {source} ({model_version(source)}): {switched} jobs switched"
+            + (f", {missing} without a vector of it" if missing else "") + "."
+        ))
+        self.stdout.write(f"Embedding snapshot {export_snapshot().name} is live.")
+        self.stdout.write(f"Roll back with: manage.py cutover_embeddings --model {previous}")
@@ -0,0 +1,45 @@
+# management/commands/dedup_jobs.py
+import numpy as np
+from django.core.management.base import BaseCommand
+from NeuralHire.models import Job
+from NeuralHire.search_cache import bump_catalogue_version
+from NeuralHire.snapshot import export_snapshot
+from utils.dedup import duplicate_canonicals, vacancy_id
+from utils.embeddings import create_job_text
+
+
+class Command(BaseCommand):
+    help = 'Delete relisted and near-duplicate vacancies, keeping the earliest job of each cluster'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the duplicate clusters')
+
+    def handle(self, *args, **options):
+        jobs = list(Job.objects.order_by('id').values(
+            'id', 'title', 'knoladge', 'city', 'company', 'addition', 'link', 'content_embedding'
+        ))
+        self.stdout.write(f"Checking {len(jobs)} jobs...")
+
+        canonical = duplicate_canonicals(
+            [create_job_text(j['title'], j['knoladge'], j['city'], j['company'], j['addition']) for j in jobs],
+            embeddings=[j['content_embedding'] for j in jobs],
+            titles=[j['title'] for j in jobs],
+            keys=[vacancy_id(j['link']) for j in jobs],
+        )
+        duplicates = np.flatnonzero(canonical != np.arange(len(jobs)))
+        duplicate_ids = [jobs[i]['id'] for i in duplicates]
+
+        for i in duplicates[:10]:
+            original = jobs[canonical[i]]
+            self.stdout.write(f"  #{jobs[i]['id']} duplicates #{original['id']}: {original['title']}")
+
+        if options['dry_run'] or not duplicate_ids:
+            self.stdout.write(self.style.SUCCESS(f"{len(duplicate_ids)} duplicates found."))
+            return
+
+        Job.objects.filter(id__in=duplicate_ids).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {len(duplicate_ids)} duplicates."))
+
+        version = bump_catalogue_version()
+        self.stdout.write(f"Catalogue version is now {version} (search cache invalidated).")
+        self.stdout.write(f"Embedding snapshot {export_snapshot().name} is live.")
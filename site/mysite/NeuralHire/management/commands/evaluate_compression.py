@@ -0,0 +1,99 @@
+# management/commands/evaluate_compression.py
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from NeuralHire.models import Job
+from NeuralHire.search import COMPRESSED_OVERSAMPLE
+from utils.compression import CompressedEmbeddings
+from utils.embeddings import embed_query
+from utils.ranking import top_k_indices
+
+DEFAULT_SPECS = [
+    'float32', 'int8',
+    'truncate384', 'truncate256-int8',
+    'pca384', 'pca256-int8', 'pca128-int8',
+]
+FLOAT64_BYTES = 8  # Job.content_embedding as the views load it today
+
+
+def synthetic_embeddings(size, dims=768, rank=64, seed=0):
+    """
+    Normalised vectors with a decaying spectrum (a low-rank signal plus noise), closer
+    to sentence embeddings than isotropic noise, which no reduction can compress.
+    """
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((rank, dims)) * (1.0 / np.arange(1, rank + 1))[:, None]
+    matrix = rng.standard_normal((size, rank)) @ basis + 0.02 * rng.standard_normal((size, dims))
+    return (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+
+
+class Command(BaseCommand):
+    help = ('Compare compressed embedding formats: memory per job against recall@k of the '
+            'exact top k, with and without exact rescoring of the shortlist')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--specs', type=str, nargs='+', default=DEFAULT_SPECS,
+                            help='utils.compression specs, e.g. pca256-int8')
+        parser.add_argument('--k', type=int, default=20)
+        parser.add_argument('--oversample', type=int, default=COMPRESSED_OVERSAMPLE,
+                            help='Shortlist size for rescoring, as a multiple of k')
+        parser.add_argument('--queries', type=str,
+                            help='File with one query per line (embedded with the model); '
+                                 'default: perturbed embeddings of sampled jobs')
+        parser.add_argument('--sample-queries', type=int, default=200)
+        parser.add_argument('--synthetic', type=int,
+                            help='Evaluate on this many synthetic embeddings instead of the database')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            matrix = synthetic_embeddings(options['synthetic'], seed=options['seed'])
+        else:
+            matrix = np.array(list(Job.objects.filter(content_embedding__isnull=False)
+                                   .values_list('content_embedding', flat=True)), dtype=np.float32)
+        if not len(matrix):
+            raise CommandError('No jobs with embeddings.')
+
+        queries = self._queries(matrix, options)
+        k = options['k']
+        exact_top = [set(top_k_indices(matrix @ query, k)) for query in queries]
+        self.stdout.write(f"{len(matrix)} jobs x {matrix.shape[1]} dims, {len(queries)} queries, k={k}")
+
+        self.stdout.write(f"{'spec':<20} {'bytes/job':>9} {'vs float64':>10} {'GiB/1M jobs':>11} "
+                          f"{'recall@' + str(k):>9} {'rescored':>9} {'ms/query':>9}")
+        for spec in options['specs']:
+            try:
+                compressed = CompressedEmbeddings.build(matrix, spec)
+            except ValueError as error:
+                raise CommandError(str(error))
+            per_job = compressed.codec.bytes_per_vector(matrix.shape[1])
+
+            recalls, rescored, seconds = [], [], []
+            for query, relevant in zip(queries, exact_top):
+                start = time.perf_counter()
+                coarse = compressed.scores(query)
+                seconds.append(time.perf_counter() - start)
+
+                recalls.append(len(set(top_k_indices(coarse, k)) & relevant) / k)
+                shortlist = top_k_indices(coarse, k * options['oversample'])
+                best = shortlist[top_k_indices(matrix[shortlist] @ query, k)]
+                rescored.append(len(set(best) & relevant) / k)
+
+            self.stdout.write(
+                f"{spec:<20} {per_job:>9} {FLOAT64_BYTES * matrix.shape[1] / per_job:>9.1f}x "
+                f"{per_job * 1_000_000 / 2 ** 30:>11.2f} {np.mean(recalls):>9.3f} {np.mean(rescored):>9.3f} "
+                f"{1000 * np.mean(seconds):>9.2f}"
+            )
+
+    @staticmethod
+    def _queries(matrix, options):
+        if options['queries']:
+            with open(options['queries'], encoding='utf8') as file:
+                return [np.asarray(embed_query(line.strip())[0], dtype=np.float32) for line in file if line.strip()]
+        # Query-like vectors: sampled jobs pushed off their own position
+        rng = np.random.default_rng(options['seed'] + 1)
+        picks = rng.choice(len(matrix), min(options['sample_queries'], len(matrix)), replace=False)
+        queries = matrix[picks] + 0.5 * rng.standard_normal((len(picks), matrix.shape[1])) / np.sqrt(matrix.shape[1])
+        return list(queries / np.linalg.norm(queries, axis=1, keepdims=True))
@@ -0,0 +1,173 @@
+# management/commands/evaluate_ranking.py
+import itertools
+import json
+import logging
+import time
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from NeuralHire import search
+from NeuralHire.rollout import live_model_source, searchable_jobs
+from NeuralHire.search import SearchState, text_search_pipeline
+from NeuralHire.search_cache import get_catalogue
+from utils.embeddings import embed_query, use_model
+
+# text_search_pipeline argument -> command option holding the values to sweep
+SWEEP = {
+    'candidates_for_rerank': 'rerank_candidates',
+    'candidates_for_cross_encoder': 'cross_encoder_candidates',
+    'keyword_boost_weight': 'boost_weights',
+    'use_llm_validation': 'llm_validation',
+    'retrieval': 'retrieval',
+    'compression': 'compression',
+    'fusion': 'fusion',
+    'mmr_lambda': 'mmr_lambdas',
+}
+
+
+def sweep_grid(options):
+    """
+    Configurations to evaluate: the product of the swept values, without the duplicates
+    of settings a configuration ignores (keyword_boost_weight outside fusion='keyword_boost').
+    """
+    names = list(SWEEP)
+    grid = []
+    for values in itertools.product(*(options[SWEEP[name]] for name in names)):
+        config = dict(zip(names, values))
+        if config['fusion'] != 'keyword_boost':
+            config['keyword_boost_weight'] = None
+        if config not in grid:
+            grid.append(config)
+    return grid
+
+
+def _number(value, width, decimals=2):
+    """Right-aligned number for the result table, '-' for None (an unused or disabled setting)."""
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{decimals}f}"
+
+
+def recall_at_k(ranked_ids, relevant, k):
+    if not relevant:
+        return 0.0
+    return len(set(ranked_ids[:k]) & relevant) / len(relevant)
+
+
+def ndcg_at_k(ranked_ids, relevant, k):
+    """Binary-relevance NDCG."""
+    gains = [1.0 / np.log2(rank + 2) for rank, job_id in enumerate(ranked_ids[:k]) if job_id in relevant]
+    ideal = sum(1.0 / np.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return sum(gains) / ideal if ideal else 0.0
+
+
+class Command(BaseCommand):
+    help = ('Evaluate ranking configurations on a labelled query set: '
+            'recall@k / NDCG@k against per-query latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', type=str,
+                            help='JSON list of {"query": ..., "relevant": [job ids], "additions": [...]}')
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--rerank-candidates', type=int, nargs='+', default=[search.CANDIDATES_FOR_RERANK])
+        parser.add_argument('--cross-encoder-candidates', type=int, nargs='+',
+                            default=[search.CANDIDATES_FOR_CROSS_ENCODER])
+        parser.add_argument('--boost-weights', type=float, nargs='+', default=[search.KEYWORD_BOOST_WEIGHT],
+                            help="Keyword boost weights to try (only used with --fusion keyword_boost)")
+        parser.add_argument('--llm-validation', type=lambda v: v.lower() in ('1', 'true', 'yes'), nargs='+',
+                            default=[search.USE_LLM_VALIDATION])
+        parser.add_argument('--retrieval', choices=['exact', 'approx'], nargs='+', default=['exact', 'approx'])
+        parser.add_argument('--compression', type=lambda v: None if v == 'none' else v, nargs='+',
+                            default=[search.EMBEDDING_COMPRESSION],
+                            help="Compressed scoring specs to try, e.g. pca256-int8 ('none' = full matrix)")
+        parser.add_argument('--mmr-lambdas', type=lambda v: None if v == 'none' else float(v), nargs='+',
+                            default=[search.MMR_LAMBDA],
+                            help="MMR trade-offs to try (1.0 = relevance only, 'none' = no MMR stage)")
+        parser.add_argument('--fusion', choices=['rrf', 'weighted', 'keyword_boost'], nargs='+',
+                            default=[search.FUSION])
+        parser.add_argument('--latency-budget', type=float, default=3600.0,
+                            help='Per-query latency budget in seconds (default: large enough that no stage degrades)')
+        parser.add_argument('--min-recall', type=float, default=None,
+                            help='Recommend the fastest configuration with at least this recall@k')
+        parser.add_argument('--output', type=str, help='Write all results to this JSON file')
+
+    def handle(self, *args, **options):
+        logging.getLogger('neuralhire.timing').setLevel(logging.WARNING)
+
+        with open(options['labels'], encoding='utf8') as file:
+            labelled = json.load(file)
+        if not labelled:
+            raise CommandError('The labelled query set is empty.')
+
+        # The catalogue the web search sees: live-model vectors in id order, queries embedded by that model
+        catalogue = get_catalogue()
+        jobs_data = list(searchable_jobs(catalogue.embedding_version).order_by('id').values(*search.JOB_FIELDS))
+        if not jobs_data:
+            raise CommandError('No jobs with embeddings.')
+        self.stdout.write(f"{len(labelled)} queries, {len(jobs_data)} jobs")
+        use_model(live_model_source(catalogue))
+
+        # Query embeddings don't depend on the configuration: compute them once
+        queries = []
+        for item in labelled:
+            queries.append({
+                'query': item['query'],
+                'relevant': set(item.get('relevant', [])),
+                'additions': item.get('additions', []),
+                'embedding': embed_query(item['query'])[0],
+            })
+
+        names = list(SWEEP)
+        k = options['k']
+        results = []
+
+        self.stdout.write(f"{'rerank':>6} {'ce':>4} {'boost':>5} {'llm':>5} {'retr':>6} "
+                          f"{'compression':>20} {'fusion':>13} {'mmr':>4} {'recall@' + str(k):>9} {'ndcg@' + str(k):>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for config in sweep_grid(options):
+            pipeline = text_search_pipeline(**config, latency_budget=options['latency_budget'])
+            recalls, ndcgs, latencies = self._evaluate(pipeline, jobs_data, queries, k)
+
+            result = {
+                **config,
+                f'recall@{k}': float(np.mean(recalls)),
+                f'ndcg@{k}': float(np.mean(ndcgs)),
+                'p50_ms': 1000 * float(np.percentile(latencies, 50)),
+                'p95_ms': 1000 * float(np.percentile(latencies, 95)),
+            }
+            results.append(result)
+            self.stdout.write(
+                f"{config['candidates_for_rerank']:>6} {config['candidates_for_cross_encoder']:>4} "
+                f"{_number(config['keyword_boost_weight'], 5)} {str(config['use_llm_validation']):>5} "
+                f"{config['retrieval']:>6} {str(config['compression']):>20} {config['fusion']:>13} "
+                f"{_number(config['mmr_lambda'], 4)} "
+                f"{result[f'recall@{k}']:>9.3f} {result[f'ndcg@{k}']:>8.3f} "
+                f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}"
+            )
+
+        if options['min_recall'] is not None:
+            passing = [r for r in results if r[f'recall@{k}'] >= options['min_recall']]
+            if passing:
+                best = min(passing, key=lambda r: r['p95_ms'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Cheapest configuration with recall@{k} >= {options['min_recall']}: "
+                    + ", ".join(f"{name}={best[name]}" for name in names)
+                ))
+            else:
+                self.stdout.write(self.style.WARNING("No configuration meets the recall bar."))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    def _evaluate(self, pipeline, jobs_data, queries, k):
+        recalls, ndcgs, latencies = [], [], []
+        for item in queries:
+            state = SearchState(item['query'], item['embedding'], item['additions'], jobs_data=jobs_data)
+            start = time.perf_counter()
+            async_to_sync(pipeline.run)(state)
+            latencies.append(time.perf_counter() - start)
+            ranked_ids = [] if state.error else state.ids
+
+            recalls.append(recall_at_k(ranked_ids, item['relevant'], k))
+            ndcgs.append(ndcg_at_k(ranked_ids, item['relevant'], k))
+        return recalls, ndcgs, latencies
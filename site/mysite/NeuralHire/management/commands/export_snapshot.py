@@ -0,0 +1,27 @@
+# management/commands/export_snapshot.py
+from django.core.management.base import BaseCommand
+from NeuralHire.snapshot import KEEP_SNAPSHOTS, Snapshot, export_snapshot, snapshot_dir
+
+
+class Command(BaseCommand):
+    help = ('Export the job embeddings to a memory-mapped snapshot that the web workers map '
+            'read-only, and make it the live snapshot')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, default=None,
+                            help='Snapshot directory (default: settings.EMBEDDING_SNAPSHOT_DIR)')
+        parser.add_argument('--keep', type=int, default=KEEP_SNAPSHOTS, help='Snapshots to keep, the new one included')
+        parser.add_argument('--compression', type=str, nargs='*', default=None,
+                            help='Compressed code specs to include (default: search.EMBEDDING_COMPRESSION)')
+
+    def handle(self, *args, **options):
+        path = export_snapshot(options['dir'] or snapshot_dir(), keep=options['keep'],
+                               compression=options['compression'])
+        snapshot = Snapshot(path)
+        size = snapshot.embeddings.nbytes / 2 ** 20
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot {path.name}: {len(snapshot)} jobs, {size:.1f} MiB of embeddings "
+            f"(catalogue version {snapshot.version})"
+            + "".join(f", {spec} codes {codes.nbytes / 2 ** 20:.1f} MiB" for spec, codes in snapshot.compressed.items())
+            + "."
+        ))
@@ -1,16 +1,38 @@
 # management/commands/import_jobs.py
+import numpy as np
 import pandas as pd
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from NeuralHire.alerts import match_new_jobs
+from NeuralHire.cities import CityResolver
 from NeuralHire.models import Job
-from utils.embeddings import embed_job
+from NeuralHire.rollout import live_model_source, set_live_model
+from NeuralHire.salaries import usable_salary_model
+from NeuralHire.search_cache import bump_catalogue_version
+from NeuralHire.snapshot import export_snapshot
+from utils.dedup import duplicate_canonicals, vacancy_id
+from utils.embeddings import EMBEDDING_DIM, create_job_text, embed_job, model_version, use_model
+from utils.salary import get_salary_model
 import re
 
+# Job columns filled from the CSV; a change to the embedded ones re-embeds the job
+EMBEDDED_FIELDS = ('title', 'knoladge', 'company', 'addition', 'city')
+UPDATE_FIELDS = EMBEDDED_FIELDS + ('money', 'link', 'city_ref', 'content_embedding', 'embedding_version',
+                                   'predicted_money')
+# A re-embedded job also drops its pending shadow vector; the column is deferred on read,
+# so it is only written for those jobs (writing a deferred field reloads it per job)
+REEMBEDDED_FIELDS = UPDATE_FIELDS + ('shadow_embedding', 'shadow_version')
+WRITE_BATCH = 500  # Rows per INSERT/UPDATE statement (and per read of the current catalogue)
+
 
 class Command(BaseCommand):
-    help = 'Import jobs from CSV and generate embeddings with rich context'
+    help = ('Import jobs from CSV and generate embeddings with rich context. The CSV is the new catalogue: '
+            'jobs keep their id across imports, new ones are added, missing ones removed')
 
     def add_arguments(self, parser):
         parser.add_argument('csv_file', type=str, help='Path to CSV file')
+        parser.add_argument('--no-dedup', action='store_true',
+                            help='Keep relisted and near-duplicate vacancies')
 
     def handle(self, *args, **options):
         csv_file = options['csv_file']
@@ -22,12 +44,27 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR("File not found."))
             return
 
-        self.stdout.write("Deleting old jobs...")
-        Job.objects.all().delete()
+        # Every job ends up with a vector of the model that serves queries
+        model_source = live_model_source()
+        use_model(model_source)
+        model_tag = model_version(model_source)
+        self.stdout.write(f"Embedding with {model_source} ({model_tag}).")
+
+        # Jobs already in the catalogue keep their id (and their vector unless their text
+        # changed), so saved searches only see vacancies that are really new
+        existing = self._existing_jobs()
+        existing_ids = {job.id for jobs in existing.values() for job in jobs}
+        self.stdout.write(f"{len(existing_ids)} jobs in the catalogue.")
 
-        jobs_to_create = []
+        kept, new_jobs = [], []
+        changed_ids, reembedded_ids = set(), set()
         count = 0
+        embedded = 0
         embedding_failures = 0
+        cities = CityResolver()
+        dedup = not options['no_dedup']
+        seen_vacancies, seen_texts = set(), set()
+        relisted = 0
 
         for idx, row in df.iterrows():
             title = str(row.get('title', 'Unknown'))[:255]
@@ -37,6 +74,18 @@ class Command(BaseCommand):
             addition = str(row.get('addition', ''))
             link = str(row.get('link', ''))
 
+            # The same vacancy relisted under another search URL (or with identical text)
+            # is skipped before it costs an embedding
+            job_text = create_job_text(title, knoladge, city, company, addition)
+            vacancy = vacancy_id(link)
+            if dedup:
+                if vacancy in seen_vacancies or job_text in seen_texts:
+                    relisted += 1
+                    continue
+                if vacancy:
+                    seen_vacancies.add(vacancy)
+                seen_texts.add(job_text)
+
             raw_money = row.get('money')
             if pd.isna(raw_money) or raw_money is None:
                 money = None
@@ -60,42 +109,127 @@ class Command(BaseCommand):
                     else:
                         money = -1
 
-            # Use the new embed_job function for richer embeddings
-            # Includes title, knowledge, city, company, and additions for better context
-            embedding = embed_job(
-                title=title,
-                knowledge=knoladge,
-                city=city,
-                company=company,
-                additions=addition
-            )
-
-            if embedding is None or len(embedding) != 384:
-                embedding = None
-                embedding_failures += 1
-
-            job = Job(
-                title=title,
-                knoladge=knoladge,
-                company=company,
-                money=money,
-                addition=addition,
-                city=city,
-                link=link,
-                content_embedding=embedding,
-            )
-            jobs_to_create.append(job)
+            fields = {'title': title, 'knoladge': knoladge, 'company': company, 'money': money,
+                      'addition': addition, 'city': city, 'link': link}
+            # The vacancy id identifies a job across imports; jobs without one, their text
+            same_key = existing.get(vacancy or job_text)
+            job = same_key.pop(0) if same_key else Job()
+            text_changed = job.pk is None or any(getattr(job, name) != fields[name] for name in EMBEDDED_FIELDS)
+            if job.pk is not None and any(getattr(job, name) != value for name, value in fields.items()):
+                changed_ids.add(job.pk)
+            for name, value in fields.items():
+                setattr(job, name, value)
+
+            if text_changed or job.content_embedding is None or job.embedding_version != model_tag:
+                city_id = cities.resolve(city)
+                # Use the new embed_job function for richer embeddings
+                # Includes title, knowledge, city, company, and additions for better context
+                embedding = embed_job(
+                    title=title,
+                    knowledge=knoladge,
+                    city=cities.name(city_id) or city,
+                    company=company,
+                    additions=addition
+                )
+
+                if embedding is None or len(embedding) != EMBEDDING_DIM:
+                    embedding = None
+                    embedding_failures += 1
+
+                job.city_ref_id = city_id
+                job.content_embedding = embedding
+                job.embedding_version = model_tag if embedding else ''
+                # A pending shadow vector (reembed_jobs --shadow) and the estimate are of the old text
+                job.shadow_embedding, job.shadow_version = None, ''
+                job.predicted_money = None
+                embedded += 1
+                if job.pk is not None:
+                    changed_ids.add(job.pk)
+                    reembedded_ids.add(job.pk)
+
+            (new_jobs if job.pk is None else kept).append(job)
             count += 1
 
             if count % 50 == 0:
                 self.stdout.write(f"Processed {count} rows...")
 
-        if jobs_to_create:
+        self.stdout.write(f"Cities resolved ({cities.created} new cities added).")
+
+        # Existing jobs come first, so a near-duplicate keeps the id it already has
+        jobs = sorted(kept, key=lambda job: job.pk) + new_jobs
+        if dedup and jobs:
+            jobs, near_duplicates = self._drop_near_duplicates(jobs)
+            self.stdout.write(f"Dropped {relisted} relisted and {near_duplicates} near-duplicate vacancies.")
+
+        pending = [job for job in jobs if job.predicted_money is None]
+        salary_model = usable_salary_model()
+        if pending and salary_model is not None:
+            # New jobs get an estimated salary before they become searchable
+            predictions = salary_model.predict([
+                {'title': job.title, 'knoladge': job.knoladge, 'addition': job.addition, 'city': job.city,
+                 'city_ref': job.city_ref_id, 'content_embedding': job.content_embedding}
+                for job in pending
+            ])
+            for job, value in zip(pending, predictions):
+                job.predicted_money = int(value)
+                if job.pk is not None:
+                    changed_ids.add(job.pk)
+            self.stdout.write(f"Predicted salaries for {len(pending)} jobs.")
+        elif pending:
+            # Without estimates, jobs with no listed salary only pass salary filters as negotiable
+            reason = ('no salary model has been trained' if get_salary_model() is None
+                      else 'the salary model was trained on vectors of another embedding model')
+            self.stdout.write(self.style.WARNING(
+                f"Salaries not estimated: {reason}. Run train_salary_model, then predict_salaries."
+            ))
+
+        kept_ids = {job.pk for job in jobs if job.pk is not None}
+        removed_ids = sorted(existing_ids - kept_ids)
+        updated = [job for job in jobs if job.pk in changed_ids]
+        created = [job for job in jobs if job.pk is None]
+        if removed_ids or updated or created:
             self.stdout.write("Saving to database...")
-            Job.objects.bulk_create(jobs_to_create)
+            with transaction.atomic():
+                # Jobs missing from the CSV are gone from the catalogue
+                Job.objects.filter(id__in=removed_ids).delete()
+                Job.objects.bulk_update([job for job in updated if job.pk in reembedded_ids], REEMBEDDED_FIELDS,
+                                        batch_size=WRITE_BATCH)
+                Job.objects.bulk_update([job for job in updated if job.pk not in reembedded_ids], UPDATE_FIELDS,
+                                        batch_size=WRITE_BATCH)
+                Job.objects.bulk_create(created, batch_size=WRITE_BATCH)
             self.stdout.write(self.style.SUCCESS(
-                f"Successfully created {len(jobs_to_create)} jobs. "
-                f"({embedding_failures} embedding failures)"
+                f"Created {len(created)}, updated {len(updated)} and removed {len(removed_ids)} jobs; "
+                f"{len(kept_ids) - len(updated)} unchanged. "
+                f"({embedded} embedded, {embedding_failures} embedding failures)"
             ))
         else:
-            self.stdout.write(self.style.WARNING("No jobs found to create."))
\ No newline at end of file
+            self.stdout.write(self.style.WARNING("Catalogue unchanged."))
+
+        set_live_model(model_source)
+        if removed_ids or updated or created:
+            version = bump_catalogue_version()
+            self.stdout.write(f"Catalogue version is now {version} (search cache invalidated).")
+            self.stdout.write(f"Embedding snapshot {export_snapshot().name} is live.")
+
+        scored, recorded = match_new_jobs()
+        self.stdout.write(f"Saved searches: {recorded} new matches among {scored} new jobs.")
+
+    @staticmethod
+    def _existing_jobs():
+        """Catalogue jobs by vacancy key (the vacancy id, else the job text), in id order."""
+        existing = {}
+        for job in Job.objects.defer('shadow_embedding').order_by('id').iterator(chunk_size=WRITE_BATCH):
+            text = create_job_text(job.title, job.knoladge, job.city, job.company, job.addition)
+            existing.setdefault(vacancy_id(job.link) or text, []).append(job)
+        return existing
+
+    @staticmethod
+    def _drop_near_duplicates(jobs):
+        """Keep the first job of every near-duplicate cluster (MinHash LSH + embedding cosine)."""
+        canonical = duplicate_canonicals(
+            [create_job_text(job.title, job.knoladge, job.city, job.company, job.addition) for job in jobs],
+            embeddings=[job.content_embedding for job in jobs],
+            titles=[job.title for job in jobs],
+        )
+        keep = canonical == np.arange(len(jobs))
+        return [job for job, kept in zip(jobs, keep) if kept], int(len(jobs) - keep.sum())
@@ -0,0 +1,23 @@
+# management/commands/normalise_cities.py
+from django.core.management.base import BaseCommand
+from NeuralHire.cities import CityResolver, backfill_job_cities
+from NeuralHire.models import City
+from NeuralHire.search_cache import bump_catalogue_version
+from NeuralHire.snapshot import export_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Seed the canonical city table and resolve Job.city_ref for existing jobs'
+
+    def handle(self, *args, **options):
+        resolver = CityResolver()
+        self.stdout.write(f"{City.objects.count()} cities in the table.")
+
+        updated = backfill_job_cities(resolver)
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated the city of {updated} jobs ({resolver.created} new cities added)."
+        ))
+
+        version = bump_catalogue_version()
+        self.stdout.write(f"Catalogue version is now {version} (search cache invalidated).")
+        self.stdout.write(f"Embedding snapshot {export_snapshot().name} is live.")
@@ -0,0 +1,38 @@
+# management/commands/predict_salaries.py
+import time
+from django.core.management.base import BaseCommand, CommandError
+from NeuralHire.salaries import PREDICT_BATCH, fill_predicted_salaries, usable_salary_model
+from NeuralHire.search_cache import bump_catalogue_version
+from NeuralHire.snapshot import export_snapshot
+from utils.salary import SALARY_MODEL_PATH, SalaryModel
+
+
+class Command(BaseCommand):
+    help = 'Fill Job.predicted_money for the catalogue with the trained salary model, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, default=SALARY_MODEL_PATH, help='Salary model file')
+        parser.add_argument('--batch-size', type=int, default=PREDICT_BATCH)
+        parser.add_argument('--force', action='store_true',
+                            help='Predict every job again, not only those without a prediction')
+
+    def handle(self, *args, **options):
+        try:
+            model = SalaryModel.load(options['model'])
+        except OSError:
+            raise CommandError(f"No salary model at {options['model']}; run train_salary_model first.")
+        if usable_salary_model(model) is None:
+            raise CommandError('The salary model was trained on vectors of another embedding model; '
+                               'run train_salary_model again.')
+
+        start = time.perf_counter()
+        count = fill_predicted_salaries(
+            model, batch_size=options['batch_size'], force=options['force'],
+            progress=lambda done: self.stdout.write(f"Predicted {done} jobs ({time.perf_counter() - start:.0f} s)..."),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Predicted salaries for {count} jobs."))
+        if count:
+            # Filters and salary sorting read the predictions from the catalogue columns
+            version = bump_catalogue_version()
+            self.stdout.write(f"Catalogue version is now {version} (search cache invalidated).")
+            self.stdout.write(f"Embedding snapshot {export_snapshot().name} is live.")
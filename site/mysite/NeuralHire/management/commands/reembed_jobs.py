@@ -1,16 +1,36 @@
 from django.core.management.base import BaseCommand
 from NeuralHire.models import Job
-from utils.embeddings import embed_job
+from NeuralHire.rollout import SHADOW_BATCH, live_model_source, set_live_model, shadow_reembed
+from NeuralHire.search_cache import bump_catalogue_version
+from NeuralHire.snapshot import export_snapshot
+from utils.embeddings import embed_job, model_version, resolve_model_source, use_model
 import time
 
 class Command(BaseCommand):
     help = 'Re-embed all jobs using the current embedding model'
 
-    def handle(self, *args, **kwargs):
-        jobs = Job.objects.all()
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, default=None,
+                            help='Hub name or directory of the model (default: the live model)')
+        parser.add_argument('--shadow', action='store_true',
+                            help='Write to the shadow column while the live vectors keep serving; '
+                                 'make them live with cutover_embeddings')
+        parser.add_argument('--batch-size', type=int, default=SHADOW_BATCH)
+        parser.add_argument('--force', action='store_true',
+                            help='With --shadow, also re-encode jobs that already have a shadow vector of this model')
+
+    def handle(self, *args, **options):
+        source = resolve_model_source(options['model']) if options['model'] else live_model_source()
+        if options['shadow']:
+            self._shadow(source, options)
+            return
+
+        use_model(source)
+        model_tag = model_version(source)
+        jobs = Job.objects.select_related('city_ref')
         total = jobs.count()
-        self.stdout.write(f"Found {total} jobs to re-embed...")
-        
+        self.stdout.write(f"Found {total} jobs to re-embed with {source} ({model_tag})...")
+
         count = 0
         for job in jobs:
             try:
@@ -19,20 +39,39 @@ class Command(BaseCommand):
                 embedding = embed_job(
                     title=job.title,
                     knowledge=job.knoladge,
-                    city=job.city,
+                    city=job.city_ref.name if job.city_ref else job.city,
                     company=job.company,
                     additions=job.addition
                 )
-                
+
                 if embedding:
                     job.content_embedding = embedding
+                    job.embedding_version = model_tag
                     job.save()
                     count += 1
-                    
+
                 if count % 100 == 0:
                     self.stdout.write(f"Processed {count}/{total} jobs...")
-                    
+
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"Error processing job {job.id}: {e}"))
-        
+
         self.stdout.write(self.style.SUCCESS(f"Successfully re-embedded {count} jobs."))
+
+        set_live_model(source)
+        version = bump_catalogue_version()
+        self.stdout.write(f"Catalogue version is now {version} (search cache invalidated).")
+        self.stdout.write(f"Embedding snapshot {export_snapshot().name} is live.")
+
+    def _shadow(self, source, options):
+        model_tag = model_version(source)
+        self.stdout.write(f"Shadow re-embed with {source} ({model_tag}); the live vectors keep serving.")
+        start = time.perf_counter()
+        count = shadow_reembed(
+            source, batch_size=options['batch_size'], force=options['force'],
+            progress=lambda done: self.stdout.write(f"Encoded {done} jobs ({time.perf_counter() - start:.0f} s)..."),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Encoded {count} jobs into the shadow column. Switch with: "
+            f"manage.py cutover_embeddings --model {source}"
+        ))
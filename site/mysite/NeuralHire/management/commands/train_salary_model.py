@@ -0,0 +1,46 @@
+# management/commands/train_salary_model.py
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from NeuralHire.salaries import known_salary_rows, train_salary_model
+from utils.salary import RIDGE_ALPHA, SALARY_MODEL_PATH, salary_errors
+
+
+class Command(BaseCommand):
+    help = ('Train the salary model (ridge regression on embeddings and text features) on jobs with a known '
+            'salary, report its held-out error and save it; fill predictions with predict_salaries')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alpha', type=float, default=RIDGE_ALPHA, help='Ridge penalty')
+        parser.add_argument('--holdout', type=float, default=0.2, help='Share of jobs held out for the report')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', type=str, default=SALARY_MODEL_PATH)
+
+    def handle(self, *args, **options):
+        jobs = known_salary_rows()
+        if len(jobs) < 10:
+            raise CommandError(f"Only {len(jobs)} jobs have a salary; import jobs first.")
+        self.stdout.write(f"{len(jobs)} jobs with a known salary.")
+
+        order = np.random.default_rng(options['seed']).permutation(len(jobs))
+        held_out = int(len(jobs) * options['holdout'])
+        if held_out:
+            train = [jobs[i] for i in order[held_out:]]
+            test = [jobs[i] for i in order[:held_out]]
+            model = train_salary_model(train, options['alpha'])
+            actual = [job['money'] for job in test]
+            errors = salary_errors(actual, model.predict(test))
+            baseline = salary_errors(actual, np.full(len(test), np.median([job['money'] for job in train])))
+            self.stdout.write(
+                f"Held out {errors['jobs']} jobs: MAPE {errors['mape']:.1f}%, median APE {errors['median_ape']:.1f}%, "
+                f"MAE {errors['mae']:.1f} (median-salary baseline: MAPE {baseline['mape']:.1f}%, "
+                f"MAE {baseline['mae']:.1f})"
+            )
+
+        # The saved model is refitted on every known salary
+        model = train_salary_model(jobs, options['alpha'])
+        if held_out:
+            model.meta['holdout'] = errors
+        model.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Salary model saved to {options['output']}. Fill the catalogue with: manage.py predict_salaries --force"
+        ))
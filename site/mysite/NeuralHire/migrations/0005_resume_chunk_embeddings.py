@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NeuralHire', '0004_alter_job_content_embedding_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resume',
+            name='chunk_embeddings',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
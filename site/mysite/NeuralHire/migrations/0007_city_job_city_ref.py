@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NeuralHire', '0006_catalogue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('region', models.CharField(blank=True, max_length=255)),
+                ('variants', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'ordering': ['name'],
+                'constraints': [models.UniqueConstraint(fields=('name', 'region'), name='unique_city_name_region')],
+            },
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='city_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='NeuralHire.city'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:00
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NeuralHire', '0007_city_job_city_ref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogue',
+            name='embedding_model',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='catalogue',
+            name='embedding_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='embedding_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='shadow_embedding',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, null=True, size=768),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='shadow_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NeuralHire', '0008_embedding_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='predicted_money',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:12
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NeuralHire', '0009_job_predicted_money'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.TextField(blank=True)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('embedding', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, null=True, size=768)),
+                ('embedding_version', models.CharField(blank=True, max_length=64)),
+                ('min_score', models.FloatField(default=0.5)),
+                ('last_job_id', models.BigIntegerField(default=0)),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resume', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to='NeuralHire.resume')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SavedSearchMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vacancy', models.CharField(max_length=64)),
+                ('score', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='NeuralHire.job')),
+                ('saved_search', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='NeuralHire.savedsearch')),
+            ],
+            options={
+                'ordering': ['-created_at', '-score'],
+                'constraints': [models.UniqueConstraint(fields=('saved_search', 'vacancy'), name='unique_saved_search_vacancy')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NeuralHire', '0010_savedsearch_savedsearchmatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resume',
+            name='owner',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='savedsearch',
+            name='owner',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NeuralHire', '0011_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resume',
+            name='embedding_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
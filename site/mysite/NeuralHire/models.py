@@ -11,11 +11,20 @@ class Job(models.Model):
         null=True,
         blank=True,
     )
+    # Version tag of the model that produced content_embedding (utils.embeddings.model_version)
+    embedding_version = models.CharField(max_length=64, blank=True)
+    # Blue/green rollout: vectors of the next (or, after a cutover, the previous) model
+    shadow_embedding = ArrayField(models.FloatField(), size=768, null=True, blank=True)
+    shadow_version = models.CharField(max_length=64, blank=True)
 
     knoladge = models.TextField(blank=True)
     money = models.IntegerField(null=True, blank=True)
+    # Salary estimated by the salary model (utils/salary.py), same units as money
+    predicted_money = models.IntegerField(null=True, blank=True)
     addition = models.TextField(blank=True)
     city = models.CharField(max_length=255, blank=True)
+    # Canonical city resolved from the scraped string at import (utils/cities.py)
+    city_ref = models.ForeignKey('City', null=True, blank=True, on_delete=models.SET_NULL, related_name='jobs')
     link = models.TextField(blank=True)
     company = models.CharField(max_length=255, blank=True, default='Unknown')
 
@@ -47,12 +56,87 @@ class Resume(models.Model):
         null=True,
         blank=True,
     )
+    # One vector per resume chunk (summary first), scored as max/mean against jobs
+    chunk_embeddings = models.JSONField(null=True, blank=True)
+    # Model version of the vectors; a saved resume search re-embeds them after a cutover
+    embedding_version = models.CharField(max_length=64, blank=True)
     
     # Store crop image paths: {job_id: {keyword: crop_path}}
     crop_data = models.JSONField(null=True, blank=True)
+    # Owner token of the uploading browser session; only it can save a search for the resume
+    owner = models.CharField(max_length=64, blank=True, db_index=True)
     
     def __str__(self):
         return f"Resume uploaded at {self.uploaded_at}"
     
     class Meta:
-        ordering = ['-uploaded_at']
\ No newline at end of file
+        ordering = ['-uploaded_at']
+
+
+class Catalogue(models.Model):
+    """Single row holding the job catalogue version, bumped after imports and re-embeds."""
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Model serving the live job vectors; queries are embedded with the same one
+    embedding_model = models.CharField(max_length=255, blank=True)
+    embedding_version = models.CharField(max_length=64, blank=True)
+
+    def __str__(self):
+        return f"Catalogue v{self.version}"
+
+
+class SavedSearch(models.Model):
+    """
+    A stored query (or resume) with its filters. New jobs are matched against it after
+    every import (NeuralHire/alerts.py); jobs up to last_job_id have been checked.
+    """
+    query = models.TextField(blank=True)
+    resume = models.ForeignKey(Resume, null=True, blank=True, on_delete=models.CASCADE, related_name='saved_searches')
+    # SearchFilters.as_dict()
+    filters = models.JSONField(default=dict, blank=True)
+    embedding = ArrayField(models.FloatField(), size=768, null=True, blank=True)
+    # Model version of embedding; re-embedded when the live job vectors change model
+    embedding_version = models.CharField(max_length=64, blank=True)
+    min_score = models.FloatField(default=0.5)
+    last_job_id = models.BigIntegerField(default=0)
+    active = models.BooleanField(default=True)
+    # Owner token of the browser session that saved it; only that session sees its matches
+    owner = models.CharField(max_length=64, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.query[:50] if self.query else f"Resume #{self.resume_id}"
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class SavedSearchMatch(models.Model):
+    """A new job that matched a saved search; the vacancy key stops relisted jobs from alerting twice."""
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    job = models.ForeignKey(Job, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    vacancy = models.CharField(max_length=64)  # utils.dedup.vacancy_id of the link, else "job:<id>"
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at', '-score']
+        constraints = [
+            models.UniqueConstraint(fields=['saved_search', 'vacancy'], name='unique_saved_search_vacancy'),
+        ]
+
+
+class City(models.Model):
+    """Canonical city with its region and the inflected forms used for matching."""
+    name = models.CharField(max_length=255)
+    region = models.CharField(max_length=255, blank=True)
+    variants = models.JSONField(default=list, blank=True)  # Normalised case forms, see utils.cities
+
+    def __str__(self):
+        return f"{self.name} ({self.region})" if self.region else self.name
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'region'], name='unique_city_name_region'),
+        ]
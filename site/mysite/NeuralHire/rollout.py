@@ -0,0 +1,123 @@
+# rollout.py
+import asyncio
+from django.db import transaction
+from django.db.models import F
+from NeuralHire.models import Catalogue, Job
+from NeuralHire.search_cache import aget_catalogue, get_catalogue
+from utils.embeddings import (
+    EMBEDDING_DIM, active_model_source, create_job_text, default_model_source, load_model, loaded_model_version,
+    model_version, use_model
+)
+from utils.instrumentation import increment
+
+SHADOW_BATCH = 256  # Jobs encoded and written per round of a shadow re-embed
+
+_reloaded_for = None  # (source, version) this process last reloaded an in-place retrained model for
+
+
+def live_model_source(catalogue=None):
+    """The model that produced the live job vectors (the default model until one is recorded)."""
+    catalogue = catalogue or get_catalogue()
+    return catalogue.embedding_model or default_model_source()
+
+
+def searchable_jobs(embedding_version=''):
+    """
+    Jobs whose vectors are comparable with queries embedded by the model of this
+    version. Rows embedded by another model are left out; '' (versions not tracked
+    yet) keeps every job with an embedding.
+    """
+    jobs = Job.objects.filter(content_embedding__isnull=False)
+    return jobs.filter(embedding_version=embedding_version) if embedding_version else jobs
+
+
+def set_live_model(source):
+    """Record `source` as the model of the live job vectors, after a full import or re-embed."""
+    get_catalogue()
+    Catalogue.objects.filter(pk=1).update(embedding_model=source, embedding_version=model_version(source))
+
+
+async def aensure_query_model(catalogue=None):
+    """
+    Make this process embed queries with the catalogue's live model (loading it after a
+    cutover). Returns the version of the live job vectors, '' when it is not tracked.
+    """
+    global _reloaded_for
+    catalogue = catalogue or await aget_catalogue()
+    source, version = catalogue.embedding_model, catalogue.embedding_version
+    if not source:
+        return version
+    if active_model_source() != source:
+        increment('embedding_model_switch')
+        await asyncio.to_thread(use_model, source)
+    elif version and loaded_model_version() not in (None, version) and _reloaded_for != (source, version):
+        # Same directory, new vectors: the model was retrained in place, so the loaded
+        # weights and the cached tag are stale. Reloaded once per live version, so a
+        # directory that still doesn't match doesn't reload on every request.
+        _reloaded_for = (source, version)
+        increment('embedding_model_reload')
+        await asyncio.to_thread(use_model, source, True)
+    return version
+
+
+def shadow_reembed(source, batch_size=SHADOW_BATCH, force=False, progress=None):
+    """
+    Encode every job with the model at `source` into shadow_embedding while the live
+    vectors keep serving. Resumable: jobs that already carry this model's shadow
+    vector are skipped unless force is set. Returns the number of jobs encoded.
+    """
+    model = load_model(source)
+    tag = model_version(source)
+    jobs = Job.objects.select_related('city_ref').order_by('id')
+    if not force:
+        jobs = jobs.exclude(shadow_version=tag)
+
+    done = 0
+    last_id = 0
+    while True:
+        batch = list(jobs.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return done
+        last_id = batch[-1].id
+
+        texts = [create_job_text(job.title, job.knoladge, job.city_ref.name if job.city_ref else job.city,
+                                 job.company, job.addition) for job in batch]
+        encode = [i for i, text in enumerate(texts) if text]
+        vectors = model.encode([texts[i] for i in encode], batch_size=batch_size, normalize_embeddings=True)
+        for job in batch:
+            job.shadow_embedding, job.shadow_version = None, ''
+        for i, vector in zip(encode, vectors):
+            if len(vector) == EMBEDDING_DIM:
+                batch[i].shadow_embedding, batch[i].shadow_version = vector.tolist(), tag
+        Job.objects.bulk_update(batch, ['shadow_embedding', 'shadow_version'])
+
+        done += len(encode)
+        if progress:
+            progress(done)
+
+
+def cutover(source, allow_partial=False):
+    """
+    Make the shadow vectors of the model at `source` live in one transaction: live and
+    shadow columns swap, so the previous vectors stay in the shadow column and cutting
+    over back to the previous model is a rollback. The catalogue version is bumped.
+    Returns (jobs switched, jobs left without a vector of the new model).
+    """
+    tag = model_version(source)
+    get_catalogue()
+    with transaction.atomic():
+        Catalogue.objects.select_for_update().get(pk=1)
+        switched = Job.objects.filter(shadow_version=tag)
+        missing = Job.objects.exclude(shadow_version=tag).count()
+        if missing and not allow_partial:
+            raise ValueError(f"{missing} jobs have no shadow vector of {tag}; run reembed_jobs --shadow first.")
+
+        # Postgres evaluates every SET expression on the old row, so this swaps the columns
+        count = switched.update(
+            content_embedding=F('shadow_embedding'), shadow_embedding=F('content_embedding'),
+            embedding_version=F('shadow_version'), shadow_version=F('embedding_version'),
+        )
+        Catalogue.objects.filter(pk=1).update(
+            embedding_model=source, embedding_version=tag, version=F('version') + 1
+        )
+    return count, missing
@@ -0,0 +1,57 @@
+# salaries.py
+from NeuralHire.models import Job
+from NeuralHire.search_cache import get_catalogue
+from utils.embeddings import EMBEDDING_DIM
+from utils.salary import SalaryModel, get_salary_model
+
+SALARY_FIELDS = ('id', 'title', 'knoladge', 'addition', 'city', 'city_ref', 'content_embedding', 'money')
+PREDICT_BATCH = 2000  # Jobs read, predicted and written per round
+
+
+def known_salary_rows():
+    """Row dicts of the jobs with a real salary (money > 0), the training set."""
+    return list(Job.objects.filter(money__gt=0).order_by('id').values(*SALARY_FIELDS))
+
+
+def train_salary_model(jobs, alpha):
+    """Fit a SalaryModel on rows with a known salary, tagged with the live embedding version."""
+    model = SalaryModel(EMBEDDING_DIM, meta={'embedding_version': get_catalogue().embedding_version})
+    return model.fit(jobs, [job['money'] for job in jobs], alpha=alpha)
+
+
+def usable_salary_model(model=None):
+    """
+    The salary model if it was trained on the live job vectors, else None: the
+    embedding features of another model's vectors would be meaningless to it.
+    """
+    model = model or get_salary_model()
+    if model is None or model.meta.get('embedding_version', '') != get_catalogue().embedding_version:
+        return None
+    return model
+
+
+def fill_predicted_salaries(model, batch_size=PREDICT_BATCH, force=False, progress=None):
+    """
+    Write Job.predicted_money for every job (only those without one unless force is
+    set), walking the table in id order in batches. Returns the number of jobs written.
+    """
+    jobs = Job.objects.order_by('id')
+    if not force:
+        jobs = jobs.filter(predicted_money__isnull=True)
+
+    done = 0
+    last_id = 0
+    while True:
+        batch = list(jobs.filter(id__gt=last_id).values(*SALARY_FIELDS)[:batch_size])
+        if not batch:
+            return done
+        last_id = batch[-1]['id']
+
+        predictions = model.predict(batch)
+        Job.objects.bulk_update(
+            [Job(id=job['id'], predicted_money=int(value)) for job, value in zip(batch, predictions)],
+            ['predicted_money'],
+        )
+        done += len(batch)
+        if progress:
+            progress(done)
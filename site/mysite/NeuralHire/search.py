@@ -0,0 +1,719 @@
+# search.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from NeuralHire.rollout import searchable_jobs
+from NeuralHire.search_cache import aget_catalogue
+from NeuralHire.snapshot import aget_snapshot
+from utils.embeddings import (
+    score_chunks, combine_chunk_scores, rerank_results, compute_keyword_boost, create_job_text,
+    create_job_summary, allm_validate_results
+)
+from utils.compression import CompressedEmbeddings, EmbeddingCodec
+from utils.ranking import (
+    top_k_indices, additions_mask, salary_mask, boost_pool, approximate_scores, mmr_order, sharded_top_k,
+    effective_salary, scores_below
+)
+from utils.lexical import BM25Index, job_tokens, reciprocal_rank_fusion, weighted_fusion
+from utils.instrumentation import span, increment
+
+# Text search configuration
+CANDIDATES_FOR_RERANK = 100
+CANDIDATES_FOR_CROSS_ENCODER = 30
+FINAL_RESULTS = 20
+KEYWORD_BOOST_WEIGHT = 0.5
+KEYWORD_BOOST_POOL = 5000  # Upper bound on jobs that get the Python-side keyword boost
+RETRIEVAL = 'exact'  # 'approx' shortlists on an embedding prefix (utils.ranking.approximate_scores)
+USE_LLM_VALIDATION = False
+
+# Compressed in-process scoring (utils.compression spec such as 'pca256-int8' or
+# 'truncate384'; None scores the full matrix). The compressed scores shortlist
+# budget * COMPRESSED_OVERSAMPLE jobs, which are rescored on the exact embeddings.
+# export_snapshot writes the codes of this spec into the snapshot, so workers map them
+# instead of encoding the catalogue themselves.
+EMBEDDING_COMPRESSION = None
+COMPRESSED_OVERSAMPLE = 10
+
+# Parallel scoring: catalogues of at least PARALLEL_SCORING_MIN_JOBS jobs are scored in
+# SCORING_SHARDS contiguous shards on a thread pool, each keeping its own top k. Run the
+# workers with OPENBLAS_NUM_THREADS=1 (or similar) so BLAS threads don't oversubscribe the cores.
+SCORING_SHARDS = min(8, os.cpu_count() or 1)
+PARALLEL_SCORING_MIN_JOBS = 200_000
+
+# Hybrid retrieval: the BM25 top list is fused with the dense top list into the
+# cross-encoder pool. 'keyword_boost' keeps the older per-job overlap boost instead.
+FUSION = 'rrf'  # 'rrf' | 'weighted' | 'keyword_boost'
+LEXICAL_CANDIDATES = 100
+LEXICAL_WEIGHT = 0.3  # Share of the BM25 score in 'weighted' fusion
+
+# Result diversification: 1.0 is pure relevance, lower values trade relevance for
+# variety among the final results (None disables the stage)
+MMR_LAMBDA = 0.7
+
+# Resume search: a smaller pool so the cross-encoder stays cheap next to OCR and Qwen-VL
+RESUME_CANDIDATES_FOR_CROSS_ENCODER = 40
+
+# Latency budget (seconds) for the ranking pipeline of one request. Stages shrink
+# or skip work as it runs out instead of holding the request.
+SEARCH_LATENCY_BUDGET = 3.0
+MIN_CROSS_ENCODER_CANDIDATES = 5  # Below this the cross-encoder is skipped
+CROSS_ENCODER_SECONDS_PER_PAIR = 0.01  # Initial estimate, refined from observed runs
+
+JOB_FIELDS = ('id', 'content_embedding', 'addition', 'title', 'knoladge', 'city', 'company', 'money',
+              'predicted_money', 'city_ref')
+# With a memory-mapped snapshot the embeddings come from the snapshot, not the database
+SNAPSHOT_JOB_FIELDS = tuple(field for field in JOB_FIELDS if field != 'content_embedding')
+
+# (catalogue version, rows) of the last snapshot-backed fetch, so later searches of that
+# version skip the fetch. Only one version is held (a new one replaces it), but every
+# worker holds its own copy: a row is ~3 KB (mostly the knoladge text), so catalogues
+# above SNAPSHOT_ROWS_MAX_JOBS (~150 MB per worker) are fetched per search instead.
+SNAPSHOT_ROWS_MAX_JOBS = 50_000
+_snapshot_rows = None
+
+
+class Deadline:
+    """Wall-clock deadline shared by the stages of one request."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() == 0.0
+
+
+class CatalogueCache:
+    """
+    Structures derived from the catalogue rows (lexical index, filter columns), kept
+    until the catalogue changes: a new catalogue version or a different list of job ids.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.ids = None
+        self.items = {}
+
+    def get(self, state, name, build):
+        """Return the structure `name`, calling build(jobs_data) if this catalogue lacks it."""
+        if not state.catalogue_checked:
+            ids = np.fromiter((job['id'] for job in state.jobs_data), dtype=np.int64,
+                              count=len(state.jobs_data))
+            if self.ids is None or self.version != state.catalogue_version or not np.array_equal(ids, self.ids):
+                self.version, self.ids, self.items = state.catalogue_version, ids, {}
+            state.catalogue_checked = True
+        if name not in self.items:
+            with span('catalogue_build', structure=name, jobs=len(state.jobs_data)):
+                self.items[name] = build(state.jobs_data)
+        return self.items[name]
+
+
+catalogue_cache = CatalogueCache()
+
+_scoring_pool = None
+_scoring_pool_lock = threading.Lock()
+
+
+def scoring_pool():
+    """Thread pool shared by the sharded scoring of all requests in this process."""
+    global _scoring_pool
+    with _scoring_pool_lock:
+        if _scoring_pool is None:
+            _scoring_pool = ThreadPoolExecutor(max_workers=SCORING_SHARDS, thread_name_prefix='scoring')
+    return _scoring_pool
+
+
+def _embedding_matrix(state):
+    if state.job_matrix is not None:
+        return state.job_matrix
+    return np.array([job['content_embedding'] for job in state.jobs_data], dtype=np.float32)
+
+
+def _money_column(jobs_data):
+    return np.array([-1 if job['money'] is None else job['money'] for job in jobs_data], dtype=np.int64)
+
+
+def _salary_column(jobs_data):
+    """Listed salary, else the estimated one (Job.predicted_money), else -1."""
+    predicted = [-1 if job.get('predicted_money') is None else job['predicted_money'] for job in jobs_data]
+    return effective_salary(_money_column(jobs_data), np.array(predicted, dtype=np.int64))
+
+
+def _city_column(jobs_data):
+    """City id of every job (Job.city_ref), -1 where the city was not resolved."""
+    return np.fromiter((-1 if job.get('city_ref') is None else job['city_ref'] for job in jobs_data),
+                       dtype=np.int64, count=len(jobs_data))
+
+
+def _compressed_embeddings(state, spec):
+    return lambda jobs_data: CompressedEmbeddings.build(_embedding_matrix(state), spec)
+
+
+def _lexical_index(jobs_data):
+    return BM25Index([job_tokens(job['title'], job['knoladge'], job.get('addition', '')) for job in jobs_data])
+
+
+class SearchFilters:
+    """
+    Structured filters on salary and city. They become one boolean mask over the
+    catalogue that retrieval applies before selecting candidates, so a filtered search
+    scores and ranks exactly like an unfiltered one. sort_by_salary reorders the top
+    (final) results by salary; which jobs make the top stays decided by relevance, so it
+    never surfaces well-paid but unrelated jobs from the rest of the filtered catalogue.
+    """
+
+    def __init__(self, min_salary=None, max_salary=None, include_negotiable=True, city_ids=None,
+                 estimated=True, sort_by_salary=False):
+        """
+        city_ids: City ids to keep; None means any city (an empty set matches nothing).
+        estimated: jobs without a listed salary are filtered and sorted by their predicted one.
+        """
+        self.min_salary = min_salary
+        self.max_salary = max_salary
+        self.include_negotiable = include_negotiable
+        self.city_ids = None if city_ids is None else frozenset(city_ids)
+        self.estimated = estimated
+        self.sort_by_salary = sort_by_salary
+
+    @property
+    def salary_bounded(self):
+        return self.min_salary is not None or self.max_salary is not None
+
+    def __bool__(self):
+        return self.salary_bounded or self.city_ids is not None
+
+    def mask(self, state):
+        """Mask over state.jobs_data, built from per-catalogue columns (see CatalogueCache)."""
+        return self._mask(state.column, len(state.jobs_data))
+
+    def rows_mask(self, jobs_data, columns=None):
+        """
+        Mask over rows that are not the search catalogue (e.g. newly imported jobs).
+        columns: dict the built columns are kept in, to share them between filters.
+        """
+        columns = {} if columns is None else columns
+
+        def column(name, build):
+            if name not in columns:
+                columns[name] = build(jobs_data)
+            return columns[name]
+        return self._mask(column, len(jobs_data))
+
+    def _mask(self, column, size):
+        """column(name, build) returns a per-job column, see SearchState.column."""
+        mask = np.ones(size, dtype=bool)
+        if self.salary_bounded:
+            mask &= salary_mask(self._salaries(column), self.min_salary, self.max_salary, self.include_negotiable)
+        if self.city_ids is not None:
+            cities = column('city_ref', _city_column)
+            mask &= np.isin(cities, list(self.city_ids))
+        return mask
+
+    def salaries(self, state):
+        """Salary column the filter and the sort use, aligned with state.jobs_data."""
+        return self._salaries(state.column)
+
+    def _salaries(self, column):
+        if self.estimated:
+            return column('salary', _salary_column)
+        return column('money', _money_column)
+
+    def as_dict(self):
+        """The filters as constructor arguments (JSON-friendly; SavedSearch stores them)."""
+        return {'min_salary': self.min_salary, 'max_salary': self.max_salary,
+                'include_negotiable': self.include_negotiable, 'estimated': self.estimated,
+                'city_ids': None if self.city_ids is None else sorted(self.city_ids)}
+
+    def top_positions(self, state, count):
+        """
+        Positions (into state.indices) of the first `count` candidates in display order:
+        by salary, highest first (unknown salaries last), when sorting by salary.
+        """
+        positions = np.arange(min(count, len(state.indices)))
+        if self.sort_by_salary and len(positions):
+            salaries = np.asarray(self.salaries(state))[state.indices[positions]]
+            positions = positions[np.argsort(-salaries, kind='stable')]
+        return positions
+
+    def order(self, state):
+        """Reorder the current candidates by salary when sorting by salary."""
+        if self.sort_by_salary:
+            state.keep(self.top_positions(state, len(state.indices)))
+
+    def cache_key(self):
+        """JSON-friendly description, part of the search cache key."""
+        if not self and not self.sort_by_salary:
+            return None
+        city_ids = None if self.city_ids is None else sorted(self.city_ids)
+        return [self.min_salary, self.max_salary, self.include_negotiable, city_ids,
+                self.estimated, self.sort_by_salary]
+
+
+class SearchState:
+    """
+    Everything a search carries between stages.
+    `indices` point into `jobs_data` (best first) and `scores` are aligned with them;
+    each stage narrows both to its budget.
+    """
+
+    def __init__(self, query_text, query_vectors, selected_additions=(), jobs_data=None, deadline=None,
+                 filters=None, query_version=None, catalogue=None):
+        self.query_text = query_text
+        self.catalogue = catalogue  # Catalogue row read by the view, saves reading it again
+        self.query_version = query_version  # Model version of query_vectors, checked against the catalogue
+        self.deadline = deadline
+        self.filters = SearchFilters() if filters is None else filters
+        # float32 like the job matrix: a float64 query (embed_query returns a list) would
+        # make every product upcast the whole matrix
+        self.query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        self.selected_additions = list(selected_additions)
+        self.jobs_data = jobs_data
+        self.catalogue_version = None  # Known when the catalogue came from the database
+        self.snapshot = None  # Memory-mapped snapshot the job matrix and columns come from
+        self.catalogue_checked = False  # catalogue_cache validated against jobs_data
+        self.indices = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0)
+        self.dense_scores = None  # Embedding score of every job
+        self.mask = None  # Jobs allowed by the filters (None = all)
+        self.job_matrix = None  # Embedding of every job, rows aligned with jobs_data (uncompressed scoring)
+        self.error = None
+        self._job_texts = {}
+
+    def job_text(self, index):
+        """Embedding-style text of a job, built once per search."""
+        if index not in self._job_texts:
+            job_item = self.jobs_data[index]
+            self._job_texts[index] = create_job_text(
+                job_item['title'], job_item['knoladge'],
+                job_item.get('city', ''), job_item.get('company', ''),
+                job_item.get('addition', '')
+            )
+        return self._job_texts[index]
+
+    def column(self, name, build):
+        """Per-job column ('money', 'salary', 'city_ref'): from the snapshot, else built once per catalogue."""
+        if self.snapshot is not None:
+            return getattr(self.snapshot, name)
+        return catalogue_cache.get(self, name, build)
+
+    def compressed_embeddings(self, spec):
+        """Compressed codes of the catalogue: the snapshot's (built at export), else built once per catalogue."""
+        if self.snapshot is not None:
+            compressed = self.snapshot.compressed.get(EmbeddingCodec.from_spec(spec).spec)
+            if compressed is not None:
+                return compressed
+        return catalogue_cache.get(self, 'embeddings:' + spec, _compressed_embeddings(self, spec))
+
+    def lexical_index(self):
+        """BM25 index of the catalogue: the snapshot's (built at export), else built once per catalogue."""
+        if self.snapshot is not None and self.snapshot.lexical is not None:
+            return self.snapshot.lexical
+        return catalogue_cache.get(self, 'lexical', _lexical_index)
+
+    def job_vectors(self, indices):
+        """Exact embeddings of some jobs."""
+        if self.job_matrix is not None:
+            return self.job_matrix[indices]
+        return np.array([self.jobs_data[i]['content_embedding'] for i in indices], dtype=np.float32)
+
+    def keep(self, positions, scores=None):
+        """Reorder/narrow the current candidates to `positions` (indexes into self.indices)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        self.scores = self.scores[positions] if scores is None else np.asarray(scores, dtype=float)
+        self.indices = self.indices[positions]
+
+    @property
+    def ids(self):
+        return [self.jobs_data[i]['id'] for i in self.indices]
+
+
+class Stage:
+    """A pipeline step with a candidate budget: it leaves at most `budget` candidates."""
+    name = 'stage'
+
+    def __init__(self, budget):
+        self.budget = budget
+
+    async def run(self, state):
+        raise NotImplementedError
+
+    def span_fields(self, state):
+        return {'candidates': len(state.indices), 'budget': self.budget}
+
+
+class VectorRetrieval(Stage):
+    """
+    Loads the catalogue (unless the state already has it) and scores it against the
+    query vector(s). With boost_margin > 0 it keeps every job that a later additive
+    boost of up to boost_margin could still lift into the budget. With a compression
+    spec the catalogue is scored on its cached compressed codes instead of a matrix
+    built per request. Large catalogues are scored in parallel shards.
+    """
+    name = 'vector_retrieval'
+
+    def __init__(self, budget, retrieval=RETRIEVAL, boost_margin=0.0, pool_limit=KEYWORD_BOOST_POOL,
+                 compression=EMBEDDING_COMPRESSION, shards=SCORING_SHARDS):
+        super().__init__(budget)
+        self.retrieval = retrieval
+        self.compression = compression
+        self.shards = shards
+        self.boost_margin = boost_margin
+        self.pool_limit = pool_limit
+
+    async def run(self, state):
+        if state.jobs_data is None:
+            with span('db_fetch'):
+                await self._fetch(state)
+            if state.error:
+                return
+
+        if not state.jobs_data:
+            state.error = 'Нет вакансий с эмбеддингами'
+            return
+
+        state.indices, state.scores = await asyncio.to_thread(self._score, state)
+
+        if not len(state.indices):
+            state.error = 'Не найдено подходящих вакансий'
+
+    async def _fetch(self, state):
+        """
+        Load the catalogue rows whose vectors match the live model. When a snapshot of this catalogue version is mapped, the
+        rows are fetched without their embeddings (once per catalogue version) and the job
+        matrix is the snapshot's.
+        """
+        global _snapshot_rows
+        catalogue = state.catalogue or await aget_catalogue()
+        state.catalogue_version = catalogue.version
+        if catalogue.embedding_version and state.query_version and state.query_version != catalogue.embedding_version:
+            # The query was embedded by another model than the job vectors (mid-cutover)
+            increment('embedding_version_mismatch')
+            state.error = 'Модель поиска обновляется, повторите запрос'
+            return
+        snapshot = await aget_snapshot(state.catalogue_version)
+        jobs = searchable_jobs(catalogue.embedding_version).order_by('id')
+        if snapshot is not None:
+            if _snapshot_rows is not None and _snapshot_rows[0] == catalogue.version:
+                state.jobs_data = _snapshot_rows[1]
+            else:
+                state.jobs_data = [job async for job in jobs.values(*SNAPSHOT_JOB_FIELDS)]
+            if snapshot.matches(state.jobs_data):
+                # An older version's rows are dropped either way
+                keep = len(state.jobs_data) <= SNAPSHOT_ROWS_MAX_JOBS
+                _snapshot_rows = (catalogue.version, state.jobs_data) if keep else None
+                state.snapshot = snapshot
+                state.job_matrix = snapshot.embeddings
+                return
+            increment('snapshot_mismatch')
+        state.jobs_data = [job async for job in jobs.values(*JOB_FIELDS)]
+
+    def _score(self, state):
+        mask = None
+        if state.selected_additions:
+            mask = additions_mask([j['addition'] for j in state.jobs_data], state.selected_additions)
+        if state.filters:
+            filter_mask = state.filters.mask(state)
+            mask = filter_mask if mask is None else mask & filter_mask
+        state.mask = mask
+
+        if self.compression:
+            embedding_scores = self._compressed_scores(state, mask)
+            state.dense_scores = embedding_scores
+            return self._select(embedding_scores, mask)
+
+        state.job_matrix = job_matrix = _embedding_matrix(state)
+        if self.retrieval == 'approx' and len(state.query_vectors) == 1:
+            embedding_scores = approximate_scores(job_matrix, state.query_vectors[0], self.budget, mask=mask)
+            state.dense_scores = embedding_scores
+            return self._select(embedding_scores, mask)
+
+        if len(state.query_vectors) > 1:
+            def score_rows(start, end):
+                return score_chunks(job_matrix[start:end], state.query_vectors)
+        else:
+            def score_rows(start, end):
+                return np.dot(job_matrix[start:end], state.query_vectors[0])
+        indices, embedding_scores = self._top_k(score_rows, len(job_matrix), self.budget, mask)
+        state.dense_scores = embedding_scores
+        if self.boost_margin > 0:
+            return self._select(embedding_scores, mask)
+        return indices, embedding_scores[indices]
+
+    def _top_k(self, score_rows, n, k, mask):
+        """Top k rows and the scores of all n rows, sharded across the scoring pool for large catalogues."""
+        if self.shards > 1 and n >= PARALLEL_SCORING_MIN_JOBS:
+            return sharded_top_k(score_rows, n, k, scoring_pool(), self.shards, mask=mask)
+        scores = score_rows(0, n)
+        return top_k_indices(scores, k, mask=mask), scores
+
+    def _select(self, embedding_scores, mask):
+        if self.boost_margin > 0:
+            indices = boost_pool(embedding_scores, self.budget, self.boost_margin, self.pool_limit, mask=mask)
+        else:
+            indices = top_k_indices(embedding_scores, self.budget, mask=mask)
+        return indices, embedding_scores[indices]
+
+    def _compressed_scores(self, state, mask):
+        """Shortlist on the compressed codes, exact scores for the shortlist, -inf elsewhere."""
+        compressed = state.compressed_embeddings(self.compression)
+        if len(state.query_vectors) > 1:
+            def score_rows(start, end):
+                return combine_chunk_scores(compressed.scores(state.query_vectors, start, end))
+        else:
+            def score_rows(start, end):
+                return compressed.scores(state.query_vectors[0], start, end)
+        shortlist, _ = self._top_k(score_rows, len(compressed), self.budget * COMPRESSED_OVERSAMPLE, mask)
+
+        rows = state.job_vectors(shortlist)
+        scores = np.full(len(state.jobs_data), -np.inf)
+        if len(shortlist):
+            scores[shortlist] = (score_chunks(rows, state.query_vectors) if len(state.query_vectors) > 1
+                                 else np.dot(rows, state.query_vectors[0]))
+        return scores
+
+
+class KeywordBoost(Stage):
+    """Adds weight * keyword overlap to the embedding score and keeps the top `budget`."""
+    name = 'keyword_boost'
+
+    def __init__(self, budget, weight=KEYWORD_BOOST_WEIGHT):
+        super().__init__(budget)
+        self.weight = weight
+
+    async def run(self, state):
+        if state.deadline.expired:
+            # Keep the embedding order, cut to budget
+            increment('keyword_boost_skipped')
+            state.keep(np.arange(min(self.budget, len(state.indices))))
+            return
+        await asyncio.to_thread(self._boost, state)
+
+    def _boost(self, state):
+        keyword_boosts = np.array([
+            compute_keyword_boost(state.query_text, state.job_text(i)) for i in state.indices
+        ])
+        final_scores = state.scores + keyword_boosts * self.weight
+        top = top_k_indices(final_scores, self.budget)
+        state.keep(top, final_scores[top])
+
+
+class HybridFusion(Stage):
+    """
+    Queries the BM25 index alongside the dense top list and fuses both rankings
+    (reciprocal rank or weighted) into the top `budget` candidates. Exact skills
+    ("1С", "HACCP") that the embedding misses come in through the lexical list.
+    """
+    name = 'hybrid_fusion'
+
+    def __init__(self, budget, method=FUSION, lexical_candidates=LEXICAL_CANDIDATES, weight=LEXICAL_WEIGHT):
+        super().__init__(budget)
+        self.method = method
+        self.lexical_candidates = lexical_candidates
+        self.weight = weight
+
+    async def run(self, state):
+        if state.deadline.expired:
+            increment('hybrid_fusion_skipped')
+            state.keep(np.arange(min(self.budget, len(state.indices))))
+            return
+        await asyncio.to_thread(self._fuse, state)
+
+    def _fuse(self, state):
+        index = state.lexical_index()
+        lexical_scores = index.scores(state.query_text)
+        matched = lexical_scores > 0 if state.mask is None else (lexical_scores > 0) & state.mask
+        lexical_top = top_k_indices(lexical_scores, self.lexical_candidates, mask=matched)
+
+        if self.method == 'weighted':
+            candidates = np.union1d(state.indices, lexical_top)
+            indices, scores = weighted_fusion(candidates, state.dense_scores, lexical_scores, self.weight)
+        else:
+            indices, scores = reciprocal_rank_fusion([state.indices, lexical_top])
+
+        state.indices, state.scores = indices[:self.budget], scores[:self.budget]
+
+    def span_fields(self, state):
+        return {**super().span_fields(state), 'method': self.method}
+
+
+class CrossEncoderRerank(Stage):
+    """
+    Reorders the candidates with the cross-encoder and keeps the top `budget`.
+    Under deadline pressure only as many leading candidates as fit in the remaining
+    time are reranked (the rest keep their order below them, rescored under the lowest
+    cross-encoder score so MMR sees one scale), or the stage is skipped.
+    """
+    name = 'cross_encoder'
+
+    # Moving average of the observed cost per query/job pair, shared by all requests
+    seconds_per_pair = CROSS_ENCODER_SECONDS_PER_PAIR
+    warmed_up = False  # The first call of a process loads the model and is not observed
+
+    async def run(self, state):
+        if not len(state.indices):
+            return
+
+        count = int(min(len(state.indices), state.deadline.remaining() / self.seconds_per_pair))
+        if count < min(MIN_CROSS_ENCODER_CANDIDATES, len(state.indices)):
+            increment('rerank_skipped')
+            state.keep(np.arange(min(self.budget, len(state.indices))))
+            return
+        if count < len(state.indices):
+            increment('rerank_shrunk')
+
+        texts = [state.job_text(i) for i in state.indices[:count]]
+        start = time.perf_counter()
+        reranked = await asyncio.to_thread(rerank_results, state.query_text, texts, top_k=count)
+        self._observe(time.perf_counter() - start, count)
+
+        order = [idx for idx, _ in reranked] + list(range(count, len(state.indices)))
+        head = [float(score) for _, score in reranked]
+        scores = head + list(scores_below(head, len(state.indices) - count))
+        top = min(self.budget, len(order))
+        state.keep(order[:top], scores[:top])
+
+    @classmethod
+    def _observe(cls, seconds, pairs):
+        if not cls.warmed_up:
+            cls.warmed_up = True
+            return
+        cls.seconds_per_pair = 0.8 * cls.seconds_per_pair + 0.2 * (seconds / pairs)
+
+
+class LLMValidation(Stage):
+    """
+    Lets the local LLM (Ollama) reorder the candidates; keeps the top `budget`.
+    Abandoned with the current order when the deadline passes first.
+    """
+    name = 'llm_validation'
+
+    async def run(self, state):
+        if not len(state.indices):
+            return
+        job_summaries = [
+            create_job_summary(job['title'], job['knoladge'], job['city'], job['company'])
+            for job in (state.jobs_data[i] for i in state.indices)
+        ]
+        try:
+            llm_order = await asyncio.wait_for(
+                allm_validate_results(state.query_text, job_summaries, top_k=self.budget),
+                timeout=state.deadline.remaining(),
+            )
+        except asyncio.TimeoutError:
+            increment('llm_validation_abandoned')
+            state.keep(np.arange(min(self.budget, len(state.indices))))
+            return
+        state.keep([i for i in llm_order if i < len(state.indices)])
+
+
+class Diversify(Stage):
+    """
+    Maximal marginal relevance over the current candidates: picks `budget` of them,
+    trading relevance (the scores so far) against cosine similarity to the ones
+    already picked. Works on the candidates' embeddings only.
+    """
+    name = 'mmr'
+
+    def __init__(self, budget, lambda_=MMR_LAMBDA):
+        super().__init__(budget)
+        self.lambda_ = lambda_
+
+    async def run(self, state):
+        if len(state.indices) <= 1:
+            return
+        order = mmr_order(state.scores, state.job_vectors(state.indices), self.budget, self.lambda_)
+        state.keep(order)
+
+
+class SearchPipeline:
+    """
+    Ordered stages shared by the text and resume searches. Optimisations to a stage
+    (indexes, caching, batching) apply to every search built from it.
+    """
+
+    def __init__(self, stages, final_results=FINAL_RESULTS, latency_budget=SEARCH_LATENCY_BUDGET):
+        self.stages = list(stages)
+        self.final_results = final_results
+        self.latency_budget = latency_budget
+
+    async def iter_stages(self, state):
+        """Run the stages one by one, yielding each finished stage (for streaming)."""
+        if state.deadline is None:
+            state.deadline = Deadline(self.latency_budget)
+        for stage in self.stages:
+            with span(stage.name, **stage.span_fields(state)):
+                await stage.run(state)
+            if state.error:
+                return
+            yield stage
+
+    def finish(self, state):
+        """Cut the candidates down to the final result count (then sort them if asked to)."""
+        if not state.error:
+            state.keep(np.arange(min(self.final_results, len(state.indices))))
+            state.filters.order(state)
+        return state
+
+    async def run(self, state):
+        async for _ in self.iter_stages(state):
+            pass
+        return self.finish(state)
+
+
+def text_search_pipeline(candidates_for_rerank=CANDIDATES_FOR_RERANK,
+                         candidates_for_cross_encoder=CANDIDATES_FOR_CROSS_ENCODER,
+                         keyword_boost_weight=KEYWORD_BOOST_WEIGHT,
+                         use_llm_validation=USE_LLM_VALIDATION,
+                         retrieval=RETRIEVAL,
+                         compression=EMBEDDING_COMPRESSION,
+                         fusion=FUSION,
+                         lexical_candidates=LEXICAL_CANDIDATES,
+                         mmr_lambda=MMR_LAMBDA,
+                         final_results=FINAL_RESULTS,
+                         latency_budget=SEARCH_LATENCY_BUDGET):
+    """
+    Vector retrieval -> BM25 fusion (or keyword boost) -> cross-encoder -> MMR
+    -> optional LLM validation. keyword_boost_weight only applies to fusion='keyword_boost'.
+    """
+    if fusion == 'keyword_boost':
+        stages = [
+            VectorRetrieval(candidates_for_rerank, retrieval=retrieval, boost_margin=keyword_boost_weight,
+                            compression=compression),
+            KeywordBoost(candidates_for_rerank, weight=keyword_boost_weight),
+        ]
+    else:
+        stages = [
+            VectorRetrieval(candidates_for_rerank, retrieval=retrieval, compression=compression),
+            HybridFusion(candidates_for_rerank, method=fusion, lexical_candidates=lexical_candidates),
+        ]
+    stages.append(CrossEncoderRerank(candidates_for_cross_encoder))
+    if mmr_lambda is not None:
+        stages.append(Diversify(final_results, lambda_=mmr_lambda))
+    if use_llm_validation:
+        stages.append(LLMValidation(final_results))
+    return SearchPipeline(stages, final_results=final_results, latency_budget=latency_budget)
+
+
+def resume_search_pipeline(candidates_for_cross_encoder=RESUME_CANDIDATES_FOR_CROSS_ENCODER,
+                           compression=EMBEDDING_COMPRESSION,
+                           mmr_lambda=MMR_LAMBDA,
+                           final_results=FINAL_RESULTS,
+                           latency_budget=SEARCH_LATENCY_BUDGET):
+    """Multi-vector retrieval over resume chunks -> cross-encoder against the resume summary -> MMR."""
+    retrieval = VectorRetrieval(candidates_for_cross_encoder, compression=compression)
+    if mmr_lambda is None:
+        stages = [retrieval, CrossEncoderRerank(final_results)]
+    else:
+        stages = [
+            retrieval,
+            CrossEncoderRerank(candidates_for_cross_encoder),
+            Diversify(final_results, lambda_=mmr_lambda),
+        ]
+    return SearchPipeline(stages, final_results=final_results, latency_budget=latency_budget)
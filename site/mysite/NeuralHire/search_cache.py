@@ -0,0 +1,63 @@
+# search_cache.py
+import hashlib
+import json
+from django.core.cache import cache
+from django.db.models import F
+from NeuralHire.models import Catalogue
+from utils.embeddings import preprocess_text
+
+# Ranked ids are cheap to keep; explanations are the expensive part of a hit
+SEARCH_CACHE_TIMEOUT = 60 * 60 * 6
+
+
+def get_catalogue():
+    catalogue, _ = Catalogue.objects.get_or_create(pk=1)
+    return catalogue
+
+
+async def aget_catalogue():
+    catalogue, _ = await Catalogue.objects.aget_or_create(pk=1)
+    return catalogue
+
+
+def get_catalogue_version():
+    """Current catalogue version; every import or re-embed bumps it."""
+    return get_catalogue().version
+
+
+async def aget_catalogue_version():
+    return (await aget_catalogue()).version
+
+
+def bump_catalogue_version():
+    """Invalidate every cached search by moving to a new catalogue version."""
+    Catalogue.objects.get_or_create(pk=1)
+    Catalogue.objects.filter(pk=1).update(version=F('version') + 1)
+    return get_catalogue_version()
+
+
+def search_cache_key(user_query, selected_additions, version, filters=None):
+    """Key on the normalised query, the selected additions, the filters and the catalogue version."""
+    normalised = preprocess_text(user_query).lower()
+    raw = json.dumps([normalised, sorted(selected_additions), filters.cache_key() if filters is not None else None],
+                     ensure_ascii=False)
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return f"neuralhire:search:v{version}:{digest}"
+
+
+async def aget_cached_search(key):
+    """Return {'ids': [...], 'scores': [...], 'explanations': {id: text}} or None."""
+    return await cache.aget(key)
+
+
+async def aset_cached_search(key, jobs, scores):
+    """Store the ranked ids, scores and successful explanations of a finished search."""
+    explanations = {
+        str(job.id): job.explanation for job in jobs
+        if getattr(job, 'explanation_ok', False)
+    }
+    await cache.aset(key, {
+        'ids': [job.id for job in jobs],
+        'scores': scores,
+        'explanations': explanations,
+    }, SEARCH_CACHE_TIMEOUT)
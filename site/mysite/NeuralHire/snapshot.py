@@ -0,0 +1,178 @@
+# snapshot.py
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from NeuralHire.rollout import searchable_jobs
+from NeuralHire.search_cache import get_catalogue, get_catalogue_version
+from utils.compression import CompressedEmbeddings, EmbeddingCodec
+from utils.lexical import BM25_VOCABULARY_FILE, BM25Index, job_tokens
+from utils.ranking import effective_salary
+
+CURRENT_FILE = 'CURRENT'  # Holds the directory name of the live snapshot
+KEEP_SNAPSHOTS = 2  # The previous snapshot stays for workers that have not switched yet
+EXPORT_BATCH = 2000
+SNAPSHOT_RECHECK_SECONDS = 30  # How often a worker without a matching snapshot looks again
+
+_snapshot = None  # Snapshot mapped by this process
+_checked = (None, 0.0)  # (catalogue version, monotonic time) of the last miss
+
+
+class Snapshot:
+    """
+    A read-only, memory-mapped export of the catalogue: float32 embeddings plus the
+    id, money, salary (money or its estimate) and city_ref columns, rows in job id order. Every worker on a host maps
+    the same files, so the matrix lives once in the page cache. The BM25 index of the
+    rows is built at export too, so no request waits for it (None in older snapshots),
+    as are the compressed codes of search.EMBEDDING_COMPRESSION (`compressed`, by spec).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / 'meta.json', encoding='utf8') as file:
+            self.meta = json.load(file)
+        self.version = self.meta['catalogue_version']
+        self.embeddings = np.load(self.path / 'embeddings.npy', mmap_mode='r')
+        self.ids = np.load(self.path / 'ids.npy', mmap_mode='r')
+        self.money = np.load(self.path / 'money.npy', mmap_mode='r')
+        self.salary = np.load(self.path / 'salary.npy', mmap_mode='r')
+        self.city_ref = np.load(self.path / 'city_ref.npy', mmap_mode='r')
+        self.lexical = BM25Index.load(self.path) if (self.path / BM25_VOCABULARY_FILE).exists() else None
+        self.compressed = {spec: CompressedEmbeddings.load(self.path / f'compressed-{spec}')
+                           for spec in self.meta.get('compression', [])}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def matches(self, jobs_data):
+        """True when the rows line up with jobs_data (same ids, same order)."""
+        if len(jobs_data) != len(self):
+            return False
+        ids = np.fromiter((job['id'] for job in jobs_data), dtype=np.int64, count=len(jobs_data))
+        return np.array_equal(ids, self.ids)
+
+
+def snapshot_dir():
+    return Path(settings.EMBEDDING_SNAPSHOT_DIR)
+
+
+def export_snapshot(directory=None, keep=KEEP_SNAPSHOTS, compression=None):
+    """
+    Write the embeddings of the current catalogue to a new snapshot directory and
+    make it the live one. The CURRENT pointer is replaced atomically, so a reader
+    sees either the old or the new snapshot, never a partial one. Returns its path.
+    compression: specs to encode codes for (default: search.EMBEDDING_COMPRESSION, if set).
+    """
+    if compression is None:
+        from NeuralHire.search import EMBEDDING_COMPRESSION  # search imports this module
+        compression = [EMBEDDING_COMPRESSION] if EMBEDDING_COMPRESSION else []
+    compression = [EmbeddingCodec.from_spec(spec).spec for spec in compression]  # 'truncate384' -> 'truncate384-float32'
+    directory = Path(directory or snapshot_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    catalogue = get_catalogue()
+    version = catalogue.version
+    jobs = searchable_jobs(catalogue.embedding_version).order_by('id')
+    count = jobs.count()
+    first = jobs.values_list('content_embedding', flat=True).first()
+    dims = len(first) if first else 0
+
+    name = f'v{version}-{uuid.uuid4().hex[:8]}'
+    staging = directory / f'.{name}.tmp'
+    staging.mkdir()
+    try:
+        embeddings = np.lib.format.open_memmap(staging / 'embeddings.npy', mode='w+', dtype=np.float32,
+                                               shape=(count, dims))
+        ids = np.empty(count, dtype=np.int64)
+        money = np.empty(count, dtype=np.int64)
+        predicted = np.empty(count, dtype=np.int64)
+        city_ref = np.empty(count, dtype=np.int64)
+        documents = []
+
+        row = -1
+        rows = jobs.values_list('id', 'content_embedding', 'money', 'predicted_money', 'city_ref',
+                                'title', 'knoladge', 'addition')
+        for row, (job_id, vector, salary, estimate, city, title, knowledge, addition) in enumerate(
+                rows.iterator(chunk_size=EXPORT_BATCH)):
+            if row >= count:
+                break
+            embeddings[row] = vector
+            documents.append(job_tokens(title, knowledge, addition))
+            ids[row] = job_id
+            money[row] = -1 if salary is None else salary
+            predicted[row] = -1 if estimate is None else estimate
+            city_ref[row] = -1 if city is None else city
+        if row + 1 != count or get_catalogue_version() != version:
+            raise RuntimeError('The catalogue changed during the export; run export_snapshot again.')
+
+        embeddings.flush()
+        for spec in compression:
+            CompressedEmbeddings.build(embeddings, spec).save(staging / f'compressed-{spec}')
+        del embeddings
+        np.save(staging / 'ids.npy', ids)
+        np.save(staging / 'money.npy', money)
+        np.save(staging / 'salary.npy', effective_salary(money, predicted))
+        np.save(staging / 'city_ref.npy', city_ref)
+        BM25Index(documents).save(staging)
+        with open(staging / 'meta.json', 'w', encoding='utf8') as file:
+            json.dump({'catalogue_version': version, 'embedding_version': catalogue.embedding_version,
+                       'jobs': count, 'dims': dims, 'dtype': 'float32', 'compression': list(compression),
+                       'created': time.time()}, file)
+        os.replace(staging, directory / name)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = directory / f'.{CURRENT_FILE}.{name}.tmp'
+    pointer.write_text(name, encoding='utf8')
+    os.replace(pointer, directory / CURRENT_FILE)
+
+    _prune(directory, keep)
+    return directory / name
+
+
+def _prune(directory, keep):
+    """
+    Delete all but the newest `keep` snapshots. Workers still mapping a deleted one
+    keep their pages until they switch (on Windows the delete fails and is retried next time).
+    """
+    snapshots = sorted((path for path in directory.iterdir() if path.is_dir() and path.name.startswith('v')),
+                       key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in snapshots[max(keep, 1):]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def load_current_snapshot(directory=None):
+    """The live snapshot, or None when there is none (or it cannot be read)."""
+    directory = Path(directory or snapshot_dir())
+    try:
+        name = (directory / CURRENT_FILE).read_text(encoding='utf8').strip()
+        return Snapshot(directory / name)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+async def aget_snapshot(version):
+    """
+    The snapshot of this catalogue version for the web process, or None: the caller
+    then reads the embeddings from the database. A new snapshot is mapped when the
+    version moves; without one the pointer is checked again every few seconds.
+    """
+    global _snapshot, _checked
+    if _snapshot is not None and _snapshot.version == version:
+        return _snapshot
+    if _checked[0] == version and time.monotonic() - _checked[1] < SNAPSHOT_RECHECK_SECONDS:
+        return None
+
+    snapshot = await asyncio.to_thread(load_current_snapshot)
+    if snapshot is not None and snapshot.version == version:
+        _snapshot = snapshot
+        return snapshot
+    _checked = (version, time.monotonic())
+    return None
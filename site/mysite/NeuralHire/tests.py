@@ -1,3 +1,834 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from NeuralHire import alerts, rollout, search, snapshot
+from NeuralHire.models import Catalogue, Job, Resume, SavedSearch, SavedSearchMatch
+from utils import async_http, embeddings, qwen_vl
+from utils.cities import CITIES, CityMatcher, city_variants, parse_city
+from utils.dedup import MinHasher, duplicate_canonicals, shingle_hashes, vacancy_id
+from utils.lexical import BM25Index, job_tokens, reciprocal_rank_fusion, weighted_fusion
+from utils.ranking import (
+    boost_pool, effective_salary, mmr_order, salary_mask, scores_below, sharded_top_k, top_k_indices
+)
+from utils.salary import SalaryModel, salary_errors
+
+SITE_DIR = Path(__file__).resolve().parent.parent
+
+# Loaded only when a model, the Qwen client or OCR is first used
+HEAVY_MODULES = ('sentence_transformers', 'torch', 'transformers', 'openai', 'pdf2image', 'pytesseract', 'requests')
+# Wall-clock budget for `manage.py check` in a fresh interpreter
+STARTUP_BUDGET_SECONDS = 3.0
+
+
+def run_python(code):
+    """Run code in a fresh interpreter with the project settings; returns the completed process."""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='mysite.settings')
+    return subprocess.run([sys.executable, '-c', code], cwd=SITE_DIR, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+
+class StartupTests(SimpleTestCase):
+    """Importing the app must stay cheap: every manage.py command and worker boot pays for it."""
+
+    def test_views_import_no_heavy_modules(self):
+        result = run_python(
+            "import json, sys, django\n"
+            "django.setup()\n"
+            "import NeuralHire.urls\n"
+            f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))\n"
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.strip().splitlines()[-1]), [])
+
+    def test_qwen_vl_import_has_no_side_effects(self):
+        result = run_python(
+            "import utils.qwen_vl as qwen_vl\n"
+            "assert qwen_vl._client is None and not qwen_vl._env_loaded\n"
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, '')
+
+    def test_manage_check_within_budget(self):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, 'manage.py', 'check'], cwd=SITE_DIR,
+                                capture_output=True, text=True, timeout=60)
+        seconds = time.perf_counter() - start
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertLess(seconds, STARTUP_BUDGET_SECONDS)
+
+
+class AsyncHttpClientTests(SimpleTestCase):
+    """Under WSGI every async view runs in its own event loop; its client must not outlive it."""
+
+    def test_client_shared_within_loop_and_closed_with_it(self):
+        async def request():
+            client = async_http.get_async_http_client()
+            self.assertIs(client, async_http.get_async_http_client())
+            return client
+
+        clients = [asyncio.run(request()) for _ in range(3)]
+        self.assertEqual(len({id(client) for client in clients}), 3)
+        self.assertTrue(all(client.is_closed for client in clients))
+        self.assertEqual(len(async_http._clients), 0)
+
+
+class VectorRetrievalTests(SimpleTestCase):
+
+    def test_list_query_scored_in_float32(self):
+        # embed_query returns a list of Python floats; the job matrix must not be upcast for it
+        matrix = np.random.default_rng(0).standard_normal((50, 768)).astype(np.float32)
+        jobs = [{'id': i, 'content_embedding': row.tolist(), 'addition': ''} for i, row in enumerate(matrix)]
+        state = search.SearchState('query', matrix[3].astype(np.float64).tolist(), jobs_data=jobs)
+        indices, scores = search.VectorRetrieval(5)._score(state)
+        self.assertEqual(state.query_vectors.dtype, np.float32)
+        self.assertEqual(state.job_matrix.dtype, np.float32)
+        self.assertEqual(scores.dtype, np.float32)
+        self.assertEqual(indices[0], 3)
+
+
+class CrossEncoderRerankTests(SimpleTestCase):
+
+    def test_partial_rerank_keeps_tail_below_on_one_scale(self):
+        jobs = [{'id': i, 'title': f'Job {i}', 'knoladge': '', 'addition': ''} for i in range(10)]
+        state = search.SearchState('query', np.zeros(768), jobs_data=jobs, deadline=search.Deadline(1.0))
+        state.indices = np.arange(10)
+        state.scores = np.linspace(0.03, 0.01, 10)  # Fusion scores, far from the logits' scale
+        logits = [(1, 8.0), (0, 5.0), (3, 4.0), (2, 1.0), (5, 0.0), (4, -1.0)]  # 6 of the 10 fit the deadline
+        stage = search.CrossEncoderRerank(10)
+        with mock.patch.object(search.CrossEncoderRerank, 'seconds_per_pair', 0.15), \
+                mock.patch.object(search.CrossEncoderRerank, 'warmed_up', True), \
+                mock.patch('NeuralHire.search.rerank_results', return_value=logits):
+            asyncio.run(stage.run(state))
+        self.assertEqual(list(state.indices), [1, 0, 3, 2, 5, 4, 6, 7, 8, 9])
+        self.assertEqual(list(state.scores[:6]), [8.0, 5.0, 4.0, 1.0, 0.0, -1.0])
+        self.assertTrue(np.all(np.diff(state.scores) < 0))
+
+    def test_cold_first_call_is_not_observed(self):
+        with mock.patch.object(search.CrossEncoderRerank, 'seconds_per_pair', 0.01), \
+                mock.patch.object(search.CrossEncoderRerank, 'warmed_up', False):
+            search.CrossEncoderRerank._observe(30.0, 10)  # Loads the model
+            self.assertEqual(search.CrossEncoderRerank.seconds_per_pair, 0.01)
+            search.CrossEncoderRerank._observe(0.2, 10)
+            self.assertAlmostEqual(search.CrossEncoderRerank.seconds_per_pair, 0.012)
+
+
+class QueryModelTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(embeddings, _model=None, _model_source=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_embed_query_reports_the_model_that_encoded_it(self):
+        class FakeModel:
+            def __init__(self, source):
+                self.source = source
+
+            def encode(self, text, **kwargs):
+                if self.source == 'old-model':
+                    embeddings.use_model('new-model')  # A cutover lands mid-encode
+                return np.ones(4, dtype=np.float32)
+
+        with mock.patch.object(embeddings, 'load_model', FakeModel):
+            embeddings.use_model('old-model')
+            vector, version = embeddings.embed_query('python developer')
+            self.assertEqual(version, 'old-model')
+            self.assertEqual(embeddings.embed_query('python developer')[1], 'new-model')
+        self.assertEqual(vector, [1.0] * 4)
+        self.assertEqual(embeddings.embed_query('  '), (None, None))
+
+    def test_model_retrained_in_place_is_reloaded_for_the_new_tag(self):
+        loads = []
+
+        class FakeModel:
+            def __init__(self, source):
+                loads.append(source)
+
+            def encode(self, text, **kwargs):
+                return np.ones(4, dtype=np.float32)
+
+        with tempfile.TemporaryDirectory() as model_dir, \
+                mock.patch.object(embeddings, 'load_model', FakeModel), \
+                mock.patch.dict(embeddings._model_versions, clear=True), \
+                mock.patch.object(rollout, '_reloaded_for', None):
+            weights = Path(model_dir) / 'model.safetensors'
+            weights.write_bytes(b'old weights')
+            embeddings.use_model(model_dir)
+            old_tag = embeddings.embed_query('python developer')[1]
+
+            # fine_tuned_bert is retrained into the same directory and its vectors go live
+            weights.write_bytes(b'retrained weights')
+            with mock.patch.object(embeddings, '_model_versions', {}):
+                new_tag = embeddings.model_version(model_dir)
+            self.assertNotEqual(new_tag, old_tag)
+            catalogue = Catalogue(embedding_model=model_dir, embedding_version=new_tag)
+
+            self.assertEqual(asyncio.run(rollout.aensure_query_model(catalogue)), new_tag)
+            self.assertEqual(embeddings.embed_query('python developer')[1], new_tag)
+            asyncio.run(rollout.aensure_query_model(catalogue))
+        self.assertEqual(loads, [model_dir, model_dir])
+
+
+RESUME_OCR_TEXT = (
+    "Иван Петров\nPython-разработчик\n\n"
+    "Опыт работы\nООО Ромашка, 2020-2024. Разработка сервисов на Django и PostgreSQL.\n\n"
+    "Образование\nМГТУ им. Баумана, 2019\n\n"
+    "Ключевые навыки:\n" + "Python Django PostgreSQL Docker " * 40
+)
+
+
+class ResumeChunkTests(SimpleTestCase):
+
+    def test_split_on_headings_and_wrap_long_sections(self):
+        chunks = embeddings.split_resume_sections(RESUME_OCR_TEXT, max_chars=200)
+        self.assertEqual(chunks[0], 'Иван Петров Python-разработчик')
+        self.assertTrue(chunks[1].startswith('Опыт работы ООО Ромашка'))
+        self.assertTrue(chunks[2].startswith('Образование'))
+        self.assertGreater(len(chunks), 4)  # The skills section is wrapped
+        self.assertTrue(all(len(chunk) <= 200 for chunk in chunks))
+        self.assertEqual(embeddings.split_resume_sections('  \n '), [])
+
+    def test_resume_chunks_prefer_ocr_chunks_after_the_summary(self):
+        resume_data = {'full_summary': 'Python-разработчик', 'skills': 'Python', 'experience': '', 'preferences': '',
+                       'chunks': ['Python-разработчик', 'Опыт работы Django', '***', 'Образование МГТУ']}
+        self.assertEqual(embeddings.resume_chunks(resume_data),
+                         ['Python-разработчик', 'Опыт работы Django', 'Образование МГТУ'])
+
+    def test_resume_chunks_without_summary_or_ocr(self):
+        resume_data = {'full_summary': '', 'skills': 'Python, Django', 'experience': '5 лет', 'preferences': ''}
+        self.assertEqual(embeddings.resume_chunks(resume_data), ['Python, Django', '5 лет'])
+
+    def test_asummarize_resume_returns_ocr_chunks(self):
+        answer = json.dumps({'skills': 'Python', 'experience': '', 'preferences': '', 'full_summary': 'Разработчик'})
+        completion = mock.Mock(choices=[mock.Mock(message=mock.Mock(content=answer))])
+        client = mock.Mock()
+        client.chat.completions.create = mock.AsyncMock(return_value=completion)
+        with mock.patch.object(qwen_vl, '_resume_messages', return_value=[]), \
+                mock.patch.object(qwen_vl, 'get_async_client', return_value=client), \
+                mock.patch.object(qwen_vl, 'ocr_resume_text', return_value=RESUME_OCR_TEXT):
+            resume_data = asyncio.run(qwen_vl.asummarize_resume('resume.pdf'))
+        self.assertEqual(resume_data['full_summary'], 'Разработчик')
+        self.assertEqual(resume_data['chunks'], embeddings.split_resume_sections(RESUME_OCR_TEXT))
+        self.assertEqual(embeddings.resume_chunks(resume_data)[:2], ['Разработчик', resume_data['chunks'][0]])
+
+
+class CityTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.matcher = CityMatcher((code, name, region, city_variants(name))
+                                  for code, (name, region) in enumerate(CITIES, 1))
+
+    def city(self, text):
+        return self.matcher.names.get(self.matcher.match(text))
+
+    def test_inflections(self):
+        self.assertEqual(city_variants('Москва'), ['москва', 'москвы', 'москве', 'москву', 'москвой'])
+        self.assertIn('казани', city_variants('Казань'))
+        self.assertIn('нижнем новгороде', city_variants('Нижний Новгород'))
+        self.assertIn('ростове-на-дону', city_variants('Ростов-на-Дону'))
+        self.assertIn('санкт-петербурге', city_variants('Санкт-Петербург'))
+        self.assertIn('сергиевом посаде', city_variants('Сергиев Посад'))
+        self.assertIn('химках', city_variants('Химки'))
+        self.assertEqual(city_variants('Сочи'), ['сочи'])
+
+    def test_parse_city(self):
+        self.assertEqual(parse_city('Киров (Кировская область)'), ('Киров', 'Кировская область'))
+        self.assertEqual(parse_city('Москва, Бирюлёвская улица, 38'), ('Москва', ''))
+        self.assertEqual(parse_city('г. Казань'), ('Казань', ''))
+        self.assertIsNone(parse_city('удалённая работа'))
+        self.assertIsNone(parse_city('123456'))
+        self.assertIsNone(parse_city(''))
+
+    def test_match_typed_names_and_aliases(self):
+        self.assertEqual(self.city('Казани'), 'Казань')
+        self.assertEqual(self.city('нижний новгород'), 'Нижний Новгород')
+        self.assertEqual(self.city('СПб'), 'Санкт-Петербург')
+        self.assertEqual(self.city('Питер'), 'Санкт-Петербург')
+        self.assertEqual(self.city('Мск'), 'Москва')
+        self.assertIsNone(self.city('Мсква'))
+
+    def test_find_in_text_matches_whole_names(self):
+        found = self.matcher.find_in_text('Живу в Нижнем Новгороде, готов к переезду в Питер. Питер Иванов, Владимир')
+        self.assertEqual([self.matcher.names[code] for code in found], ['Нижний Новгород', 'Санкт-Петербург'])
+
+
+def fake_rerank(query, job_texts, top_k=20):
+    return [(i, 1.0 - i / 100) for i in range(min(top_k, len(job_texts)))]
+
+
+class SalaryTests(SimpleTestCase):
+
+    @staticmethod
+    def _jobs(count, seed=0):
+        """Rows whose salary depends on the first embedding component and the city."""
+        embeddings = np.random.default_rng(seed).standard_normal((count, 8)).astype(np.float32)
+        jobs = [{'title': 'Разработчик', 'knoladge': 'python', 'addition': '',
+                 'city': 'Москва' if i % 2 else 'Казань', 'content_embedding': row.tolist()}
+                for i, row in enumerate(embeddings)]
+        salaries = np.rint(100 * np.exp(0.3 * embeddings[:, 0] + 0.2 * (np.arange(count) % 2)))
+        return jobs, salaries
+
+    def test_salary_mask(self):
+        money = [-1, 50, 100, 150]
+        self.assertEqual(salary_mask(money, 80, 120).tolist(), [True, False, True, False])
+        self.assertEqual(salary_mask(money, 80, include_negotiable=False).tolist(), [False, False, True, True])
+        self.assertEqual(salary_mask(money, max_salary=100, include_negotiable=False).tolist(),
+                         [False, True, True, False])
+
+    def test_effective_salary_prefers_listed_salary(self):
+        # Listed salary, else the estimate, else -1 (negotiable and missing estimates alike)
+        self.assertEqual(effective_salary([120, -1, -1, 0], [90, 80, -1, -1]).tolist(), [120, 80, -1, -1])
+
+    def test_model_fit_predict(self):
+        jobs, salaries = self._jobs(400)
+        model = SalaryModel(8).fit(jobs[:300], salaries[:300])
+        predicted = model.predict(jobs[300:])
+        self.assertEqual(predicted.dtype, np.int64)
+        self.assertLess(salary_errors(salaries[300:], predicted)['mape'], 5.0)
+        # Predictions stay within the range of the training salaries
+        self.assertTrue(np.all((predicted >= np.floor(model.low)) & (predicted <= np.ceil(model.high))))
+
+    def test_model_save_load(self):
+        jobs, salaries = self._jobs(100)
+        model = SalaryModel(8, meta={'embedding_version': 'v1'}).fit(jobs, salaries)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'salary_model.npz')
+            model.save(path)
+            loaded = SalaryModel.load(path)
+        self.assertEqual(loaded.meta['embedding_version'], 'v1')
+        np.testing.assert_array_equal(loaded.predict(jobs), model.predict(jobs))
+
+    def test_sort_by_salary_reorders_top_results(self):
+        jobs = [{'id': i, 'money': money, 'predicted_money': None, 'addition': ''}
+                for i, money in enumerate([100, 300, -1, 200, 500])]
+        state = search.SearchState('query', [1.0], jobs_data=jobs,
+                                   filters=search.SearchFilters(sort_by_salary=True, estimated=False))
+        state.indices = np.arange(5)
+        state.scores = np.linspace(1.0, 0.6, 5)
+        # Only the top 3 by relevance are reordered; the unknown salary goes last
+        self.assertEqual(state.filters.top_positions(state, 3).tolist(), [1, 0, 2])
+        state.filters.order(state)
+        self.assertEqual(state.ids, [4, 1, 3, 0, 2])
+
+
+class TopKTests(SimpleTestCase):
+
+    def test_top_k_matches_full_sort(self):
+        scores = np.random.default_rng(0).standard_normal(1000)
+        np.testing.assert_array_equal(top_k_indices(scores, 10), np.argsort(-scores)[:10])
+        self.assertEqual(len(top_k_indices(scores, 5000)), 1000)
+        self.assertEqual(len(top_k_indices(scores, 0)), 0)
+
+    def test_top_k_skips_masked_and_minus_inf(self):
+        scores = np.array([5.0, -np.inf, 3.0, 4.0, 1.0])
+        mask = np.array([False, True, True, True, True])
+        self.assertEqual(top_k_indices(scores, 3, mask=mask).tolist(), [3, 2, 4])
+        self.assertEqual(top_k_indices(scores, 10, mask=mask).tolist(), [3, 2, 4])
+
+    def test_sharded_top_k_matches_single_pass(self):
+        scores = np.random.default_rng(1).standard_normal(1003).astype(np.float32)
+        mask = np.random.default_rng(2).random(1003) > 0.3
+        with ThreadPoolExecutor(4) as executor:
+            indices, all_scores = sharded_top_k(lambda start, end: scores[start:end], len(scores), 20,
+                                                executor, shards=4, mask=mask)
+        np.testing.assert_array_equal(indices, top_k_indices(scores, 20, mask=mask))
+        np.testing.assert_array_equal(all_scores, scores)
+
+    def test_boost_pool_keeps_every_job_that_can_reach_the_top(self):
+        scores = np.random.default_rng(3).standard_normal(500)
+        pool = set(boost_pool(scores, 10, max_boost=0.5, limit=500).tolist())
+        kth = np.sort(scores)[::-1][9]
+        self.assertEqual(pool, set(np.flatnonzero(scores >= kth - 0.5).tolist()))
+
+
+class LexicalTests(SimpleTestCase):
+    DOCUMENTS = [
+        ('Python разработчик', 'Django, PostgreSQL'),
+        ('Java разработчик', 'Spring, PostgreSQL'),
+        ('Python аналитик', 'pandas, SQL'),
+        ('Дизайнер', 'Figma'),
+    ]
+
+    def index(self):
+        return BM25Index([job_tokens(title, knowledge) for title, knowledge in self.DOCUMENTS])
+
+    def test_bm25_scores(self):
+        scores = self.index().scores('python django')
+        self.assertEqual(int(np.argmax(scores)), 0)
+        self.assertGreater(scores[2], 0)
+        self.assertEqual(scores[1], 0)
+        self.assertEqual(scores[3], 0)
+        # The rarer term weighs more: django (one job) beats postgresql (two jobs)
+        index = self.index()
+        self.assertGreater(index.scores('django')[0], index.scores('postgresql')[0])
+        np.testing.assert_array_equal(index.scores('kotlin'), np.zeros(4))
+
+    def test_bm25_search_mask(self):
+        indices, scores = self.index().search('python', 10, mask=np.array([False, True, True, True]))
+        self.assertEqual(indices.tolist(), [2])
+        self.assertGreater(scores[0], 0)
+
+    def test_bm25_save_load(self):
+        index = self.index()
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            loaded = BM25Index.load(directory)
+            self.assertIsInstance(loaded.weights, np.memmap)
+            for query in ('python django', 'разработчик', 'figma sql'):
+                np.testing.assert_array_equal(loaded.scores(query), index.scores(query))
+            del loaded  # Release the mapped files before the directory is removed
+
+    def test_reciprocal_rank_fusion(self):
+        indices, scores = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], k=60)
+        # 1 and 3 are in both lists, 1 ranks higher on average
+        self.assertEqual(indices.tolist()[:2], [1, 3])
+        self.assertAlmostEqual(scores[0], 1 / 61 + 1 / 63)
+        self.assertEqual(sorted(indices.tolist()), [1, 2, 3, 4])
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_weighted_fusion(self):
+        dense = np.array([0.9, 0.8, 0.1, -np.inf])
+        lexical = np.array([0.0, 2.0, 4.0, 1.0])
+        indices, scores = weighted_fusion(np.array([0, 1, 2, 3]), dense, lexical, weight=0.5)
+        self.assertEqual(indices[0], 1)
+        self.assertEqual(indices[-1], 3)
+        self.assertTrue(np.all((scores >= 0) & (scores <= 1)))
+
+
+VACANCY_TEXT = ('Требуется Python разработчик в команду платформы. Опыт работы с Django и PostgreSQL от трёх лет, '
+                'знание Docker, Celery и Redis. Удалённая работа или офис в Москве, гибкий график, ДМС.')
+
+
+class DedupTests(SimpleTestCase):
+
+    def test_vacancy_id(self):
+        self.assertEqual(vacancy_id('https://www.superjob.ru/vakansii/python-developer-4512.html?from=search'), '4512')
+        self.assertIsNone(vacancy_id('https://example.com/job'))
+
+    def test_minhash_estimates_jaccard(self):
+        other = VACANCY_TEXT.replace('ДМС', 'ДМС и бесплатные обеды')
+        a, b = shingle_hashes(VACANCY_TEXT), shingle_hashes(other)
+        exact = len(np.intersect1d(a, b)) / len(np.union1d(a, b))
+        minhasher = MinHasher(num_perm=256)
+        estimate = np.mean(minhasher.signature(a) == minhasher.signature(b))
+        self.assertAlmostEqual(estimate, exact, delta=0.1)
+
+    def test_near_duplicates_keep_the_earliest(self):
+        texts = [VACANCY_TEXT, 'Дизайнер интерфейсов, Figma', VACANCY_TEXT + ' Откликайтесь!', VACANCY_TEXT]
+        self.assertEqual(duplicate_canonicals(texts).tolist(), [0, 1, 0, 0])
+
+    def test_titles_and_embeddings_must_agree(self):
+        texts = [VACANCY_TEXT, VACANCY_TEXT, VACANCY_TEXT]
+        titles = ['Python разработчик', 'Python-разработчик', 'Python тимлид']
+        self.assertEqual(duplicate_canonicals(texts, titles=titles).tolist(), [0, 0, 2])
+        embeddings = [[1.0, 0.0], [0.0, 1.0], None]
+        self.assertEqual(duplicate_canonicals(texts, embeddings=embeddings).tolist(), [0, 1, 0])
+
+    def test_shared_key_is_a_duplicate(self):
+        texts = [VACANCY_TEXT, 'Дизайнер интерфейсов, Figma', 'Бухгалтер, 1С']
+        self.assertEqual(duplicate_canonicals(texts, keys=['42', None, '42']).tolist(), [0, 1, 0])
+
+
+class DiversifyTests(SimpleTestCase):
+    # Jobs 0 and 1 are near copies; 2 is less relevant but different
+    VECTORS = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]])
+    RELEVANCE = np.array([1.0, 0.95, 0.5])
+
+    def test_mmr_prefers_a_different_job_over_a_copy(self):
+        self.assertEqual(mmr_order(self.RELEVANCE, self.VECTORS, 3, lambda_=0.5).tolist(), [0, 2, 1])
+
+    def test_mmr_lambda_one_is_relevance_order(self):
+        self.assertEqual(mmr_order(self.RELEVANCE, self.VECTORS, 3, lambda_=1.0).tolist(), [0, 1, 2])
+        self.assertEqual(mmr_order(self.RELEVANCE, self.VECTORS, 2, lambda_=0.5).tolist(), [0, 2])
+        self.assertEqual(len(mmr_order([], np.empty((0, 2)), 5, lambda_=0.5)), 0)
+
+    def test_scores_below_the_head(self):
+        tail = scores_below([3.0, 1.0, 2.0], 4)
+        self.assertTrue(np.all(tail < 1.0))
+        self.assertTrue(np.all(np.diff(tail) < 0))
+        self.assertEqual(scores_below([], 2).tolist(), [-1.0, -2.0])
+        self.assertTrue(np.all(scores_below([2.0, 2.0], 2) < 2.0))
+
+
+def payload_bytes(rows):
+    """Approximate size of fetched rows: UTF-8 text length, 8 bytes per number or array element."""
+    def size(value):
+        if isinstance(value, (list, tuple)):
+            return sum(size(item) for item in value)
+        return len(value.encode('utf-8')) if isinstance(value, str) else 8
+    return sum(size(row) for row in rows)
+
+
+class FetchedRows:
+    """
+    Rows the database returned, per statement ([sql, rows] in execution order), so a
+    test can check what a view transfers and not only the SQL it sends.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self._patches = []
+
+    def __enter__(self):
+        statements = self.statements
+        execute = CursorWrapper.execute
+
+        def spy_execute(cursor, sql, params=None):
+            statements.append([sql, []])
+            return execute(cursor, sql, params)
+
+        def spy_fetch(name):
+            def fetch(cursor, *args):
+                result = getattr(cursor.cursor, name)(*args)
+                if statements and result is not None:
+                    statements[-1][1].extend([result] if name == 'fetchone' else result)
+                return result
+            return fetch
+
+        self._patches = [mock.patch.object(CursorWrapper, 'execute', spy_execute)] + [
+            mock.patch.object(CursorWrapper, name, spy_fetch(name), create=True)
+            for name in ('fetchone', 'fetchmany', 'fetchall')
+        ]
+        for patcher in self._patches:
+            patcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patcher in reversed(self._patches):
+            patcher.stop()
+
+    def rows(self, table):
+        """Rows of each SELECT from `table`, in order."""
+        return [rows for sql, rows in self.statements
+                if sql.lstrip().startswith('SELECT') and f'FROM "{table}"' in sql]
+
+
+class SearchQueryTests(TestCase):
+    """
+    Database round trips of a text search: one read of the catalogue row, one catalogue
+    fetch and one fetch of the displayed jobs without their embedding columns.
+    Runs against the Postgres test database (ArrayField).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Catalogue.objects.create(pk=1, version=1)
+        vectors = np.eye(768, dtype=np.float32)
+        Job.objects.bulk_create([
+            Job(title=f'Python developer {i}', knoladge='Django, PostgreSQL', company='Acme', city='Москва',
+                money=100 + i, content_embedding=(vectors[0] + vectors[i + 1]).tolist())
+            for i in range(40)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        search._snapshot_rows = None
+        query_vector = np.eye(768, dtype=np.float32)[0]
+        patches = [
+            mock.patch('NeuralHire.views.embed_query', return_value=(query_vector, '')),
+            mock.patch('NeuralHire.views.aexplain_job_match', mock.AsyncMock(return_value='Подходит')),
+            mock.patch('NeuralHire.search.rerank_results', fake_rerank),
+            mock.patch('NeuralHire.search.aget_snapshot', mock.AsyncMock(return_value=None)),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertDisplayQuery(self, queries):
+        """The last query loads the result cards: no embedding column is transferred."""
+        sql = queries[-1]['sql']
+        self.assertIn('"NeuralHire_job"', sql)
+        self.assertNotIn('embedding', sql)
+
+    def assertDisplayRows(self, rows, max_rows):
+        """The result cards are at most max_rows rows of text columns (no 768-float arrays)."""
+        self.assertLessEqual(len(rows), max_rows)
+        self.assertFalse([value for row in rows for value in row if isinstance(value, list)])
+        self.assertLess(payload_bytes(rows), 1024 * len(rows))
+
+    def assertCatalogueRows(self, rows):
+        """One fetch of the catalogue, with one 768-float embedding per job."""
+        self.assertEqual(len(rows), 40)
+        self.assertGreaterEqual(payload_bytes(rows), 40 * 768 * 8)
+
+    def test_main_queries(self):
+        with mock.patch('NeuralHire.views.STREAM_RESULTS', False):
+            with CaptureQueriesContext(connection) as queries, FetchedRows() as fetched:
+                response = self.client.post(reverse('main'), {'knoladge': 'python developer'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(queries), 3, [query['sql'] for query in queries])
+            self.assertDisplayQuery(queries)
+            catalogue_rows, display_rows = fetched.rows('NeuralHire_job')
+            self.assertCatalogueRows(catalogue_rows)
+            self.assertDisplayRows(display_rows, search.FINAL_RESULTS)
+
+            # A cached search reads the catalogue row and the displayed jobs only
+            with self.assertNumQueries(2), FetchedRows() as fetched:
+                self.client.post(reverse('main'), {'knoladge': 'python developer'})
+            [display_rows] = fetched.rows('NeuralHire_job')
+            self.assertDisplayRows(display_rows, search.FINAL_RESULTS)
+
+    async def test_stream_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = await self.async_client.get(reverse('main_stream'), {'knoladge': 'python developer'})
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: done', body)
+        # Early and final results share one fetch of the displayed jobs
+        self.assertEqual(len(queries), 3, [query['sql'] for query in queries])
+        self.assertDisplayQuery(queries)
+
+    async def test_stream_rows(self):
+        with FetchedRows() as fetched:
+            response = await self.async_client.get(reverse('main_stream'), {'knoladge': 'python developer'})
+            b''.join([chunk async for chunk in response.streaming_content])
+        catalogue_rows, display_rows = fetched.rows('NeuralHire_job')
+        self.assertCatalogueRows(catalogue_rows)
+        # The fetch covers the fused pool the early results are cut from
+        self.assertDisplayRows(display_rows, search.CANDIDATES_FOR_RERANK)
+
+    def test_upload_resume_queries(self):
+        """Resume search with OCR, Qwen-VL and the embedding model mocked out."""
+        query_vector = np.eye(768, dtype=np.float32)[0]
+        resume_data = {'skills': 'Python, Django', 'experience': '5 лет', 'preferences': 'Москва',
+                       'full_summary': 'Python developer', 'chunks': ['Python, Django', 'PostgreSQL']}
+        patches = [
+            mock.patch('NeuralHire.views.asummarize_resume', mock.AsyncMock(return_value=resume_data)),
+            mock.patch('NeuralHire.views.embed_texts_versioned',
+                       return_value=(np.stack([query_vector] * 3), '')),
+            mock.patch('NeuralHire.views.extract_resume_crops', return_value={}),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        pdf = SimpleUploadedFile('cv.pdf', b'%PDF-1.4\n', content_type='application/pdf')
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            with CaptureQueriesContext(connection) as queries, FetchedRows() as fetched:
+                response = self.client.post(reverse('upload_resume'), {'resume_pdf': pdf})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('error', response.context)
+        self.assertEqual(len(response.context['jobs']), search.FINAL_RESULTS)
+
+        # One catalogue fetch, one fetch of the displayed jobs, one resume row written
+        catalogue_rows, display_rows = fetched.rows('NeuralHire_job')
+        self.assertCatalogueRows(catalogue_rows)
+        self.assertDisplayRows(display_rows, search.FINAL_RESULTS)
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "NeuralHire_resume"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Resume.objects.get().owner, self.client.session['owner'])
+
+
+IMPORT_COLUMNS = ('title', 'knoladge', 'company', 'city', 'addition', 'link', 'money')
+
+
+def fake_job_embedding(title, **fields):
+    """Shared direction plus one of its own per title number, so every job matches a saved search."""
+    vector = np.zeros(768, dtype=np.float32)
+    vector[0] = 1.0
+    vector[1 + int(title.rsplit(' ', 1)[-1])] = 1.0
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class SavedSearchScoreTests(SimpleTestCase):
+
+    def test_resume_chunks_score_as_in_upload(self):
+        rng = np.random.default_rng(0)
+        query, chunks, jobs = rng.standard_normal((1, 8)), rng.standard_normal((3, 8)), rng.standard_normal((5, 8))
+        similarities = np.vstack([query, chunks, query]) @ jobs.T
+        scores = alerts.saved_search_scores(similarities, np.array([0, 1, 4]))
+        self.assertEqual(scores.shape, (3, 5))
+        np.testing.assert_allclose(scores[0], (query @ jobs.T)[0])
+        np.testing.assert_allclose(scores[1], embeddings.score_chunks(jobs, chunks))
+        np.testing.assert_array_equal(scores[2], scores[0])
+
+    def test_resume_search_is_scored_with_its_chunk_vectors(self):
+        resume = Resume(id=1, chunk_embeddings=[[1.0, 0.0], [0.0, 1.0]], embedding_version='v1')
+        saved = SavedSearch(resume=resume, embedding=[1.0, 0.0], embedding_version='v1')
+        self.assertEqual(alerts.saved_search_vectors(saved), resume.chunk_embeddings)
+        self.assertEqual(alerts.embed_saved_search('', resume), ([1.0, 0.0], 'v1'))
+        self.assertFalse(alerts.resume_vectors_stale(resume, 'v1'))
+        self.assertTrue(alerts.resume_vectors_stale(resume, 'v2'))
+        saved.query = 'python'
+        self.assertEqual(alerts.saved_search_vectors(saved), [[1.0, 0.0]])
+
+
+class ImportJobsTests(TestCase):
+    """
+    import_jobs keeps job ids across imports, so the saved-search watermark only sees
+    vacancies that are really new. Runs against the Postgres test database (ArrayField).
+    """
+
+    def setUp(self):
+        cache.clear()
+        patches = [
+            mock.patch('NeuralHire.management.commands.import_jobs.live_model_source', return_value='test-model'),
+            mock.patch('NeuralHire.management.commands.import_jobs.use_model'),
+            mock.patch('NeuralHire.management.commands.import_jobs.model_version', return_value='test'),
+            mock.patch('NeuralHire.rollout.model_version', return_value='test'),
+            mock.patch('NeuralHire.management.commands.import_jobs.embed_job', side_effect=fake_job_embedding),
+            mock.patch('NeuralHire.management.commands.import_jobs.usable_salary_model', return_value=None),
+            mock.patch('NeuralHire.management.commands.import_jobs.get_salary_model', return_value=None),
+            mock.patch('NeuralHire.management.commands.import_jobs.export_snapshot',
+                       return_value=Path('snapshot')),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        vector = np.zeros(768, dtype=np.float32)
+        vector[0] = 1.0
+        self.saved = SavedSearch.objects.create(query='python', embedding=vector.tolist(),
+                                                embedding_version='test', min_score=0.0)
+
+    def import_jobs(self, count, company='Acme'):
+        """Import jobs 0..count-1 (the same rows every time); returns the command output."""
+        path = os.path.join(self.directory.name, 'jobs.csv')
+        rows = [(f'Python developer {i}', f'Django, PostgreSQL, проект {i}', company, 'Москва', '',
+                 f'https://www.superjob.ru/vakansii/python-developer-{1000 + i}.html', str(100 + i))
+                for i in range(count)]
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(','.join(IMPORT_COLUMNS) + '\n')
+            file.writelines(','.join(f'"{value}"' for value in row) + '\n' for row in rows)
+        out = StringIO()
+        call_command('import_jobs', path, stdout=out)
+        return out.getvalue()
+
+    def test_identical_import_keeps_ids_and_records_no_matches(self):
+        self.import_jobs(3)
+        ids = list(Job.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(SavedSearchMatch.objects.count(), 3)
+
+        output = self.import_jobs(3)
+        self.assertIn('Catalogue unchanged.', output)
+        self.assertIn('Saved searches: 0 new matches', output)
+        self.assertEqual(list(Job.objects.order_by('id').values_list('id', flat=True)), ids)
+        self.assertEqual(SavedSearchMatch.objects.count(), 3)
+        self.assertFalse(SavedSearchMatch.objects.filter(job__isnull=True).exists())
+
+    def test_new_vacancy_is_the_only_new_match(self):
+        self.import_jobs(3)
+        self.import_jobs(4)
+        self.assertEqual(Job.objects.count(), 4)
+        self.assertEqual(SavedSearchMatch.objects.count(), 4)
+        self.assertEqual(SavedSearchMatch.objects.order_by('-job_id').first().vacancy, '1003')
+
+    def test_search_saved_after_import_waits_for_new_jobs(self):
+        self.import_jobs(3)
+        later = SavedSearch.objects.create(query='python', embedding=self.saved.embedding, embedding_version='test',
+                                           min_score=0.0, last_job_id=Job.objects.order_by('-id').first().id)
+        self.import_jobs(3)
+        self.assertFalse(later.matches.exists())
+
+    def test_reembedded_jobs_are_written_without_a_query_per_job(self):
+        self.import_jobs(3)
+        Job.objects.update(shadow_embedding=self.saved.embedding, shadow_version='next')
+        with CaptureQueriesContext(connection) as queries:
+            output = self.import_jobs(3, company='Acme Group')
+        self.assertIn('Created 0, updated 3 and removed 0 jobs', output)
+        # The deferred shadow column is written, never loaded back job by job
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('SELECT') and '"shadow_embedding"' in query['sql']])
+        self.assertFalse(Job.objects.exclude(shadow_version='').exists())
+
+
+class SavedSearchOwnerTests(TestCase):
+    """Saved searches and their resumes belong to the browser session that made them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.resume = Resume.objects.create(pdf_file='resumes/cv.pdf', full_summary='Python', owner='owner-a')
+        cls.saved = SavedSearch.objects.create(query='python', owner='owner-a')
+
+    def login_as(self, owner):
+        session = self.client.session
+        session['owner'] = owner
+        session.save()
+
+    def test_matches_of_another_session_are_not_found(self):
+        url = reverse('saved_search_matches', args=[self.saved.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.login_as('owner-b')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.login_as('owner-a')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'matches': []})
+
+    def test_cannot_save_a_search_for_another_sessions_resume(self):
+        self.login_as('owner-b')
+        response = self.client.post(reverse('save_search'), {'resume': str(self.resume.id)})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(SavedSearch.objects.count(), 1)
+
+
+class SnapshotTests(TestCase):
+    """export_snapshot writes what Snapshot maps back. Runs against the Postgres test database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Catalogue.objects.create(pk=1, version=3)
+        cls.vectors = np.random.default_rng(0).standard_normal((6, 768)).astype(np.float32)
+        Job.objects.bulk_create([
+            Job(title=f'Python developer {i}', knoladge='Django' if i % 2 else 'PostgreSQL', city='Москва',
+                money=None if i == 0 else 100 + i, predicted_money=90 if i == 0 else None,
+                content_embedding=vector.tolist())
+            for i, vector in enumerate(cls.vectors)
+        ])
+        Job.objects.create(title='Без вектора', content_embedding=None)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_export_and_load(self):
+        path = snapshot.export_snapshot(self.directory.name, compression=['truncate16-int8'])
+        loaded = snapshot.load_current_snapshot(self.directory.name)
+        self.assertEqual(loaded.path, path)
+        self.assertEqual(loaded.version, 3)
+
+        jobs = list(Job.objects.filter(content_embedding__isnull=False).order_by('id').values('id'))
+        self.assertTrue(loaded.matches(jobs))
+        self.assertFalse(loaded.matches(jobs[::-1]))
+        self.assertIsInstance(loaded.embeddings, np.memmap)
+        np.testing.assert_array_equal(loaded.embeddings, self.vectors)
+        # Listed salary, else the estimate
+        self.assertEqual(loaded.salary.tolist(), [90, 101, 102, 103, 104, 105])
+        self.assertEqual(loaded.money[0], -1)
+
+        self.assertEqual(int(np.argmax(loaded.lexical.scores('django'))) % 2, 1)
+        compressed = loaded.compressed['truncate16-int8']
+        self.assertEqual(compressed.codes.shape, (6, 16))
+        self.assertEqual(int(np.argmax(compressed.scores(self.vectors[4]))), 4)
+
+    def test_new_export_replaces_and_prunes(self):
+        first = snapshot.export_snapshot(self.directory.name, keep=1, compression=[])
+        second = snapshot.export_snapshot(self.directory.name, keep=1, compression=[])
+        self.assertEqual(snapshot.load_current_snapshot(self.directory.name).path, second)
+        self.assertFalse(first.exists())
+        self.assertEqual(snapshot.load_current_snapshot(self.directory.name).compressed, {})
+
+    def test_no_snapshot(self):
+        self.assertIsNone(snapshot.load_current_snapshot(self.directory.name))
@@ -3,5 +3,10 @@ from . import views
 
 urlpatterns = [
     path('', views.main, name='main'),
+    path('search/stream/', views.main_stream, name='main_stream'),
     path('upload-resume/', views.upload_resume, name='upload_resume'),
+    # JSON API only: no page links to saved searches yet
+    path('saved-searches/', views.save_search, name='save_search'),
+    path('saved-searches/<int:pk>/matches/', views.saved_search_matches, name='saved_search_matches'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
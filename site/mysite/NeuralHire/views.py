@@ -1,14 +1,34 @@
 # views.py
 from django.shortcuts import render
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.core.files.storage import default_storage
-from NeuralHire.models import Job, Resume
-from utils.embeddings import (
-    embed_query, rerank_results, compute_keyword_boost,
-    create_job_text, create_job_summary, llm_validate_results
+from asgiref.sync import sync_to_async
+from NeuralHire.alerts import (
+    RESUME_VECTOR_FIELDS, acreate_saved_search, embed_resume, embed_saved_search, resume_vectors_stale
 )
-from utils.qwen_vl import summarize_resume, extract_resume_crops, explain_job_match
-import numpy as np
+from NeuralHire.cities import aget_city_matcher
+from NeuralHire.models import Job, Resume, SavedSearch, SavedSearchMatch
+from NeuralHire.rollout import aensure_query_model
+from NeuralHire.search import (
+    Deadline, SearchFilters, SearchState, text_search_pipeline, resume_search_pipeline,
+    FINAL_RESULTS, SEARCH_LATENCY_BUDGET
+)
+from NeuralHire.search_cache import (
+    aget_catalogue, search_cache_key, aget_cached_search, aset_cached_search
+)
+from utils.embeddings import embed_query, embed_texts_versioned, resume_chunks
+from utils.instrumentation import span, render_metrics
+from utils.qwen_vl import asummarize_resume, extract_resume_crops, aexplain_job_match
+from urllib.parse import urlencode
+import asyncio
+import json
+import logging
 import os
+import secrets
+
+logger = logging.getLogger(__name__)
 
 list_of_additions = [
     'Отклик без резюме',
@@ -19,15 +39,137 @@ list_of_additions = [
     'Доступно студентам',
 ]
 
-# Configuration
-CANDIDATES_FOR_RERANK = 100
-CANDIDATES_FOR_CROSS_ENCODER = 30
-FINAL_RESULTS = 20
-KEYWORD_BOOST_WEIGHT = 0.5
-USE_LLM_VALIDATION = False
+# Configuration (ranking budgets live in NeuralHire/search.py)
+EXPLAINED_RESULTS = 3
+# Render the page immediately and push results over SSE. The events only arrive as they
+# are produced under ASGI (mysite/asgi.py); under WSGI and runserver the async stream is
+# consumed in full before it is sent, so the page still works but gets everything at once.
+STREAM_RESULTS = True
+EARLY_RESULTS_STAGES = ('hybrid_fusion', 'keyword_boost')  # Streamed before the cross-encoder finishes
+EXPLANATION_FALLBACK = "Не удалось сгенерировать пояснение."
+FILTER_PARAMS = ('min_salary', 'max_salary', 'negotiable', 'estimated', 'cities', 'sort')
+OWNER_SESSION_KEY = 'owner'  # Session key of the token owning the session's resumes and saved searches
+# Columns job_card.html and the explanations read; the embedding columns (6 KB+ each) stay in the database
+JOB_CARD_FIELDS = ('id', 'title', 'company', 'city', 'city_ref', 'money', 'predicted_money',
+                   'knoladge', 'addition', 'link')
+
+
+# Model inference (embedding, cross-encoder, OCR) runs in worker threads via
+# asyncio.to_thread so the event loop stays free for requests waiting on remote LLMs.
+
+async def _session_owner(request, create=True):
+    """
+    Random token that marks resumes and saved searches as this browser session's (there
+    are no user accounts). None when the session has none and create is not set.
+    """
+    owner = await request.session.aget(OWNER_SESSION_KEY)
+    if not owner and create:
+        owner = secrets.token_hex(16)
+        await request.session.aset(OWNER_SESSION_KEY, owner)
+    return owner
+
+
+def _parse_salary(value):
+    value = (value or '').replace(' ', '').replace('\xa0', '')
+    return int(value) if value.isdigit() else None
+
+
+async def _search_filters(params, version=None):
+    """
+    Salary/city filters and the result order from the search form (POST) or the stream
+    URL (GET). version: the catalogue version, when the caller has read it already.
+    Returns (SearchFilters, error); a typed city that matches no known city is an error
+    rather than a filter that matches nothing.
+    """
+    city_names = [name.strip() for name in params.get('cities', '').split(',') if name.strip()]
+    city_ids = None
+    if city_names:
+        # Typed names in any case form ("Казани") or aliases ("СПб") resolve to canonical City ids
+        city_matcher = await aget_city_matcher(version)
+        codes = [city_matcher.match(name) for name in city_names]
+        unknown = [name for name, code in zip(city_names, codes) if code is None]
+        if unknown:
+            return None, f"Город не найден: {', '.join(unknown)}"
+        city_ids = set(codes)
+    return SearchFilters(
+        min_salary=_parse_salary(params.get('min_salary')),
+        max_salary=_parse_salary(params.get('max_salary')),
+        include_negotiable=bool(params.get('negotiable')),
+        city_ids=city_ids,
+        estimated=bool(params.get('estimated')),
+        sort_by_salary=params.get('sort') == 'salary',
+    ), None
+
+
+async def _text_search_state(user_query, selected_additions, filters, catalogue):
+    """
+    Embed the query. Returns (SearchState, error); the latency budget starts once the
+    query is embedded, so a model (re)load doesn't eat the ranking stages' time.
+    """
+    await aensure_query_model(catalogue)
+    with span('query_embedding'):
+        query_embedding, query_version = await asyncio.to_thread(embed_query, user_query)
+    if query_embedding is None:
+        return None, 'Не удалось обработать запрос'
+    deadline = Deadline(SEARCH_LATENCY_BUDGET)
+    return SearchState(user_query, query_embedding, selected_additions, deadline=deadline,
+                       filters=filters, query_version=query_version, catalogue=catalogue), None
+
+
+async def _fetch_jobs(ids):
+    """Load the displayed columns of the given jobs in one query, keyed by id."""
+    jobs_queryset = Job.objects.filter(id__in=ids).only(*JOB_CARD_FIELDS)
+    return {job.id: job async for job in jobs_queryset}
+
+
+def _ordered_jobs(ids, scores, jobs_dict):
+    """Job objects and rounded scores in ranking order, skipping deleted rows."""
+    final_jobs = []
+    scores_list = []
+    for i, job_id in enumerate(ids):
+        job_obj = jobs_dict.get(job_id)
+        if job_obj:
+            final_jobs.append(job_obj)
+            score = scores[i] if i < len(scores) else 0.0
+            scores_list.append(round(float(score), 4))
+    return final_jobs, scores_list
+
+
+async def _explain(user_query, job_obj):
+    with span('explanation', job_id=job_obj.id):
+        explanation = await aexplain_job_match(user_query, job_obj)
+    job_obj.explanation = explanation if explanation else EXPLANATION_FALLBACK
+    job_obj.explanation_ok = bool(explanation)
+    return job_obj
+
+
+async def _cached_results(cached):
+    """Rebuild ranked jobs from a cache entry, with the explanations that were stored."""
+    jobs_dict = await _fetch_jobs(cached['ids'])
+    final_jobs, scores_list = _ordered_jobs(cached['ids'], cached['scores'], jobs_dict)
+    for job_obj in final_jobs:
+        explanation = cached['explanations'].get(str(job_obj.id))
+        if explanation:
+            job_obj.explanation = explanation
+            job_obj.explanation_ok = True
+    return final_jobs, scores_list
 
 
-def main(request):
+def _missing_explanations(final_jobs):
+    return [job_obj for job_obj in final_jobs[:EXPLAINED_RESULTS]
+            if not getattr(job_obj, 'explanation_ok', False)]
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _render_cards(jobs):
+    with span('template_render', jobs=len(jobs)):
+        return "".join(render_to_string('neuralhire/job_card.html', {'job': job}) for job in jobs)
+
+
+async def main(request):
 
     if request.method != "POST":
         return render(request, 'neuralhire/index.html', {'additions': list_of_additions})
@@ -41,102 +183,132 @@ def main(request):
             'additions': list_of_additions
         })
 
-    query_embedding = embed_query(user_query)
-    if query_embedding is None:
-        return render(request, 'neuralhire/results.html', {'error': 'Не удалось обработать запрос'})
+    if STREAM_RESULTS:
+        params = [('knoladge', user_query)] + [(add, add) for add in selected_additions]
+        params += [(name, request.POST[name]) for name in FILTER_PARAMS if request.POST.get(name)]
+        return render(request, 'neuralhire/results.html', {
+            'user_query': user_query,
+            'stream_url': f"{reverse('main_stream')}?{urlencode(params)}",
+            'selected_additions': selected_additions,
+            'additions': list_of_additions,
+        })
 
-    query_vec = np.array(query_embedding)
-    jobs_data = list(Job.objects.filter(content_embedding__isnull=False)
-                     .values('id', 'content_embedding', 'addition', 'title', 'knoladge', 'city', 'company'))
+    # One read of the catalogue row serves the cache key, the query model and the fetch
+    catalogue = await aget_catalogue()
+    filters, error = await _search_filters(request.POST, catalogue.version)
+    if error:
+        return render(request, 'neuralhire/results.html', {
+            'error': error,
+            'additions': list_of_additions
+        })
+    cache_key = search_cache_key(user_query, selected_additions, catalogue.version, filters)
+    cached = await aget_cached_search(cache_key)
 
-    if not jobs_data:
-        return render(request, 'neuralhire/results.html', {'error': 'Нет вакансий с эмбеддингами'})
+    if cached:
+        final_jobs, scores_list = await _cached_results(cached)
+    else:
+        state, error = await _text_search_state(user_query, selected_additions, filters, catalogue)
+        if state:
+            await text_search_pipeline().run(state)
+            error = state.error
+        if error:
+            return render(request, 'neuralhire/results.html', {
+                'error': error,
+                'additions': list_of_additions
+            })
 
-    job_matrix = np.array([j['content_embedding'] for j in jobs_data])
-    embedding_scores = np.dot(job_matrix, query_vec)
+        final_jobs, scores_list = _ordered_jobs(state.ids, state.scores, await _fetch_jobs(state.ids))
 
-    combined_scores = []
-    for index, emb_score in enumerate(embedding_scores):
-        job_item = jobs_data[index]
+    # Generate explanations for top results concurrently
+    missing = _missing_explanations(final_jobs)
+    await asyncio.gather(*(_explain(user_query, job_obj) for job_obj in missing))
 
-        if selected_additions:
-            job_additions = job_item['addition'] if job_item['addition'] else ""
-            if not any(sel_add in job_additions for sel_add in selected_additions):
-                continue
+    if not cached or missing:
+        await aset_cached_search(cache_key, final_jobs, scores_list)
 
-        job_text = create_job_text(
-            job_item['title'], job_item['knoladge'],
-            job_item.get('city', ''), job_item.get('company', ''),
-            job_item.get('addition', '')
-        )
+    with span('template_render', jobs=len(final_jobs)):
+        return render(request, 'neuralhire/results.html', {
+            'user_query': user_query,
+            'jobs': final_jobs,
+            'scores': scores_list,
+            'zipped_results': zip(final_jobs, scores_list),
+            'selected_additions': selected_additions,
+            'additions': list_of_additions,
+            'comma_delimiter': ',',
+        })
 
-        keyword_boost = compute_keyword_boost(user_query, job_text)
-        final_score = emb_score + (keyword_boost * KEYWORD_BOOST_WEIGHT)
 
-        combined_scores.append({
-            'index': index, 'id': job_item['id'], 'score': final_score,
-            'job_text': job_text, 'title': job_item['title'],
-            'knoladge': job_item['knoladge'],
-            'city': job_item.get('city', ''), 'company': job_item.get('company', '')
-        })
+async def main_stream(request):
+    """
+    Server-sent events version of main.
+    Pushes the embedding-stage results as soon as vector search is done,
+    then the reranked order, then one event per generated explanation.
+    """
+    user_query = request.GET.get('knoladge', '').strip()
+    selected_additions = [add for add in list_of_additions if request.GET.get(add)]
 
-    combined_scores.sort(key=lambda x: x['score'], reverse=True)
-    candidates = combined_scores[:CANDIDATES_FOR_RERANK]
+    async def events():
+        if not user_query:
+            yield _sse('search-error', {'message': 'Введите описание вакансии или навыки'})
+            return
 
-    if not candidates:
-        return render(request, 'neuralhire/results.html', {
-            'error': 'Не найдено подходящих вакансий',
-            'additions': list_of_additions
-        })
+        catalogue = await aget_catalogue()
+        filters, error = await _search_filters(request.GET, catalogue.version)
+        if error:
+            yield _sse('search-error', {'message': error})
+            return
+        cache_key = search_cache_key(user_query, selected_additions, catalogue.version, filters)
+        cached = await aget_cached_search(cache_key)
 
-    candidate_texts = [c['job_text'] for c in candidates]
-    reranked = rerank_results(user_query, candidate_texts, top_k=CANDIDATES_FOR_CROSS_ENCODER)
+        if cached:
+            final_jobs, scores_list = await _cached_results(cached)
+            yield _sse('results', {'stage': 'cache', 'final': True, 'html': _render_cards(final_jobs)})
+        else:
+            state, error = await _text_search_state(user_query, selected_additions, filters, catalogue)
+            if error:
+                yield _sse('search-error', {'message': error})
+                return
 
-    reranked_candidates = [candidates[idx] for idx, _ in reranked]
-    reranked_scores = [score for _, score in reranked]
+            pipeline = text_search_pipeline()
+            jobs_dict = {}
+            async for stage in pipeline.iter_stages(state):
+                if stage.name in EARLY_RESULTS_STAGES:
+                    # One fetch covers both the early and the reranked top results
+                    jobs_dict = await _fetch_jobs(state.ids)
+                    # Early results are shown in the order the final ones will be (by salary if asked)
+                    positions = filters.top_positions(state, FINAL_RESULTS)
+                    first_jobs, _ = _ordered_jobs([state.ids[p] for p in positions], state.scores[positions],
+                                                  jobs_dict)
+                    yield _sse('results', {'stage': stage.name, 'final': False,
+                                           'html': _render_cards(first_jobs)})
+            if state.error:
+                yield _sse('search-error', {'message': state.error})
+                return
 
-    if USE_LLM_VALIDATION and len(reranked_candidates) > 0:
-        job_summaries = [create_job_summary(c['title'], c['knoladge'], c['city'], c['company'])
-                         for c in reranked_candidates]
-        llm_order = llm_validate_results(user_query, job_summaries, top_k=FINAL_RESULTS)
-        final_candidates = [reranked_candidates[i] for i in llm_order if i < len(reranked_candidates)]
-        final_scores = [reranked_scores[i] for i in llm_order if i < len(reranked_scores)]
-    else:
-        final_candidates = reranked_candidates[:FINAL_RESULTS]
-        final_scores = reranked_scores[:FINAL_RESULTS]
+            pipeline.finish(state)
+            final_jobs, scores_list = _ordered_jobs(state.ids, state.scores,
+                                                    jobs_dict or await _fetch_jobs(state.ids))
+            yield _sse('results', {'stage': 'final', 'final': True, 'html': _render_cards(final_jobs)})
 
-    top_ids = [c['id'] for c in final_candidates]
-    jobs_queryset = Job.objects.filter(id__in=top_ids)
-    jobs_dict = {job.id: job for job in jobs_queryset}
+        # Explanations are requested together and pushed in completion order
+        missing = _missing_explanations(final_jobs)
+        explanations = [_explain(user_query, job_obj) for job_obj in missing]
+        for finished in asyncio.as_completed(explanations):
+            job_obj = await finished
+            yield _sse('explanation', {'job_id': job_obj.id, 'html': _render_cards([job_obj])})
 
-    resume_context = user_query
-    print(final_candidates)
+        if not cached or missing:
+            await aset_cached_search(cache_key, final_jobs, scores_list)
 
-    for i, candidate in enumerate(final_candidates):
-        job_obj = jobs_dict.get(candidate['id'])
-        if job_obj:
-            # Generate explanation for top 3 results
-            if i < 3:
-                explanation = explain_job_match(resume_context, job_obj)
-                print(explanation)
-                job_obj.explanation = explanation if explanation else "Не удалось сгенерировать пояснение."
-            
-            final_jobs.append(job_obj)
-            score = final_scores[i] if i < len(final_scores) else 0.0
-            scores_list.append(round(float(score), 4))
+        yield _sse('done', {})
 
-    return render(request, 'neuralhire/results.html', {
-        'user_query': user_query,
-        'jobs': final_jobs,
-        'scores': scores_list,
-        'zipped_results': zip(final_jobs, scores_list),
-        'selected_additions': selected_additions,
-        'additions': list_of_additions,
-        'comma_delimiter': ',',
-    })
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
 
 
-def upload_resume(request):
+async def upload_resume(request):
     """Handle PDF resume upload and job matching."""
     if request.method != "POST":
         return render(request, 'neuralhire/index.html', {'additions': list_of_additions})
@@ -155,12 +327,21 @@ def upload_resume(request):
             'additions': list_of_additions
         })
     
+    # Filters are checked before the (slow) resume processing
+    catalogue = await aget_catalogue()
+    filters, error = await _search_filters(request.POST, catalogue.version)
+    if error:
+        return render(request, 'neuralhire/results.html', {
+            'error': error,
+            'additions': list_of_additions
+        })
+
     try:
-        file_path = default_storage.save(f'temp/{pdf_file.name}', pdf_file)
+        file_path = await sync_to_async(default_storage.save)(f'temp/{pdf_file.name}', pdf_file)
         full_path = default_storage.path(file_path)
         
-        resume_data = summarize_resume(full_path)
-        default_storage.delete(file_path)
+        resume_data = await asummarize_resume(full_path)
+        await sync_to_async(default_storage.delete)(file_path)
         
         if not resume_data:
             return render(request, 'neuralhire/results.html', {
@@ -173,114 +354,86 @@ def upload_resume(request):
         preferences = resume_data.get('preferences', '')
         full_summary = resume_data.get('full_summary', '')
         
-        summary_embedding = embed_query(full_summary)
+        # Summary plus the OCR chunks (or sections) of the resume, embedded in one batch
+        chunk_texts = resume_chunks(resume_data)
+        await aensure_query_model(catalogue)
+        with span('resume_embedding'):
+            chunk_matrix, query_version = await asyncio.to_thread(embed_texts_versioned, chunk_texts)
         
-        if summary_embedding is None:
+        if chunk_matrix is None:
             return render(request, 'neuralhire/results.html', {
                 'error': 'Не удалось создать эмбеддинг для резюме',
                 'additions': list_of_additions
             })
         
-        resume_obj = Resume.objects.create(
+        resume_obj = await Resume.objects.acreate(
             pdf_file=pdf_file,
             skills=skills,
             experience=experience,
             preferences=preferences,
             full_summary=full_summary,
-            summary_embedding=summary_embedding
+            owner=await _session_owner(request),
+            # The first chunk is the summary only when there is one
+            summary_embedding=chunk_matrix[0].tolist() if chunk_texts[0] == str(full_summary or '').strip() else None,
+            chunk_embeddings=chunk_matrix.tolist(),
+            embedding_version=query_version or '',
         )
         
-        query_vec = np.array(summary_embedding)
-        jobs_data = list(Job.objects.filter(content_embedding__isnull=False)
-                         .values('id', 'content_embedding', 'title', 'knoladge', 'city', 'company', 'addition'))
+        # Resume chunks retrieve candidates; the cross-encoder reranks them against the summary
+        selected_additions = [add for add in list_of_additions if request.POST.get(add)]
+        state = SearchState(full_summary or chunk_texts[0], chunk_matrix, selected_additions,
+                            filters=filters, query_version=query_version, catalogue=catalogue)
+        await resume_search_pipeline().run(state)
         
-        if not jobs_data:
+        if state.error:
             return render(request, 'neuralhire/results.html', {
-                'error': 'Нет вакансий с эмбеддингами',
+                'error': state.error,
                 'additions': list_of_additions
             })
         
-        job_matrix = np.array([j['content_embedding'] for j in jobs_data])
-        embedding_scores = np.dot(job_matrix, query_vec)
-        
-        scored_jobs = []
-        for index, score in enumerate(embedding_scores):
-            job_item = jobs_data[index]
-            scored_jobs.append({
-                'id': job_item['id'],
-                'score': float(score),
-                'title': job_item['title'],
-                'knoladge': job_item['knoladge'],
-                'city': job_item.get('city', ''),
-                'company': job_item.get('company', ''),
-                'addition': job_item.get('addition', '')
-            })
-        
-        scored_jobs.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Filter by selected additions
-        selected_additions = [add for add in list_of_additions if request.POST.get(add)]
-        if selected_additions:
-            filtered_jobs = []
-            for job in scored_jobs:
-                job_additions = job.get('addition', '')
-                if job_additions and any(sel_add in job_additions for sel_add in selected_additions):
-                    filtered_jobs.append(job)
-            scored_jobs = filtered_jobs
-        
-        top_candidates = scored_jobs[:FINAL_RESULTS]
-        top_ids = [c['id'] for c in top_candidates]
-        
-        jobs_queryset = Job.objects.filter(id__in=top_ids)
-        jobs_dict = {job.id: job for job in jobs_queryset}
-        
-        final_jobs = []
-        scores_list = []
-        
-        for candidate in top_candidates:
-            job_obj = jobs_dict.get(candidate['id'])
-            if job_obj:
-                final_jobs.append(job_obj)
-                scores_list.append(round(candidate['score'], 4))
+        jobs_dict = await _fetch_jobs(state.ids)
+        final_jobs, scores_list = _ordered_jobs(state.ids, state.scores, jobs_dict)
         
-        # Extract resume crops (Hardcoded keywords logic is inside extract_resume_crops)
+        # Cities the resume mentions (any case form), matched against each job's City id.
+        # The crop shows where the resume names the city of a job.
+        city_matcher = await aget_city_matcher(catalogue.version)
+        resume_cities = city_matcher.find_in_text(f"{preferences} {full_summary}")
+        city_forms = {form: city_matcher.names[code]
+                      for code in resume_cities for form in city_matcher.variants_of(code)}
+
         crops_dir = os.path.join(default_storage.location, 'crops')
         job_crops = {}
-        # We just pass an empty list or dummy since the logic is hardcoded inside the function as per user request
-        crops = extract_resume_crops(resume_obj.pdf_file.path, [], crops_dir)
-        print(crops)
-        
-        # If we found crops, associate them with top jobs for display (simplified logic)
-        # Since we don't have per-job unique keywords (we only check for hardcoded ones like 'Moscow'),
-        # we can just attach the crop to all jobs or the first one if found.
-        # The previous logic attached specific crops to specific jobs based on the explanation.
-        # Here we just show the crop if found.
-        if crops and 'Москву' in crops:
-            crop_abs_path = crops['Москву']
-            crop_rel_path = os.path.relpath(crop_abs_path, default_storage.location)
-            # Assign to ALL top jobs to ensure it's visible? Or just first?
-            # User dashboard expects job_crops[job.id] = path
-            for job in final_jobs:
-                job_crops[job.id] = crop_rel_path
+        crops = {}
+        if city_forms:
+            with span('ocr'):
+                crops = await asyncio.to_thread(extract_resume_crops, resume_obj.pdf_file.path,
+                                                city_forms, crops_dir)
+        logger.info('resume crops found: %s', crops)
+
+        for job in final_jobs:
+            city_name = city_matcher.names.get(job.city_ref_id)
+            if city_name in crops:
+                job_crops[job.id] = os.path.relpath(crops[city_name], default_storage.location)
         
         if job_crops:
             resume_obj.crop_data = job_crops
-            resume_obj.save()
+            await resume_obj.asave(update_fields=['crop_data'])
         
-        return render(request, 'neuralhire/results.html', {
-            'jobs': final_jobs,
-            'scores': scores_list,
-            'zipped_results': zip(final_jobs, scores_list),
-            'resume_summary': {
-                'skills': skills,
-                'experience': experience,
-                'preferences': preferences,
-                'full_summary': full_summary
-            },
-            'job_explanations': [],
-            'job_crops': job_crops,
-            'additions': list_of_additions,
-        })
+        with span('template_render', jobs=len(final_jobs)):
+            return render(request, 'neuralhire/results.html', {
+                'jobs': final_jobs,
+                'scores': scores_list,
+                'zipped_results': zip(final_jobs, scores_list),
+                'resume_summary': {
+                    'skills': skills,
+                    'experience': experience,
+                    'preferences': preferences,
+                    'full_summary': full_summary
+                },
+                'job_explanations': [],
+                'job_crops': job_crops,
+                'additions': list_of_additions,
+            })
         
     except Exception as e:
         import traceback
@@ -288,4 +441,73 @@ def upload_resume(request):
         return render(request, 'neuralhire/results.html', {
             'error': f'Произошла ошибка при обработке резюме: {str(e)}',
             'additions': list_of_additions
-        })
\ No newline at end of file
+        })
+
+
+async def save_search(request):
+    """
+    Save the query (or a resume this session uploaded, by id) with its filters; jobs
+    imported from now on that match it are recorded by check_jobs. A JSON API: no page
+    links to it yet, clients POST the search form fields (plus `resume`) themselves.
+    A resume search is scored with the resume's chunk vectors, as upload_resume scores it.
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'POST required'}, status=405)
+
+    owner = await _session_owner(request)
+    user_query = request.POST.get('knoladge', '').strip()
+    resume = None
+    resume_id = request.POST.get('resume', '')
+    if resume_id.isdigit():
+        # Another session's resume is treated as missing
+        resume = await Resume.objects.only('id', 'skills', 'experience', 'preferences', 'full_summary',
+                                           *RESUME_VECTOR_FIELDS).filter(pk=int(resume_id), owner=owner).afirst()
+        if resume is None:
+            return JsonResponse({'error': 'Резюме не найдено'}, status=404)
+    if not user_query and resume is None:
+        return JsonResponse({'error': 'Введите описание вакансии или навыки'}, status=400)
+
+    catalogue = await aget_catalogue()
+    await aensure_query_model(catalogue)
+    if resume is not None and not user_query and resume_vectors_stale(resume, catalogue.embedding_version):
+        # Uploaded before a cutover: its chunks are re-embedded with the live model
+        with span('resume_embedding'):
+            await asyncio.to_thread(embed_resume, resume)
+        await resume.asave(update_fields=RESUME_VECTOR_FIELDS)
+    with span('query_embedding'):
+        vector, embedding_version = await asyncio.to_thread(embed_saved_search, user_query, resume)
+    if vector is None:
+        return JsonResponse({'error': 'Не удалось обработать запрос'}, status=400)
+
+    filters, error = await _search_filters(request.POST, catalogue.version)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    saved = await acreate_saved_search(user_query, resume, filters, vector, embedding_version, owner)
+    return JsonResponse({'id': saved.id, 'matches_url': reverse('saved_search_matches', args=[saved.id])})
+
+
+async def saved_search_matches(request, pk):
+    """
+    New jobs recorded for a saved search of this session, best first within each run.
+    A JSON API like save_search (the `matches_url` it returns); no page renders it yet.
+    """
+    owner = await _session_owner(request, create=False)
+    # Another session's search is not found rather than forbidden, so ids can't be probed
+    if not owner or not await SavedSearch.objects.filter(pk=pk, owner=owner).aexists():
+        return JsonResponse({'error': 'Сохранённый поиск не найден'}, status=404)
+    matches = SavedSearchMatch.objects.filter(saved_search_id=pk).select_related('job').only(
+        'score', 'created_at', 'vacancy', 'job__id', 'job__title', 'job__company', 'job__city', 'job__link'
+    )
+    return JsonResponse({'matches': [
+        {
+            'job_id': match.job_id, 'score': round(match.score, 4), 'created_at': match.created_at.isoformat(),
+            'title': match.job.title if match.job else None, 'company': match.job.company if match.job else None,
+            'city': match.job.city if match.job else None, 'link': match.job.link if match.job else None,
+        }
+        async for match in matches[:100]
+    ]})
+
+
+def metrics(request):
+    """Prometheus scrape endpoint for the stage timings of this worker process."""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
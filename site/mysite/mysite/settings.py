@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -75,6 +76,10 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
+# Connections persist between requests (DB_CONN_MAX_AGE seconds, checked before reuse).
+# With psycopg 3 installed, DB_POOL=1 uses a connection pool per worker instead.
+
+DB_POOL = os.environ.get('DB_POOL') == '1'
 
 DATABASES={
    'default':{
@@ -84,9 +89,59 @@ DATABASES={
       'PASSWORD':'123',
       'HOST':'localhost',
       'PORT':'5433',
+      # A pool manages connection lifetimes itself; Django requires CONN_MAX_AGE = 0 with one
+      'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+      'CONN_HEALTH_CHECKS': True,
    }
 }
 
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {'min_size': 2, 'max_size': int(os.environ.get('DB_POOL_SIZE', 10))},
+    }
+
+
+# Cache
+# Search results are cached per query and catalogue version (NeuralHire/search_cache.py).
+# Local memory works for a single process; set REDIS_URL to share the cache between workers.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'neuralhire-search',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+
+# Logging
+# Stage timings from utils/instrumentation.py are written as one JSON object per line.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'utils.instrumentation.JsonFormatter'},
+    },
+    'handlers': {
+        'json_console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'neuralhire': {'handlers': ['json_console'], 'level': 'INFO', 'propagate': False},
+        'NeuralHire': {'handlers': ['json_console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -129,6 +184,9 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Memory-mapped job embedding snapshots (manage.py export_snapshot), shared by the workers of a host
+EMBEDDING_SNAPSHOT_DIR = Path(os.environ.get('EMBEDDING_SNAPSHOT_DIR', BASE_DIR / 'snapshots'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
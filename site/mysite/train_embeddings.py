@@ -1,24 +1,49 @@
+import argparse
+import hashlib
 import os
+import random
+import re
+import tempfile
+import time
+import numpy as np
 import pandas as pd
 import torch
-from torch.utils.data import DataLoader
-from sentence_transformers import SentenceTransformer, InputExample, losses, models, evaluation
-from utils.embeddings import create_job_text
+from sentence_transformers import SentenceTransformer, models
+from transformers import AutoModel, AutoTokenizer, BertModel, BertTokenizerFast
+from utils.embeddings import EMBEDDING_DIM, create_job_text
 
 # Configuration
 TEACHER_MODEL_NAME = 'intfloat/multilingual-e5-base' # 768 dim, matches BERT base
 STUDENT_MODEL_NAME = 'bert-base-multilingual-cased'
 BATCH_SIZE = 16
+ACCUMULATION_STEPS = 4  # Optimizer step every 4 batches: an effective batch of 64
 EPOCHS = 3
+LEARNING_RATE = 2e-5
+BUCKET_WINDOW = 50  # Batches per length bucket: texts are sorted by length within random windows
 OUTPUT_PATH = 'site/mysite/fine_tuned_bert'
 DATA_PATH = 'model/jobs.csv'
+TEACHER_CACHE_DIR = 'model/teacher_cache'
 
-def train():
+# Smaller student: keep evenly spaced layers of the base model, optionally a narrower
+# hidden size (weights sliced from the base) projected back to EMBEDDING_DIM, and
+# optionally only the Cyrillic/Latin part of the 120k-token multilingual vocabulary
+HEAD_SIZE = 64
+PRUNED_TOKEN_RE = re.compile(r'^(?:##)?[0-9A-Za-zÀ-ɏА-Яа-яЁё_\W]+$')
+EVAL_QUERIES = 200  # Job titles used as queries for the latency and recall report
+EVAL_K = 10
+HOLDOUT_FRACTION = 0.1  # Jobs kept out of training; the recall report ranks only these
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def load_texts():
     print(f"Loading data from {DATA_PATH}...")
     df = pd.read_csv(DATA_PATH)
-    
-    # Prepare training texts
-    train_texts = []
+
+    # Prepare training texts (titles double as queries for the evaluation)
+    texts = {}  # Job text -> its title
     print("Preparing training examples...")
     for _, row in df.iterrows():
         # Construct text exactly as the app does
@@ -30,91 +55,312 @@ def train():
             additions=str(row.get('addition', ''))
         )
         if text.strip():
-            train_texts.append(text)
-            
-    print(f"Collected {len(train_texts)} training examples.")
-    
-    # Initialize models
-    print(f"Loading Teacher: {TEACHER_MODEL_NAME}...")
-    teacher_model = SentenceTransformer(TEACHER_MODEL_NAME)
-    
+            # The same vacancy listed twice would only be encoded (and weighted) twice
+            texts.setdefault(text, str(row.get('title', '')))
+
+    print(f"Collected {len(texts)} training examples.")
+    return list(texts), list(texts.values())
+
+
+def holdout_split(texts, titles, fraction=HOLDOUT_FRACTION, seed=0):
+    """
+    (training texts, held-out texts, held-out titles): a seeded random `fraction` of the
+    jobs is never trained on, so evaluate() measures the student on unseen jobs.
+    """
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    held_out = set(order[:max(1, int(len(texts) * fraction))])
+    train_texts = [text for i, text in enumerate(texts) if i not in held_out]
+    held_out_texts = [texts[i] for i in sorted(held_out)]
+    held_out_titles = list(dict.fromkeys(
+        titles[i] for i in sorted(held_out) if titles[i].strip() and titles[i] != 'nan'))
+    return train_texts, held_out_texts, held_out_titles
+
+
+def teacher_targets(texts, use_cache=True, prefix='passage: '):
+    """
+    Teacher embeddings for the texts. They are cached on disk keyed by the hash of the
+    teacher input (one file per teacher model), so a rerun only encodes texts the
+    teacher hasn't seen. e5 wants "passage: " for jobs and "query: " for queries.
+    """
+    cache_path = os.path.join(TEACHER_CACHE_DIR, TEACHER_MODEL_NAME.replace('/', '__') + '.npz')
+    cached = {}
+    if use_cache and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            cached = dict(zip(data['keys'].tolist(), data['embeddings']))
+        print(f"Loaded {len(cached)} cached teacher embeddings from {cache_path}")
+
+    keys = [text_key(prefix + t) for t in texts]
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        print(f"Loading Teacher: {TEACHER_MODEL_NAME}...")
+        teacher_model = SentenceTransformer(TEACHER_MODEL_NAME)
+        print(f"Generating teacher embeddings for {len(missing)} new texts...")
+        teacher_inputs = [prefix + texts[i] for i in missing]
+        with torch.no_grad():
+            encoded = teacher_model.encode(teacher_inputs, show_progress_bar=True, convert_to_numpy=True)
+        for i, embedding in zip(missing, encoded):
+            cached[keys[i]] = embedding.astype(np.float32)
+
+        if use_cache:
+            os.makedirs(TEACHER_CACHE_DIR, exist_ok=True)
+            tmp_path = cache_path + '.tmp.npz'
+            np.savez(tmp_path, keys=np.array(list(cached), dtype='S40'),
+                     embeddings=np.stack(list(cached.values())))
+            os.replace(tmp_path, cache_path)
+
+    return np.stack([cached[key] for key in keys]).astype(np.float32)
+
+
+def student_layers(total, layers):
+    """Indices of `layers` evenly spaced layers out of `total`, always keeping the last one."""
+    if not layers or layers >= total:
+        return list(range(total))
+    if layers == 1:
+        return [total - 1]
+    return sorted({round(i * (total - 1) / (layers - 1)) for i in range(layers)})
+
+
+def pruned_vocabulary(tokenizer):
+    """Ids of the Cyrillic/Latin/digit/punctuation tokens and the special tokens, ascending."""
+    special = set(tokenizer.all_special_ids)
+    return [token_id for token, token_id in sorted(tokenizer.get_vocab().items(), key=lambda item: item[1])
+            if token_id in special or PRUNED_TOKEN_RE.match(token)]
+
+
+def build_student(layers=None, hidden_size=None, prune_vocab=False):
+    """
+    A SentenceTransformer smaller than the base model: its weights are copied (sliced
+    to the smaller shapes) from the chosen layers and kept tokens of the base, mean
+    pooled, and projected to EMBEDDING_DIM when the hidden size is reduced.
+    """
+    if not layers and not hidden_size and not prune_vocab:
+        return SentenceTransformer(STUDENT_MODEL_NAME)
+    base = AutoModel.from_pretrained(STUDENT_MODEL_NAME)
+    tokenizer = AutoTokenizer.from_pretrained(STUDENT_MODEL_NAME)
+
+    config = base.config.__class__.from_dict(base.config.to_dict())
+    keep_layers = student_layers(config.num_hidden_layers, layers)
+    config.num_hidden_layers = len(keep_layers)
+    if hidden_size:
+        config.hidden_size = hidden_size
+        config.intermediate_size = 4 * hidden_size
+        config.num_attention_heads = max(1, hidden_size // HEAD_SIZE)
+
+    work_dir = tempfile.mkdtemp(prefix='student-')
+    keep_tokens = None
+    if prune_vocab:
+        keep_tokens = pruned_vocabulary(tokenizer)
+        vocab = {token_id: token for token, token_id in tokenizer.get_vocab().items()}
+        vocab_file = os.path.join(work_dir, 'vocab.txt')
+        with open(vocab_file, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(vocab[token_id] for token_id in keep_tokens) + '\n')
+        tokenizer = BertTokenizerFast(vocab_file=vocab_file, do_lower_case=False, strip_accents=False)
+        config.vocab_size = len(keep_tokens)
+        print(f"Vocabulary pruned to {len(keep_tokens)} of {len(vocab)} tokens")
+
+    student = BertModel(config)
+    source = base.state_dict()
+    layer_re = re.compile(r'encoder\.layer\.(\d+)\.')
+    with torch.no_grad():
+        for name, param in student.state_dict().items():
+            source_name = layer_re.sub(lambda m: f"encoder.layer.{keep_layers[int(m.group(1))]}.", name)
+            if source_name not in source:
+                continue
+            weight = source[source_name]
+            if keep_tokens is not None and name.endswith('word_embeddings.weight'):
+                weight = weight[keep_tokens]
+            param.copy_(weight[tuple(slice(0, size) for size in param.shape)])
+
+    student.save_pretrained(work_dir)
+    tokenizer.save_pretrained(work_dir)
+    transformer = models.Transformer(work_dir)
+    modules = [transformer, models.Pooling(config.hidden_size, pooling_mode='mean')]
+    if config.hidden_size != EMBEDDING_DIM:
+        modules.append(models.Dense(config.hidden_size, EMBEDDING_DIM, activation_function=torch.nn.Identity()))
+    model = SentenceTransformer(modules=modules)
+    print(f"Student: {config.num_hidden_layers} layers (of base {keep_layers}), hidden {config.hidden_size}, "
+          f"{sum(p.numel() for p in model.parameters()) / 1e6:.0f}M parameters "
+          f"(base {sum(p.numel() for p in base.parameters()) / 1e6:.0f}M)")
+    return model
+
+
+def encode_queries(model, queries):
+    """Query vectors, one query at a time as the views encode, and the seconds each took."""
+    model.eval()
+    vectors, timings = [], []
+    with torch.no_grad():
+        for query in queries:
+            start = time.perf_counter()
+            vectors.append(model.encode(query, normalize_embeddings=True, convert_to_numpy=True))
+            timings.append(time.perf_counter() - start)
+    return np.stack(vectors), timings
+
+
+def evaluate(student_model, texts, titles, seed=0, use_cache=True):
+    """
+    Query-embedding latency of the student next to the base model it was cut from, and
+    recall@EVAL_K of its job ranking against the teacher's for job-title queries. texts
+    and titles are the held-out jobs, which the student was not trained on.
+    """
+    rng = random.Random(seed)
+    queries = rng.sample(titles, min(EVAL_QUERIES, len(titles)))
+    teacher_queries = teacher_targets(queries, use_cache=use_cache, prefix='query: ')
+    teacher_jobs = teacher_targets(texts, use_cache=use_cache)
+
+    with torch.no_grad():
+        student_jobs = student_model.encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+    student_queries, timings = encode_queries(student_model, queries)
+    _, base_timings = encode_queries(SentenceTransformer(STUDENT_MODEL_NAME, device='cpu'), queries)
+
+    teacher_top = np.argsort(-(teacher_queries @ teacher_jobs.T), axis=1)[:, :EVAL_K]
+    student_top = np.argsort(-(student_queries @ student_jobs.T), axis=1)[:, :EVAL_K]
+    recall = np.mean([len(set(t) & set(s)) / EVAL_K for t, s in zip(teacher_top, student_top)])
+    print(f"Query embedding on {torch.get_num_threads()} threads: "
+          f"student p50 {1000 * np.percentile(timings, 50):.1f} ms, p95 {1000 * np.percentile(timings, 95):.1f} ms; "
+          f"base {STUDENT_MODEL_NAME} p50 {1000 * np.percentile(base_timings, 50):.1f} ms, "
+          f"p95 {1000 * np.percentile(base_timings, 95):.1f} ms")
+    print(f"Recall@{EVAL_K} against the teacher ranking: {recall:.3f} "
+          f"({len(queries)} title queries over {len(texts)} held-out jobs)")
+
+
+def pretokenize(student_model, texts):
+    """Token ids of every text, truncated to the student's max length, without padding."""
+    tokenizer = student_model.tokenizer
+    encoded = tokenizer(texts, truncation=True, max_length=student_model.get_max_seq_length(),
+                        padding=False, return_attention_mask=False, return_token_type_ids=False)
+    return encoded['input_ids']
+
+
+def length_bucketed_batches(lengths, batch_size, rng):
+    """
+    Batches of similar-length texts, so padding stays small: indices are shuffled,
+    sorted by length within windows of BUCKET_WINDOW batches, cut into batches, and
+    the batch order is shuffled again.
+    """
+    indices = list(range(len(lengths)))
+    rng.shuffle(indices)
+    window = batch_size * BUCKET_WINDOW
+    batches = []
+    for start in range(0, len(indices), window):
+        chunk = sorted(indices[start:start + window], key=lambda i: lengths[i])
+        batches.extend(chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size))
+    rng.shuffle(batches)
+    return batches
+
+
+def collate(token_ids, batch, pad_token_id, device):
+    """Pad one batch to its own longest text."""
+    width = max(len(token_ids[i]) for i in batch)
+    input_ids = torch.full((len(batch), width), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+    for row, i in enumerate(batch):
+        input_ids[row, :len(token_ids[i])] = torch.tensor(token_ids[i])
+        attention_mask[row, :len(token_ids[i])] = 1
+    return {
+        'input_ids': input_ids.to(device),
+        'attention_mask': attention_mask.to(device),
+        'token_type_ids': torch.zeros_like(input_ids).to(device),
+    }
+
+
+def train(batch_size=BATCH_SIZE, accumulation_steps=ACCUMULATION_STEPS, epochs=EPOCHS, bf16=False,
+          use_cache=True, seed=0, layers=None, hidden_size=None, prune_vocab=False, output_path=OUTPUT_PATH):
+    train_texts, held_out_texts, held_out_titles = holdout_split(*load_texts(), seed=seed)
+    print(f"{len(held_out_texts)} jobs held out for evaluation.")
+    teacher_embeddings = torch.from_numpy(teacher_targets(train_texts, use_cache=use_cache))
+
     print(f"Loading Student: {STUDENT_MODEL_NAME}...")
     # Use simple SentenceTransformer wrapper for Student too
-    student_model = SentenceTransformer(STUDENT_MODEL_NAME)
-    
-    # Generate Teacher Embeddings (Targets)
-    print("Generating teacher embeddings (this may take a while)...")
-    # e5 requires "passage: " prefix
-    teacher_inputs = [f"passage: {t}" for t in train_texts]
-    with torch.no_grad():
-        teacher_embeddings = teacher_model.encode(teacher_inputs, show_progress_bar=True, convert_to_numpy=True)
-    
-    # Create InputExamples for Distillation (text -> target_embedding)
-    # We treat this as a regression task: Input is text, label is the float vector
-    # SentenceTransformer doesn't have a direct "Distillation" reader, but we can use standard inputs
-    # However, standard losses expect labels to be class ints or similarity floats, NOT full vectors.
-    # We will implement a custom loop or use a dataset that returns (text, embedding) and custom loss.
-    
-    # Actually, simpler: Use PyTorch directly for the training loop over the student model
-    # SentenceTransformer is just a nn.Module.
-    
+    student_model = build_student(layers=layers, hidden_size=hidden_size, prune_vocab=prune_vocab)
+
+    # Tokenised once: the training loop only pads and stacks
+    # Note: student does NOT use prefixes
+    token_ids = pretokenize(student_model, train_texts)
+    lengths = [len(ids) for ids in token_ids]
+    pad_token_id = student_model.tokenizer.pad_token_id
+
+    # We treat this as a regression task: Input is text, label is the teacher's vector.
+    # SentenceTransformer is just a nn.Module, so a plain PyTorch loop trains it.
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Training on {device}...")
+    print(f"Training on {device}" + (" with bf16 autocast" if bf16 else "") +
+          f", batch {batch_size} x {accumulation_steps} accumulation steps...")
     student_model.to(device)
     student_model.train()
-    
-    # Create DataLoader
-    class DistillationDataset(torch.utils.data.Dataset):
-        def __init__(self, texts, targets):
-            self.texts = texts
-            self.targets = targets
-            
-        def __len__(self):
-            return len(self.texts)
-            
-        def __getitem__(self, idx):
-            return self.texts[idx], self.targets[idx]
-
-    dataset = DistillationDataset(train_texts, teacher_embeddings)
-    dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True)
-    
-    optimizer = torch.optim.AdamW(student_model.parameters(), lr=2e-5)
+
+    optimizer = torch.optim.AdamW(student_model.parameters(), lr=LEARNING_RATE)
     loss_fn = torch.nn.MSELoss()
-    
-    for epoch in range(EPOCHS):
+    rng = random.Random(seed)
+
+    for epoch in range(epochs):
+        batches = length_bucketed_batches(lengths, batch_size, rng)
         total_loss = 0
         steps = 0
-        for batch_texts, batch_targets in dataloader:
-            optimizer.zero_grad()
-            
-            # Tokenize and compute student embeddings
-            # Note: student does NOT use prefixes
-            features = student_model.tokenize(batch_texts)
-            for key in features:
-                features[key] = features[key].to(device)
-                
-            student_output = student_model(features)['sentence_embedding']
-            
-            # Move targets
-            targets = batch_targets.to(device)
-            
-            # MSE Loss
-            loss = loss_fn(student_output, targets)
-            loss.backward()
-            optimizer.step()
-            
-            total_loss += loss.item()
+        examples = tokens = padded = 0
+        start = time.perf_counter()
+        optimizer.zero_grad()
+
+        for batch in batches:
+            features = collate(token_ids, batch, pad_token_id, device)
+            targets = teacher_embeddings[batch].to(device)
+
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=bf16):
+                student_output = student_model(features)['sentence_embedding']
+            # MSE Loss (in float32), averaged over the accumulated batches
+            loss = loss_fn(student_output.float(), targets)
+            (loss / accumulation_steps).backward()
+
             steps += 1
-            
+            if steps % accumulation_steps == 0 or steps == len(batches):
+                optimizer.step()
+                optimizer.zero_grad()
+
+            total_loss += loss.item()
+            examples += len(batch)
+            tokens += int(features['attention_mask'].sum())
+            padded += features['attention_mask'].numel()
+
             if steps % 10 == 0:
-                print(f"Epoch {epoch+1}, Step {steps}, Loss: {loss.item():.4f}")
-                
-        avg_loss = total_loss / steps
+                print(f"Epoch {epoch+1}, Step {steps}/{len(batches)}, Loss: {loss.item():.4f}")
+
+        seconds = time.perf_counter() - start
+        avg_loss = total_loss / max(steps, 1)
         print(f"Epoch {epoch+1} Complete. Average Loss: {avg_loss:.4f}")
-        
-    print(f"Saving fine-tuned model to {OUTPUT_PATH}...")
-    student_model.save(OUTPUT_PATH)
+        print(f"  {examples / seconds:.1f} examples/s, {tokens / seconds:.0f} tokens/s, "
+              f"{1 - tokens / max(padded, 1):.1%} padding, {seconds:.0f} s")
+
+    print(f"Saving fine-tuned model to {output_path}...")
+    student_model.save(output_path)
+
+    student_model.to('cpu')
+    evaluate(student_model, held_out_texts, held_out_titles, seed=seed, use_cache=use_cache)
+    if os.path.abspath(output_path) != os.path.abspath(OUTPUT_PATH):
+        # A different model directory gets new vectors without interrupting search
+        print(f"Roll it out with: manage.py reembed_jobs --shadow --model {os.path.abspath(output_path)}, "
+              f"then manage.py cutover_embeddings --model {os.path.abspath(output_path)}")
     print("Done!")
 
+
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description='Distil the e5 teacher into the BERT student')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--accumulation-steps', type=int, default=ACCUMULATION_STEPS)
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--bf16', action='store_true', help='bf16 autocast (CPUs with AVX512-BF16/AMX gain most)')
+    parser.add_argument('--no-cache', action='store_true', help='Re-encode every text with the teacher')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--layers', type=int, default=None,
+                        help='Keep this many evenly spaced encoder layers of the base model (e.g. 4 or 6)')
+    parser.add_argument('--hidden-size', type=int, default=None,
+                        help='Narrower hidden size (a multiple of 64), projected back to 768 dimensions')
+    parser.add_argument('--prune-vocab', action='store_true',
+                        help='Keep only Cyrillic/Latin/digit/punctuation tokens of the vocabulary')
+    parser.add_argument('--output', default=OUTPUT_PATH, help=f'Model directory (default: {OUTPUT_PATH})')
+    args = parser.parse_args()
+    if args.hidden_size is not None and (args.hidden_size <= 0 or args.hidden_size % HEAD_SIZE
+                                         or args.hidden_size > EMBEDDING_DIM):
+        # Attention heads stay HEAD_SIZE wide, and the weights are sliced from the 768-wide base
+        parser.error(f'--hidden-size must be a positive multiple of {HEAD_SIZE} up to {EMBEDDING_DIM}')
+    train(batch_size=args.batch_size, accumulation_steps=args.accumulation_steps, epochs=args.epochs,
+          bf16=args.bf16, use_cache=not args.no_cache, seed=args.seed, layers=args.layers,
+          hidden_size=args.hidden_size, prune_vocab=args.prune_vocab, output_path=args.output)
@@ -0,0 +1,43 @@
+# utils/async_http.py
+import asyncio
+import weakref
+import httpx
+
+# Remote model calls (Qwen via DashScope, local Ollama) share one pooled client
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+
+# Pooled connections belong to the event loop that opened them, so keep one client
+# per loop. Under ASGI that is a single client per worker; under WSGI/runserver every
+# async view runs in its own short-lived loop, and the client is closed with it.
+_clients = weakref.WeakKeyDictionary()  # loop -> (client, closer)
+
+
+async def _close_with_loop(client):
+    """
+    Stays suspended at its yield while the loop runs. asyncio.run (and asgiref's
+    async_to_sync, which uses it) finalises the loop's async generators before
+    closing the loop, which runs the finally clause and closes the client.
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+        # The generator references the loop (its finalizer), so drop the entry explicitly
+        _clients.pop(asyncio.get_running_loop(), None)
+
+
+def get_async_http_client():
+    """Return the pooled httpx.AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        closer = _close_with_loop(client)
+        try:
+            # First step: registers the generator with the running loop and stops at the yield
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        entry = _clients[loop] = (client, closer)
+    return entry[0]
@@ -3,6 +3,8 @@ import pytesseract
 from pdf2image import convert_from_path
 from transformers import pipeline
 from pathlib import Path
+from utils.embeddings import split_resume_sections
+from utils.instrumentation import span
 
 # Initialize summarization pipeline
 # Using a multilingual model suitable for Russian/English
@@ -26,16 +28,19 @@ def ocr_pdf(pdf_path):
     Extract text from PDF using OCR (Tesseract).
     """
     try:
-        images = convert_from_path(pdf_path)
+        with span('pdf_render'):
+            images = convert_from_path(pdf_path)
         full_text = ""
-        for img in images:
-            text = pytesseract.image_to_string(img, lang='rus+eng')
-            full_text += text + "\n"
+        with span('ocr', pages=len(images)):
+            for img in images:
+                text = pytesseract.image_to_string(img, lang='rus+eng')
+                full_text += text + "\n"
         return full_text
     except Exception as e:
         print(f"Error in OCR: {e}")
         return ""
 
+
 def summarize_resume(pdf_path):
     """
     Extract text from PDF and summarize it using BERT/BART.
@@ -68,11 +73,13 @@ def summarize_resume(pdf_path):
         # 3. Return generic structure
         # Since we don't have structured extraction anymore, we put everything in full_summary
         # and leave others empty or repeated.
+        # 'chunks' covers the whole OCR text, not only the summarised first 4000 chars.
         return {
             'skills': 'См. полное резюме (extracted via BERT)',
             'experience': 'См. полное резюме (extracted via BERT)',
             'preferences': 'См. полное резюме (extracted via BERT)',
-            'full_summary': summary_text
+            'full_summary': summary_text,
+            'chunks': split_resume_sections(full_text)
         }
 
     except Exception as e:
@@ -0,0 +1,297 @@
+# utils/cities.py
+import re
+
+# Canonical cities seeded into the City table: (name, region).
+# Earlier entries win when two cities share an inflected form.
+CITIES = [
+    ('Москва', 'Москва'),
+    ('Санкт-Петербург', 'Санкт-Петербург'),
+    ('Новосибирск', 'Новосибирская область'),
+    ('Екатеринбург', 'Свердловская область'),
+    ('Казань', 'Республика Татарстан'),
+    ('Нижний Новгород', 'Нижегородская область'),
+    ('Челябинск', 'Челябинская область'),
+    ('Красноярск', 'Красноярский край'),
+    ('Самара', 'Самарская область'),
+    ('Уфа', 'Республика Башкортостан'),
+    ('Ростов-на-Дону', 'Ростовская область'),
+    ('Омск', 'Омская область'),
+    ('Краснодар', 'Краснодарский край'),
+    ('Воронеж', 'Воронежская область'),
+    ('Пермь', 'Пермский край'),
+    ('Волгоград', 'Волгоградская область'),
+    ('Саратов', 'Саратовская область'),
+    ('Тюмень', 'Тюменская область'),
+    ('Тольятти', 'Самарская область'),
+    ('Ижевск', 'Удмуртская Республика'),
+    ('Барнаул', 'Алтайский край'),
+    ('Ульяновск', 'Ульяновская область'),
+    ('Иркутск', 'Иркутская область'),
+    ('Хабаровск', 'Хабаровский край'),
+    ('Ярославль', 'Ярославская область'),
+    ('Владивосток', 'Приморский край'),
+    ('Махачкала', 'Республика Дагестан'),
+    ('Томск', 'Томская область'),
+    ('Оренбург', 'Оренбургская область'),
+    ('Кемерово', 'Кемеровская область'),
+    ('Новокузнецк', 'Кемеровская область'),
+    ('Рязань', 'Рязанская область'),
+    ('Набережные Челны', 'Республика Татарстан'),
+    ('Астрахань', 'Астраханская область'),
+    ('Пенза', 'Пензенская область'),
+    ('Киров', 'Кировская область'),
+    ('Липецк', 'Липецкая область'),
+    ('Чебоксары', 'Чувашская Республика'),
+    ('Калининград', 'Калининградская область'),
+    ('Тула', 'Тульская область'),
+    ('Курск', 'Курская область'),
+    ('Ставрополь', 'Ставропольский край'),
+    ('Сочи', 'Краснодарский край'),
+    ('Тверь', 'Тверская область'),
+    ('Иваново', 'Ивановская область'),
+    ('Брянск', 'Брянская область'),
+    ('Белгород', 'Белгородская область'),
+    ('Сургут', 'Ханты-Мансийский автономный округ'),
+    ('Владимир', 'Владимирская область'),
+    ('Архангельск', 'Архангельская область'),
+    ('Чита', 'Забайкальский край'),
+    ('Калуга', 'Калужская область'),
+    ('Смоленск', 'Смоленская область'),
+    ('Волжский', 'Волгоградская область'),
+    ('Курган', 'Курганская область'),
+    ('Орел', 'Орловская область'),
+    ('Вологда', 'Вологодская область'),
+    ('Мурманск', 'Мурманская область'),
+    ('Тамбов', 'Тамбовская область'),
+    ('Кострома', 'Костромская область'),
+    ('Якутск', 'Республика Саха (Якутия)'),
+    ('Симферополь', 'Республика Крым'),
+    ('Великий Новгород', 'Новгородская область'),
+    ('Сыктывкар', 'Республика Коми'),
+    ('Абакан', 'Республика Хакасия'),
+    ('Майкоп', 'Республика Адыгея'),
+    ('Южно-Сахалинск', 'Сахалинская область'),
+    ('Магадан', 'Магаданская область'),
+    ('Нижневартовск', 'Ханты-Мансийский автономный округ'),
+    ('Новый Уренгой', 'Ямало-Ненецкий автономный округ'),
+    ('Дзержинск', 'Нижегородская область'),
+    ('Зеленоград', 'Москва'),
+    ('Подольск', 'Московская область'),
+    ('Балашиха', 'Московская область'),
+    ('Химки', 'Московская область'),
+    ('Мытищи', 'Московская область'),
+    ('Люберцы', 'Московская область'),
+    ('Красногорск', 'Московская область'),
+    ('Электросталь', 'Московская область'),
+    ('Домодедово', 'Московская область'),
+    ('Одинцово', 'Московская область'),
+    ('Щелково', 'Московская область'),
+    ('Пушкино', 'Московская область'),
+    ('Сергиев Посад', 'Московская область'),
+    ('Гатчина', 'Ленинградская область'),
+]
+
+# Colloquial names (declined like city names) and abbreviations (matched as written)
+CITY_ALIASES = {
+    'Санкт-Петербург': ('Петербург', 'Питер'),
+}
+CITY_ABBREVIATIONS = {
+    'Москва': ('МСК',),
+    'Санкт-Петербург': ('СПб', 'СПБ', 'С-Пб'),
+    'Екатеринбург': ('ЕКБ',),
+}
+
+CITY_PREFIX_RE = re.compile(r'^(?:г\.|г |город |пгт\.?|пос\.|поселок |село |с\. )\s*')
+REGION_RE = re.compile(r'\(([^)]*)\)')
+WORD_RE = re.compile(r'[а-яa-z]+(?:-[а-яa-z]+)*')
+MAX_NAME_WORDS = 3
+
+# City names that are (or inflect into) common first names or surnames: in free text they only
+# count after a location cue ("в Орле", "г. Владимир")
+AMBIGUOUS_NAMES = frozenset((
+    'владимир', 'орел', 'киров', 'курган', 'чехов', 'королев', 'иваново', 'одинцово', 'пушкино', 'питер',
+))
+LOCATION_CUES = frozenset(('в', 'во', 'г', 'город', 'городе', 'из', 'по'))
+
+# Names that look plural (or otherwise declinable) but never change
+INDECLINABLE = frozenset(('сочи', 'тольятти'))
+
+VELAR_SIBILANT = set('гкхжшчщ')
+SIBILANT = set('жшчщц')
+
+
+def normalise_city_name(text):
+    """Lowercase, fold ё, drop "г."/"город" prefixes and surrounding punctuation."""
+    text = (text or '').strip().lower().replace('ё', 'е')
+    text = CITY_PREFIX_RE.sub('', text)
+    return ' '.join(text.replace(',', ' ').split()).strip(' .;:')
+
+
+def parse_city(raw):
+    """
+    Split a scraped city string into (name, region): "Киров (Кировская область)",
+    "Москва, Бирюлёвская улица, 38". Returns None for strings that are not a place.
+    """
+    raw = (raw or '').strip()
+    region_match = REGION_RE.search(raw)
+    region = region_match.group(1).strip() if region_match else ''
+    name = REGION_RE.sub('', raw).split(',')[0].strip()
+    name = CITY_PREFIX_RE.sub('', name).strip()
+    if not name or any(ch.isdigit() for ch in name) or len(name.split()) > MAX_NAME_WORDS:
+        return None
+    if not name[0].isupper():
+        return None
+    return name, region
+
+
+def _word_forms(word, adjective=True, modifier=False):
+    """
+    Case forms (nominative, genitive, dative, accusative, instrumental, prepositional),
+    plus extra forms for ambiguous endings. adjective=False for the head noun of a
+    multi-word name ("Новый Уренгой"); modifier=True for the words before it.
+    """
+    if word in INDECLINABLE:
+        return [word]
+    stem = word[:-1]
+    if modifier and word.endswith(('ов', 'ев', 'ин')):
+        # Possessive adjective (Сергиев Посад): "Сергиева", "Сергиевым", "в Сергиевом"
+        return [word, word + 'а', word + 'у', word, word + 'ым', word + 'ом']
+    if adjective and word.endswith(('ий', 'ый', 'ой')):
+        soft = word.endswith('ний')
+        base = word[:-2]
+        if soft:
+            return [word, base + 'его', base + 'ему', word, base + 'им', base + 'ем']
+        return [word, base + 'ого', base + 'ому', word, base + ('им' if word[-3] in VELAR_SIBILANT else 'ым'),
+                base + 'ом']
+    if adjective and word.endswith('ая'):
+        base = word[:-2]
+        return [word, base + 'ой', base + 'ой', base + 'ую', base + 'ой', base + 'ой']
+    if adjective and word.endswith(('ые', 'ие')):
+        base = word[:-2]
+        ending = 'и' if word.endswith('ие') else 'ы'
+        return [word, base + ending + 'х', base + ending + 'м', word, base + ending + 'ми', base + ending + 'х']
+    if word.endswith('а'):
+        genitive = 'и' if stem[-1:] in VELAR_SIBILANT else 'ы'
+        instrumental = 'ей' if stem[-1:] in SIBILANT else 'ой'
+        return [word, stem + genitive, stem + 'е', stem + 'у', stem + instrumental, stem + 'е']
+    if word.endswith('ия'):
+        return [word, stem + 'и', stem + 'и', stem + 'ю', stem + 'ей', stem + 'и']
+    if word.endswith('я'):
+        return [word, stem + 'и', stem + 'е', stem + 'ю', stem + 'ей', stem + 'е']
+    if word.endswith('ь'):
+        # Feminine (Казань, Тверь) and masculine (Ярославль) forms; both are harmless to match
+        return [word, stem + 'и', stem + 'и', word, stem + 'ью', stem + 'и',
+                stem + 'я', stem + 'ю', stem + 'ем', stem + 'е']
+    if word.endswith('о'):
+        return [word, stem + 'а', stem + 'у', word, stem + 'ом', stem + 'е']
+    if word.endswith(('ы', 'и')):
+        # Plural names (Химки, Чебоксары); the genitive is irregular and left as is
+        return [word, word, stem + 'ам', word, stem + 'ами', stem + 'ах']
+    if word.endswith('й'):
+        return [word, stem + 'я', stem + 'ю', word, stem + 'ем', stem + 'е']
+    if word[-1:] in 'еуюэ':
+        return [word]  # Indeclinable
+    return [word, word + 'а', word + 'у', word, word + 'ом', word + 'е']
+
+
+def city_variants(name):
+    """Normalised forms of a city name in every case ("москва", "москвы", "москве", "москву", ...)."""
+    name = normalise_city_name(name)
+    if not name:
+        return []
+
+    if '-на-' in name:
+        # Ростов-на-Дону: only the part before "-на-" declines
+        head, tail = name.split('-на-', 1)
+        forms = [form + '-на-' + tail for form in _word_forms(head)]
+    elif '-' in name:
+        # Санкт-Петербург, Южно-Сахалинск: the last part declines
+        head, last = name.rsplit('-', 1)
+        forms = [head + '-' + form for form in _word_forms(last)]
+    else:
+        words = name.split()
+        word_forms = [_word_forms(word, adjective=len(words) == 1 or i < len(words) - 1,
+                                  modifier=i < len(words) - 1)
+                      for i, word in enumerate(words)]
+        if len(words) == 1:
+            forms = word_forms[0]
+        else:
+            # Decline every word in the same case; irregular words keep their nominative
+            forms = [' '.join(wf[case] if case < len(wf) else wf[0] for wf in word_forms)
+                     for case in range(max(len(wf) for wf in word_forms))]
+
+    return list(dict.fromkeys(forms))
+
+
+def alias_variants(name):
+    """Normalised forms of the aliases and abbreviations of a canonical city name ("питера", "спб")."""
+    forms = [form for alias in CITY_ALIASES.get(name, ()) for form in city_variants(alias)]
+    forms += [normalise_city_name(abbreviation) for abbreviation in CITY_ABBREVIATIONS.get(name, ())]
+    return list(dict.fromkeys(forms))
+
+
+class CityMatcher:
+    """
+    Lookup from any normalised inflected form (or alias, see CITY_ALIASES) to a city code.
+    entries: iterable of (code, name, region, variants).
+    """
+
+    def __init__(self, entries=()):
+        self.names = {}
+        self.by_variant = {}
+        self.by_name_region = {}
+        self.ambiguous = set()  # Forms that are also personal names (see AMBIGUOUS_NAMES)
+        for entry in entries:
+            self.add(*entry)
+
+    def add(self, code, name, region='', variants=()):
+        self.names[code] = name
+        key = normalise_city_name(name)
+        self.by_name_region.setdefault((key, normalise_city_name(region)), code)
+        for variant in [key] + list(variants or []) + alias_variants(name):
+            self.by_variant.setdefault(variant, code)
+        if key in AMBIGUOUS_NAMES:
+            self.ambiguous.update([key] + list(variants or []))
+        for alias in CITY_ALIASES.get(name, ()):
+            if normalise_city_name(alias) in AMBIGUOUS_NAMES:
+                self.ambiguous.update(city_variants(alias))
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, raw):
+        """Code of the city in a scraped or typed city string, or None."""
+        parsed = parse_city(raw)
+        name, region = parsed if parsed else ((raw or '').split(',')[0], '')
+        key = normalise_city_name(name)
+        if region:
+            code = self.by_name_region.get((key, normalise_city_name(region)))
+            if code is not None:
+                return code
+        return self.by_variant.get(key)
+
+    def find_in_text(self, text):
+        """Codes of the cities mentioned in free text (a resume), in order of first mention."""
+        words = WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+        found = []
+        i = 0
+        while i < len(words):
+            for size in range(MAX_NAME_WORDS, 0, -1):
+                form = ' '.join(words[i:i + size])
+                code = self.by_variant.get(form)
+                if code is None:
+                    continue
+                if form in self.ambiguous and (i == 0 or words[i - 1] not in LOCATION_CUES):
+                    continue
+                if code not in found:
+                    found.append(code)
+                i += size
+                break
+            else:
+                i += 1
+        return found
+
+    def variants_of(self, code):
+        """Forms of a city name and of its aliases."""
+        name = self.names[code]
+        return list(dict.fromkeys(city_variants(name) + alias_variants(name)))
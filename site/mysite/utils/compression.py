@@ -0,0 +1,177 @@
+# utils/compression.py
+import json
+import os
+import re
+import numpy as np
+
+# Compression spec: optional reduction to <dims> components, then a storage dtype, e.g.
+# "int8", "truncate384", "pca256-int8". float16 is not offered: NumPy converts it to
+# float32 in software, which made scoring ~10x slower than float32.
+SPEC_RE = re.compile(r'^(?:(pca|truncate)(\d+))?-?(float32|int8)?$')
+DTYPES = {'float32': np.float32, 'int8': np.int8}
+CODEC_ARRAYS = ('mean', 'components', 'scales')
+
+PCA_SAMPLE = 20_000    # Rows the PCA basis is fitted on
+CHUNK_ROWS = 65_536    # Rows decoded at a time while scoring, bounds the float32 temporaries
+INT8_MAX = 127
+
+
+class EmbeddingCodec:
+    """
+    Lossy encoding of job embeddings for in-process scoring.
+
+    Reduction: 'pca' projects onto the top principal components of the catalogue,
+    'truncate' keeps the leading components (Matryoshka-style; the embeddings are
+    compared on a prefix already, see utils.ranking.approximate_scores).
+    Quantisation: int8 with one scale per dimension (symmetric, max-abs).
+
+    Scores are dot products in the reduced space with the query projected the same
+    way; for int8 the scales are folded into the query, so codes are never dequantised
+    as a whole matrix.
+    """
+
+    def __init__(self, reduction=None, dims=None, dtype='float32'):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown embedding dtype: {dtype}")
+        self.reduction = reduction
+        self.dims = dims
+        self.dtype = dtype
+        self.mean = None
+        self.components = None  # (dims, original dims) for PCA
+        self.scales = None  # Per-dimension int8 scales
+
+    @classmethod
+    def from_spec(cls, spec):
+        match = SPEC_RE.match(spec or '')
+        if not match or not any(match.groups()):
+            raise ValueError(f"Bad compression spec: {spec!r}")
+        reduction, dims, dtype = match.groups()
+        return cls(reduction, int(dims) if dims else None, dtype or 'float32')
+
+    @property
+    def spec(self):
+        prefix = f'{self.reduction}{self.dims}-' if self.reduction else ''
+        return prefix + self.dtype
+
+    def bytes_per_vector(self, original_dims):
+        return self._reduced_dims(original_dims) * np.dtype(DTYPES[self.dtype]).itemsize
+
+    def fit(self, matrix, sample=PCA_SAMPLE, seed=0):
+        """Fit the reduction and the int8 scales on the catalogue embeddings."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if self.reduction == 'pca':
+            rows = matrix
+            if len(matrix) > sample:
+                rows = matrix[np.random.default_rng(seed).choice(len(matrix), sample, replace=False)]
+            self.mean = rows.mean(axis=0)
+            _, _, vt = np.linalg.svd(rows - self.mean, full_matrices=False)
+            self.components = np.ascontiguousarray(vt[:self.dims])
+        if self.dtype == 'int8':
+            peak = np.zeros(self._reduced_dims(matrix.shape[1]), dtype=np.float32)
+            for start in range(0, len(matrix), CHUNK_ROWS):
+                np.maximum(peak, np.abs(self._reduce(matrix[start:start + CHUNK_ROWS])).max(axis=0), out=peak)
+            self.scales = np.where(peak > 0, peak / INT8_MAX, 1.0).astype(np.float32)
+        return self
+
+    def _reduced_dims(self, original_dims):
+        return self.dims if self.reduction else original_dims
+
+    def _reduce(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.reduction == 'pca':
+            return (vectors - self.mean) @ self.components.T
+        if self.reduction == 'truncate':
+            return vectors[..., :self.dims]
+        return vectors
+
+    def encode(self, matrix):
+        """Codes for a (jobs, dims) matrix, encoded in chunks."""
+        matrix = np.asarray(matrix)
+        codes = np.empty((len(matrix), self._reduced_dims(matrix.shape[1])), dtype=DTYPES[self.dtype])
+        for start in range(0, len(matrix), CHUNK_ROWS):
+            reduced = self._reduce(matrix[start:start + CHUNK_ROWS])
+            if self.dtype == 'int8':
+                reduced = np.clip(np.rint(reduced / self.scales), -INT8_MAX, INT8_MAX)
+            codes[start:start + CHUNK_ROWS] = reduced
+        return codes
+
+    def decode(self, codes):
+        """Approximate original embeddings for some rows (truncated dimensions come back as zeros)."""
+        reduced = np.asarray(codes, dtype=np.float32)
+        if self.dtype == 'int8':
+            reduced = reduced * self.scales
+        if self.reduction == 'pca':
+            return reduced @ self.components + self.mean
+        return reduced
+
+    def scores(self, codes, queries):
+        """
+        Approximate dot products of every code with the query (1-d) or queries (2-d,
+        one column per query). The PCA mean term is added back so scores stay on the
+        scale of exact ones.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        projected = queries
+        offset = 0.0
+        if self.reduction == 'pca':
+            projected = queries @ self.components.T
+            offset = queries @ self.mean
+        elif self.reduction == 'truncate':
+            projected = queries[..., :self.dims]
+        if self.dtype == 'int8':
+            projected = projected * self.scales
+
+        out = np.empty((len(codes),) + queries.shape[:-1], dtype=np.float32)
+        for start in range(0, len(codes), CHUNK_ROWS):
+            chunk = codes[start:start + CHUNK_ROWS].astype(np.float32, copy=False)
+            out[start:start + CHUNK_ROWS] = chunk @ projected.T
+        return out + offset
+
+
+class CompressedEmbeddings:
+    """A fitted codec with the codes of a whole catalogue (rows aligned with it)."""
+
+    def __init__(self, codec, codes):
+        self.codec = codec
+        self.codes = codes
+
+    @classmethod
+    def build(cls, matrix, spec):
+        codec = EmbeddingCodec.from_spec(spec).fit(matrix)
+        return cls(codec, codec.encode(matrix))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        extra = sum(a.nbytes for a in (self.codec.mean, self.codec.components, self.codec.scales) if a is not None)
+        return self.codes.nbytes + extra
+
+    def save(self, directory):
+        """Write the codes and the fitted codec to `directory` (codes.npy, codec arrays, codec.json)."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'codes.npy'), self.codes)
+        for name in CODEC_ARRAYS:
+            if getattr(self.codec, name) is not None:
+                np.save(os.path.join(directory, f'{name}.npy'), getattr(self.codec, name))
+        with open(os.path.join(directory, 'codec.json'), 'w', encoding='utf8') as file:
+            json.dump({'spec': self.codec.spec}, file)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Codes written by save(), memory-mapped by default."""
+        with open(os.path.join(directory, 'codec.json'), encoding='utf8') as file:
+            codec = EmbeddingCodec.from_spec(json.load(file)['spec'])
+        for name in CODEC_ARRAYS:
+            path = os.path.join(directory, f'{name}.npy')
+            if os.path.exists(path):
+                setattr(codec, name, np.load(path))
+        return cls(codec, np.load(os.path.join(directory, 'codes.npy'), mmap_mode=mmap_mode))
+
+    def scores(self, queries, start=0, end=None):
+        """Approximate scores of rows [start, end) (all rows by default)."""
+        return self.codec.scores(self.codes[start:end], queries)
+
+    def rows(self, indices):
+        return self.codec.decode(self.codes[indices])
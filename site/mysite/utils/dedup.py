@@ -0,0 +1,125 @@
+# utils/dedup.py
+import re
+import zlib
+import numpy as np
+
+# SuperJob vacancy links end in "<slug>-<vacancy id>.html"; parse.py prefixes them with
+# the search URL, so the same vacancy arrives under several links
+VACANCY_ID_RE = re.compile(r'-(\d+)\.html')
+WORD_RE = re.compile(r'\w+')
+
+SHINGLE_SIZE = 3         # Words per shingle
+NUM_PERM = 64            # MinHash signature length
+BANDS = 16               # LSH bands of NUM_PERM // BANDS rows: pairs above ~0.5 Jaccard collide
+JACCARD_THRESHOLD = 0.7  # Estimated text similarity required for a duplicate
+COSINE_THRESHOLD = 0.95  # Embedding similarity required as well (when both have one)
+
+
+def vacancy_id(link):
+    """SuperJob vacancy id from a job link, or None."""
+    match = VACANCY_ID_RE.search(link or '')
+    return match.group(1) if match else None
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """32-bit hashes of the word n-grams of a text (the whole text if it is shorter)."""
+    words = WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+    grams = {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """
+    MinHash with NUM_PERM multiply-shift hash functions h(x) = ((a * x + b) mod 2**64) >> 32,
+    a universal family that uint64 arithmetic computes directly (the product wraps).
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        if not len(hashes):
+            return np.full(len(self.a), np.iinfo(np.uint64).max, dtype=np.uint64)
+        values = (np.outer(hashes, self.a) + self.b) >> np.uint64(32)
+        return values.min(axis=0)
+
+    def signatures(self, texts):
+        return np.array([self.signature(shingle_hashes(text)) for text in texts], dtype=np.uint64)
+
+
+def lsh_candidate_pairs(signatures, bands=BANDS):
+    """
+    Pairs (i, j), i < j, that share at least one LSH band. Each bucket is paired
+    against its first member only, so a large bucket costs O(size), not O(size^2);
+    clusters are closed transitively afterwards.
+    """
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        chunk = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i, row in enumerate(chunk):
+            key = row.tobytes()
+            first = buckets.setdefault(key, i)
+            if first != i:
+                pairs.add((first, i))
+    return pairs
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def normalise_title(title):
+    return ' '.join(WORD_RE.findall((title or '').lower().replace('ё', 'е')))
+
+
+def duplicate_canonicals(texts, embeddings=None, titles=None, keys=None, jaccard_threshold=JACCARD_THRESHOLD,
+                         cosine_threshold=COSINE_THRESHOLD, minhasher=None):
+    """
+    Cluster near-duplicate jobs and return, for every job, the index of its cluster's
+    canonical job (the earliest one); a job is canonical when canonical[i] == i.
+
+    Candidates come from MinHash LSH over text shingles (sub-quadratic); a candidate
+    pair is a duplicate when its estimated Jaccard similarity and, if both jobs have
+    embeddings, the cosine similarity of the embeddings pass the thresholds. With
+    titles, the normalised titles must also be equal: one employer's postings share
+    most of their (often short) text but are different vacancies. Jobs sharing a
+    non-empty key (e.g. the vacancy id) are duplicates outright.
+    """
+    n = len(texts)
+    parent = np.arange(n)
+    if n < 2:
+        return parent
+
+    def union(i, j):
+        root_i, root_j = _find(parent, i), _find(parent, j)
+        if root_i != root_j:
+            # The earlier job stays canonical
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    if keys is not None:
+        first_with_key = {}
+        for i, key in enumerate(keys):
+            if key:
+                union(first_with_key.setdefault(key, i), i)
+
+    signatures = (minhasher or MinHasher()).signatures(texts)
+    for i, j in sorted(lsh_candidate_pairs(signatures)):
+        if np.mean(signatures[i] == signatures[j]) < jaccard_threshold:
+            continue
+        if titles is not None and normalise_title(titles[i]) != normalise_title(titles[j]):
+            continue
+        if embeddings is not None and embeddings[i] is not None and embeddings[j] is not None:
+            a, b = np.asarray(embeddings[i]), np.asarray(embeddings[j])
+            cosine = np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0)
+            if cosine < cosine_threshold:
+                continue
+        union(i, j)
+
+    return np.array([_find(parent, i) for i in range(n)])
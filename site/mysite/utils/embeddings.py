@@ -1,33 +1,113 @@
 # utils/embeddings.py
-from sentence_transformers import SentenceTransformer, CrossEncoder
+# sentence_transformers (torch) and requests are imported when a model is loaded or
+# Ollama is called, so commands and workers that never embed start without them
+import hashlib
 import re
-import requests
 import json
 import os 
+import threading
+import numpy as np
 # Global model variable (lazy loaded)
 _model = None
+_model_source = None  # Hub name or directory _model was loaded from
+_model_versions = {}  # source -> version tag
+# Guards _model/_model_source: a model switch (use_model) must not interleave with a
+# query reading the model and its version
+_model_lock = threading.RLock()
+
+# Construct path relative to this file
+# utils/embeddings.py -> site/mysite/utils/embeddings.py
+# We want site/mysite/fine_tuned_bert
+FINE_TUNED_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fine_tuned_bert')
+BASE_MODEL_NAME = 'google-bert/bert-base-multilingual-cased'
+EMBEDDING_DIM = 768
+FINGERPRINT_BYTES = 1 << 20  # Read from each end of a model file for its version tag
+
+
+def default_model_source():
+    """The fine-tuned model when it is present, else the base model."""
+    return FINE_TUNED_PATH if os.path.exists(FINE_TUNED_PATH) else BASE_MODEL_NAME
+
+
+def resolve_model_source(source):
+    """A local model directory as an absolute path (workers run from other directories); hub names as is."""
+    return os.path.abspath(source) if os.path.isdir(source) else source
+
+
+def load_model(source):
+    from sentence_transformers import SentenceTransformer
+    print(f"Loading embedding model from {source}")
+    return SentenceTransformer(source)
+
 
 def get_model():
     """Lazy load the embedding model."""
-    global _model
-    if _model is not None:
+    return current_model()[0]
+
+
+def current_model():
+    """The embedding model and the version tag of its vectors, read together."""
+    global _model, _model_source
+    with _model_lock:
+        if _model is None:
+            _model_source = default_model_source()
+            _model = load_model(_model_source)
+        return _model, model_version(_model_source)
+
+
+def use_model(source, reload=False):
+    """
+    Make `source` the model get_model() returns (loaded once; a no-op if it already is).
+    reload: load it again and recompute its version tag even if it is the current
+    source, for a model directory whose files were replaced in place.
+    """
+    global _model, _model_source
+    with _model_lock:
+        if reload:
+            _model_versions.pop(source, None)
+        if reload or _model is None or _model_source != source:
+            _model = load_model(source)
+            _model_source = source
         return _model
 
-    # Construct path relative to this file
-    # utils/embeddings.py -> site/mysite/utils/embeddings.py
-    # We want site/mysite/fine_tuned_bert
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    fine_tuned_path = os.path.join(base_dir, 'fine_tuned_bert')
-
-    if os.path.exists(fine_tuned_path):
-        print(f"Loading fine-tuned BERT from {fine_tuned_path}")
-        _model = SentenceTransformer(fine_tuned_path)
-    else:
-        print("Loading base BERT model (lazy load)")
-        # Use bert-base-multilingual-cased
-        _model = SentenceTransformer('google-bert/bert-base-multilingual-cased')
-    
-    return _model
+
+def model_version(source):
+    """
+    Version tag of the vectors a model produces: the hub name, or for a directory its
+    name plus a fingerprint of its files (names, sizes and the first and last MiB of
+    each), so retraining fine_tuned_bert in place gives a new tag.
+    """
+    if source not in _model_versions:
+        if os.path.isdir(source):
+            digest = hashlib.sha1()
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    size = os.path.getsize(path)
+                    digest.update(f"{os.path.relpath(path, source)}:{size}".encode('utf-8'))
+                    with open(path, 'rb') as file:
+                        digest.update(file.read(FINGERPRINT_BYTES))
+                        if size > 2 * FINGERPRINT_BYTES:
+                            file.seek(-FINGERPRINT_BYTES, os.SEEK_END)
+                            digest.update(file.read())
+            name = os.path.basename(os.path.normpath(source))[:40]
+            _model_versions[source] = f"{name}-{digest.hexdigest()[:12]}"
+        else:
+            _model_versions[source] = source.rsplit('/', 1)[-1][:64]
+    return _model_versions[source]
+
+
+def active_model_source():
+    with _model_lock:
+        return _model_source or default_model_source()
+
+
+def loaded_model_version():
+    """Version tag of the loaded model as this process knows it (cached), None before a load."""
+    with _model_lock:
+        return model_version(_model_source) if _model is not None else None
+
 
 # Cross-encoder for reranking - FREE, runs locally, much more accurate
 # Using multilingual mMARCO model - specifically trained for multilingual retrieval
@@ -37,11 +117,25 @@ _reranker = None  # Lazy load to avoid startup cost
 OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "qwen2.5:1.5b"  # Small, fast, good for Russian. Alternatives: llama3.2:1b, phi3
 
+# Multi-vector resume matching
+MAX_RESUME_CHUNKS = 16      # Bounds the size of the single batched encode call
+CHUNK_MEAN_WEIGHT = 0.3     # final = (1 - w) * best chunk + w * average chunk
+# OCR text of a resume is split into chunks of at most this many characters:
+# ~800 characters of Russian text stays well inside BERT's 512 token window.
+RESUME_CHUNK_CHARS = 800
+RESUME_SECTION_HEADINGS = (
+    'опыт работы', 'образование', 'ключевые навыки', 'навыки', 'о себе',
+    'желаемая должность', 'курсы', 'повышение квалификации', 'знание языков',
+    'языки', 'дополнительная информация', 'контакты', 'сертификаты',
+    'experience', 'education', 'skills', 'summary', 'about',
+)
+
 
 def get_reranker():
     """Lazy load cross-encoder reranker."""
     global _reranker
     if _reranker is None:
+        from sentence_transformers import CrossEncoder
         # Multilingual cross-encoder trained on mMARCO - much better for Russian
         _reranker = CrossEncoder('cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
     return _reranker
@@ -131,15 +225,128 @@ def embed_job(title: str, knowledge: str, city: str = "",
 
 
 def embed_query(query: str):
-    """Create embedding for a user search query."""
+    """
+    Create embedding for a user search query.
+    Returns (vector, version tag of the model that encoded it); the vector is None for
+    an empty query. The version is checked against the job vectors (mid-cutover).
+    """
     if not query or not query.strip():
-        return None
+        return None, None
 
     cleaned = preprocess_text(query)
     if not cleaned:
-        return None
+        return None, None
 
-    return get_model().encode(cleaned, normalize_embeddings=True).tolist()
+    model, version = current_model()
+    return model.encode(cleaned, normalize_embeddings=True).tolist(), version
+
+
+def embed_texts(texts):
+    """
+    Embed several texts in one batched encode call.
+    Returns a (n, dim) matrix for the non-empty texts, or None if there are none.
+    """
+    return embed_texts_versioned(texts)[0]
+
+
+def embed_texts_versioned(texts):
+    """embed_texts plus the version tag of the model that encoded them: (matrix or None, version)."""
+    cleaned_texts = [preprocess_text(t) for t in texts]
+    cleaned_texts = [t for t in cleaned_texts if t]
+
+    if not cleaned_texts:
+        return None, None
+
+    model, version = current_model()
+    return model.encode(cleaned_texts, batch_size=len(cleaned_texts),
+                        normalize_embeddings=True, convert_to_numpy=True), version
+
+
+def _is_section_heading(line):
+    """A short line that starts with one of the known resume section names."""
+    line = line.strip().lower().rstrip(':')
+    return 0 < len(line) <= 40 and line.startswith(RESUME_SECTION_HEADINGS)
+
+
+def split_resume_sections(text, max_chars=RESUME_CHUNK_CHARS):
+    """
+    Split OCR text of a resume into chunks for embedding.
+    Cuts on section headings first, then packs paragraphs of long
+    sections into chunks of at most max_chars characters.
+    """
+    if not text or not text.strip():
+        return []
+
+    sections = []
+    current = []
+    for line in text.splitlines():
+        if _is_section_heading(line) and current:
+            sections.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current))
+
+    chunks = []
+    for section in sections:
+        buffer = ""
+        for paragraph in re.split(r'\n\s*\n', section):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            # Hard-wrap paragraphs that are longer than a chunk on their own
+            while len(paragraph) > max_chars:
+                cut = paragraph.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if buffer:
+                    chunks.append(buffer)
+                    buffer = ""
+                chunks.append(paragraph[:cut])
+                paragraph = paragraph[cut:].strip()
+            if buffer and len(buffer) + len(paragraph) + 1 > max_chars:
+                chunks.append(buffer)
+                buffer = ""
+            buffer = f"{buffer} {paragraph}".strip()
+        if buffer:
+            chunks.append(buffer)
+
+    return chunks
+
+
+def resume_chunks(resume_data: dict) -> list:
+    """
+    Collect the texts a resume is matched by: the summary first (when there is one),
+    then either the OCR chunks of the whole resume or the extracted sections.
+    Texts that preprocess to nothing are dropped, so the rows of embed_texts(texts)
+    line up with the returned list.
+    """
+    sections = resume_data.get('chunks') or [
+        resume_data.get(key, '') for key in ('skills', 'experience', 'preferences')
+    ]
+
+    texts = []
+    seen = set()
+    for text in [resume_data.get('full_summary', '')] + list(sections):
+        text = str(text or '').strip()
+        if text and text not in seen and preprocess_text(text):
+            texts.append(text)
+            seen.add(text)
+
+    return texts[:MAX_RESUME_CHUNKS]
+
+
+def score_chunks(job_matrix, chunk_matrix, mean_weight: float = CHUNK_MEAN_WEIGHT):
+    """
+    Score every job against every resume chunk with one matrix multiply.
+    The best matching chunk gives recall, the mean keeps the overall profile.
+    """
+    similarities = np.dot(job_matrix, np.asarray(chunk_matrix).T)
+    return combine_chunk_scores(similarities, mean_weight)
+
+
+def combine_chunk_scores(similarities, mean_weight: float = CHUNK_MEAN_WEIGHT):
+    """Per-job score from a (jobs, chunks) similarity matrix, as in score_chunks."""
+    return (1 - mean_weight) * similarities.max(axis=1) + mean_weight * similarities.mean(axis=1)
 
 
 def rerank_results(query: str, job_texts: list, top_k: int = 20) -> list:
@@ -167,6 +374,54 @@ def rerank_results(query: str, job_texts: list, top_k: int = 20) -> list:
     return indexed_scores[:top_k]
 
 
+def _validation_prompt(query: str, job_summaries: list, top_k: int) -> str:
+    jobs_text = "\n".join([f"{i+1}. {summary}" for i, summary in enumerate(job_summaries[:20])])
+
+    return f"""Ты помощник по поиску работы. Пользователь ищет: "{query}"
+
+Вот список вакансий:
+{jobs_text}
+
+Выбери {min(top_k, len(job_summaries))} наиболее релевантных вакансий для запроса "{query}".
+Ответь ТОЛЬКО номерами вакансий через запятую, от наиболее релевантной к менее релевантной.
+Например: 3,1,5,2,4
+
+Твой ответ (только номера):"""
+
+
+def _validation_payload(prompt: str) -> dict:
+    return {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": False,
+        "options": {
+            "temperature": 0.1,
+            "num_predict": 100
+        }
+    }
+
+
+def _parse_validation_response(result: str, num_jobs: int, top_k: int) -> list:
+    """Turn the LLM's "3,1,5" answer into 0-based indices, appending the unmentioned ones."""
+    numbers = re.findall(r'\d+', result)
+    indices = []
+    seen = set()
+    for num in numbers:
+        idx = int(num) - 1  # Convert to 0-based index
+        if 0 <= idx < num_jobs and idx not in seen:
+            indices.append(idx)
+            seen.add(idx)
+        if len(indices) >= top_k:
+            break
+
+    # Add remaining indices that weren't mentioned
+    for i in range(num_jobs):
+        if i not in seen and len(indices) < num_jobs:
+            indices.append(i)
+
+    return indices[:top_k]
+
+
 def llm_validate_results(query: str, job_summaries: list, top_k: int = 10) -> list:
     """
     Use local LLM (Ollama) to validate and rerank search results.
@@ -178,55 +433,20 @@ def llm_validate_results(query: str, job_summaries: list, top_k: int = 10) -> li
     if not job_summaries or len(job_summaries) == 0:
         return list(range(len(job_summaries)))
 
-    # Build prompt for LLM
-    jobs_text = "\n".join([f"{i+1}. {summary}" for i, summary in enumerate(job_summaries[:20])])
-
-    prompt = f"""Ты помощник по поиску работы. Пользователь ищет: "{query}"
+    import requests
 
-Вот список вакансий:
-{jobs_text}
-
-Выбери {min(top_k, len(job_summaries))} наиболее релевантных вакансий для запроса "{query}".
-Ответь ТОЛЬКО номерами вакансий через запятую, от наиболее релевантной к менее релевантной.
-Например: 3,1,5,2,4
-
-Твой ответ (только номера):"""
+    prompt = _validation_prompt(query, job_summaries, top_k)
 
     try:
         response = requests.post(
             OLLAMA_URL,
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,
-                    "num_predict": 100
-                }
-            },
+            json=_validation_payload(prompt),
             timeout=30
         )
 
         if response.status_code == 200:
             result = response.json().get('response', '').strip()
-            # Parse the numbers from response
-            numbers = re.findall(r'\d+', result)
-            indices = []
-            seen = set()
-            for num in numbers:
-                idx = int(num) - 1  # Convert to 0-based index
-                if 0 <= idx < len(job_summaries) and idx not in seen:
-                    indices.append(idx)
-                    seen.add(idx)
-                if len(indices) >= top_k:
-                    break
-
-            # Add remaining indices that weren't mentioned
-            for i in range(len(job_summaries)):
-                if i not in seen and len(indices) < len(job_summaries):
-                    indices.append(i)
-
-            return indices[:top_k]
+            return _parse_validation_response(result, len(job_summaries), top_k)
     except (requests.RequestException, json.JSONDecodeError, ValueError):
         # Ollama not available or error - fall back to original order
         pass
@@ -235,6 +455,33 @@ def llm_validate_results(query: str, job_summaries: list, top_k: int = 10) -> li
     return list(range(min(top_k, len(job_summaries))))
 
 
+async def allm_validate_results(query: str, job_summaries: list, top_k: int = 10) -> list:
+    """
+    Async version of llm_validate_results over the pooled httpx client.
+    Same fallback to the original order when Ollama is unavailable.
+    """
+    import httpx
+    from utils.async_http import get_async_http_client
+
+    if not job_summaries or len(job_summaries) == 0:
+        return list(range(len(job_summaries)))
+
+    prompt = _validation_prompt(query, job_summaries, top_k)
+
+    try:
+        response = await get_async_http_client().post(OLLAMA_URL, json=_validation_payload(prompt))
+
+        if response.status_code == 200:
+            result = response.json().get('response', '').strip()
+            return _parse_validation_response(result, len(job_summaries), top_k)
+    except (httpx.HTTPError, json.JSONDecodeError, ValueError):
+        # Ollama not available or error - fall back to original order
+        pass
+
+    # Fallback: return original order
+    return list(range(min(top_k, len(job_summaries))))
+
+
 def compute_keyword_boost(query: str, job_text: str) -> float:
     """
     Compute keyword overlap boost for better matching.
@@ -0,0 +1,97 @@
+# utils/instrumentation.py
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('neuralhire.timing')
+
+# Seconds; covers in-process NumPy stages up to slow remote LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_histograms = {}  # (stage, status) -> [bucket counts..., +Inf count, sum]
+_counters = {}    # name -> value
+
+
+def observe(stage: str, seconds: float, status: str = 'ok'):
+    """Record one stage duration in the latency histogram."""
+    with _lock:
+        histogram = _histograms.setdefault((stage, status), [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[len(LATENCY_BUCKETS)] += 1
+        histogram[-1] += seconds
+
+
+def increment(name: str, amount: int = 1):
+    """Increase a named counter (exported as neuralhire_<name>_total)."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """
+    Time a pipeline stage: records it in the metrics and emits one structured log line.
+        with span('cross_encoder', candidates=len(texts)):
+            ...
+    """
+    status = 'ok'
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(stage, elapsed, status)
+        logger.info('stage %s took %.1f ms', stage, elapsed * 1000, extra={
+            'stage': stage, 'duration_ms': round(elapsed * 1000, 2), 'status': status, **fields,
+        })
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of the stage histograms and counters of this process."""
+    lines = [
+        '# HELP neuralhire_stage_seconds Duration of search pipeline stages.',
+        '# TYPE neuralhire_stage_seconds histogram',
+    ]
+    with _lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        counters = dict(_counters)
+
+    for (stage, status), histogram in sorted(histograms.items()):
+        labels = f'stage="{stage}",status="{status}"'
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            lines.append(f'neuralhire_stage_seconds_bucket{{{labels},le="{bound}"}} {histogram[i]}')
+        lines.append(f'neuralhire_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram[len(LATENCY_BUCKETS)]}')
+        lines.append(f'neuralhire_stage_seconds_sum{{{labels}}} {histogram[-1]:.6f}')
+        lines.append(f'neuralhire_stage_seconds_count{{{labels}}} {histogram[len(LATENCY_BUCKETS)]}')
+
+    for name, value in sorted(counters.items()):
+        lines.append(f'# TYPE neuralhire_{name}_total counter')
+        lines.append(f'neuralhire_{name}_total {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per log line, including the fields passed via `extra`."""
+
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update({k: v for k, v in vars(record).items() if k not in self._reserved})
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
@@ -0,0 +1,182 @@
+# utils/lexical.py
+import json
+import os
+import re
+from collections import Counter
+import numpy as np
+from utils.ranking import top_k_indices
+
+try:
+    import snowballstemmer
+    _stemmers = {
+        'ru': snowballstemmer.stemmer('russian'),
+        'en': snowballstemmer.stemmer('english'),
+    }
+except ImportError:  # Optional: fall back to suffix stripping
+    _stemmers = None
+
+# Letters/digits plus trailing +/# so that "C++", "C#" and "1С" survive as tokens
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+[+#]*')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+STOPWORDS = frozenset((
+    'и', 'в', 'во', 'на', 'с', 'со', 'по', 'для', 'от', 'до', 'из', 'к', 'о', 'об', 'у', 'за',
+    'не', 'а', 'но', 'или', 'что', 'как', 'это', 'the', 'and', 'of', 'in', 'for', 'to', 'with',
+))
+
+# Longest first; only used when snowballstemmer is not installed
+RUSSIAN_SUFFIXES = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией', 'ость', 'ости',
+    'ение', 'ения', 'ений', 'ением', 'ание', 'ания', 'аний', 'анием', 'ться', 'тся',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ом', 'ем', 'ам', 'ям',
+    'ах', 'ях', 'ов', 'ев', 'ую', 'юю', 'ть', 'ия', 'ию', 'ии',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+), key=len, reverse=True)
+
+# Files of a saved BM25Index (see BM25Index.save)
+BM25_ARRAYS = ('doc_ids', 'indptr', 'weights')
+BM25_VOCABULARY_FILE = 'bm25_vocabulary.json'
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 2  # Title terms are counted this many times (a cheap BM25F)
+
+
+def _strip_suffix(token):
+    for suffix in RUSSIAN_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def stem(token):
+    """Stem a lowercase token. Tokens with digits or symbols ("1с", "c++") are kept as is."""
+    if len(token) < 4 or not token.isalpha():
+        return token
+    cyrillic = bool(CYRILLIC_RE.search(token))
+    if _stemmers is not None:
+        return _stemmers['ru' if cyrillic else 'en'].stemWord(token)
+    return _strip_suffix(token) if cyrillic else token
+
+
+def tokenize(text):
+    """Lowercase, fold ё, split into tokens, drop stopwords and stem."""
+    if not text:
+        return []
+    text = str(text).lower().replace('ё', 'е')
+    return [stem(token) for token in TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+
+def job_tokens(title, knowledge, additions=''):
+    """Tokens of the lexical fields of a job: title (weighted), requirements and additions."""
+    return tokenize(title) * TITLE_WEIGHT + tokenize(knowledge) + tokenize(additions)
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 weights precomputed per posting.
+    Postings are stored term-major in flat arrays (CSR layout), so a query only
+    touches the postings of its own terms and scores them with one np.bincount.
+    """
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        """documents: list of token lists, one per job (positions match the caller's list)."""
+        self.size = len(documents)
+        self.vocabulary = {}
+
+        term_ids, doc_ids, freqs = [], [], []
+        lengths = np.zeros(self.size)
+        for doc_id, tokens in enumerate(documents):
+            lengths[doc_id] = len(tokens)
+            for token, count in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                doc_ids.append(doc_id)
+                freqs.append(count)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)[order]
+        freqs = np.asarray(freqs, dtype=float)[order]
+
+        doc_freq = np.bincount(term_ids, minlength=len(self.vocabulary))
+        self.indptr = np.concatenate(([0], np.cumsum(doc_freq)))
+
+        idf = np.log1p((self.size - doc_freq + 0.5) / (doc_freq + 0.5))
+        avg_length = lengths.mean() if self.size and lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * lengths[self.doc_ids] / avg_length)
+        term_of_posting = np.repeat(np.arange(len(self.vocabulary)), doc_freq)
+        self.weights = idf[term_of_posting] * freqs * (k1 + 1) / (freqs + norm)
+
+    def save(self, directory):
+        """Write the index to `directory` (bm25_*.npy plus the vocabulary as JSON)."""
+        for name in BM25_ARRAYS:
+            np.save(os.path.join(directory, f'bm25_{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, BM25_VOCABULARY_FILE), 'w', encoding='utf8') as file:
+            json.dump({'size': self.size, 'vocabulary': self.vocabulary}, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """An index written by save(); the posting arrays are memory-mapped by default."""
+        index = cls.__new__(cls)
+        with open(os.path.join(directory, BM25_VOCABULARY_FILE), encoding='utf8') as file:
+            saved = json.load(file)
+        index.size, index.vocabulary = saved['size'], saved['vocabulary']
+        for name in BM25_ARRAYS:
+            setattr(index, name, np.load(os.path.join(directory, f'bm25_{name}.npy'), mmap_mode=mmap_mode))
+        return index
+
+    def scores(self, query):
+        """BM25 score of every document for the query (zeros where no term matches)."""
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids:
+            return np.zeros(self.size)
+        postings = np.concatenate([np.arange(self.indptr[t], self.indptr[t + 1]) for t in term_ids])
+        return np.bincount(self.doc_ids[postings], weights=self.weights[postings], minlength=self.size)
+
+    def search(self, query, k, mask=None):
+        """Top k matching documents as (indices, scores), best first."""
+        scores = self.scores(query)
+        matched = scores > 0 if mask is None else (scores > 0) & mask
+        indices = top_k_indices(scores, k, mask=matched)
+        return indices, scores[indices]
+
+
+# Fusion of the dense and lexical rankings
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked index lists: score(d) = sum over rankings of 1 / (k + rank).
+    Returns (indices, scores), best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, index in enumerate(ranking):
+            fused[index] = fused.get(index, 0.0) + 1.0 / (k + rank + 1)
+    indices = np.fromiter(fused, dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=float, count=len(fused))
+    order = np.argsort(-scores, kind='stable')
+    return indices[order], scores[order]
+
+
+def weighted_fusion(candidates, dense_scores, lexical_scores, weight):
+    """
+    (1 - weight) * dense + weight * lexical for the candidate indices, each score
+    min-max normalised over the candidates first. Returns (indices, scores), best first.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+
+    def normalise(values):
+        finite = np.isfinite(values)
+        if not finite.any():
+            return np.zeros(len(values))
+        low, high = values[finite].min(), values[finite].max()
+        if high == low:
+            return np.where(finite, 1.0, 0.0)
+        return np.where(finite, (values - low) / (high - low), 0.0)
+
+    fused = (1 - weight) * normalise(dense_scores[candidates]) + weight * normalise(lexical_scores[candidates])
+    order = np.argsort(-fused, kind='stable')
+    return candidates[order], fused[order]
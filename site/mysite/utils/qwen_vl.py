@@ -1,37 +1,109 @@
 import os
-from openai import OpenAI
+import asyncio
+import weakref
 import tempfile
-from pdf2image import convert_from_path
+import threading
 from pathlib import Path
 import base64
 import json
+import logging
+from utils.embeddings import split_resume_sections
+from utils.instrumentation import span
+
+# openai, pdf2image and pytesseract are imported where they are used, and the env
+# file and API clients are set up on first use: importing this module (every view,
+# every manage.py command) does no I/O.
+
+logger = logging.getLogger(__name__)
+
+# Environment variables from env.env in the project root, loaded on first use
+ENV_FILE = Path(__file__).resolve().parent.parent.parent.parent / 'env.env'
+QWEN_BASE_URL = "https://dashscope-intl.aliyuncs.com/compatible-mode/v1"
+# Tesseract binary when it is not on PATH, e.g. C:\Program Files\Tesseract-OCR\tesseract.exe
+TESSERACT_CMD_ENV = 'TESSERACT_CMD'
+# Pages OCR'd for the resume chunks; more text than this would not fit MAX_RESUME_CHUNKS anyway
+OCR_MAX_PAGES = 5
+
+_env_loaded = False
+_client = None
+_client_lock = threading.Lock()
+# Async clients for the async views, one per event loop (see utils.async_http)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def load_env_file():
+    """Copy the KEY=value lines of env.env into os.environ, once per process."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    if ENV_FILE.exists():
+        with open(ENV_FILE) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ[key.strip()] = value.strip()
+        logger.info('loaded environment from %s', ENV_FILE)
+
+
+def get_api_key():
+    load_env_file()
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        logger.warning('DASHSCOPE_API_KEY not found in environment')
+    return api_key
+
+
+def get_client():
+    """The OpenAI-compatible Qwen client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(api_key=get_api_key(), base_url=QWEN_BASE_URL)
+    return _client
+
+
+def get_async_client():
+    """Return an AsyncOpenAI client that shares the pooled HTTP connections."""
+    from openai import AsyncOpenAI
+    from utils.async_http import get_async_http_client, HTTP_TIMEOUT
+
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = AsyncOpenAI(
+            api_key=get_api_key(),
+            base_url=QWEN_BASE_URL,
+            http_client=get_async_http_client(),
+            timeout=HTTP_TIMEOUT,
+        )
+        _async_clients[loop] = async_client
+    return async_client
 
-# Load environment variables from env.env file in project root
-env_file = Path(__file__).resolve().parent.parent.parent.parent / 'env.env'
-
-print(f"Looking for env.env at: {env_file}")
-print(f"File exists: {env_file.exists()}")
-
-if env_file.exists():
-    with open(env_file) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ[key.strip()] = value.strip()
-                print(f"Loaded env variable: {key.strip()}")
 
-# Initialize OpenAI client for Qwen
-api_key = os.getenv("DASHSCOPE_API_KEY")
-print(f"API Key loaded: {'Yes' if api_key else 'No'}")
+def _pytesseract():
+    """pytesseract, pointed at TESSERACT_CMD when that is set."""
+    import pytesseract
+    command = os.getenv(TESSERACT_CMD_ENV)
+    if command:
+        pytesseract.pytesseract.tesseract_cmd = command
+    return pytesseract
 
-if not api_key:
-    print("WARNING: DASHSCOPE_API_KEY not found in environment!")
 
-client = OpenAI(
-    api_key=api_key,
-    base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
-)
+def ocr_resume_text(pdf_path, max_pages=OCR_MAX_PAGES):
+    """Tesseract text of the first pages of the PDF, for the resume chunks ('' if OCR fails)."""
+    try:
+        from pdf2image import convert_from_path
+        pytesseract = _pytesseract()
+        with span('pdf_render'):
+            images = convert_from_path(pdf_path, last_page=max_pages)
+        with span('ocr', pages=len(images)):
+            return "\n".join(pytesseract.image_to_string(image, lang='rus+eng') for image in images)
+    except Exception as e:
+        print(f"Error in OCR: {e}")
+        return ""
 
 
 def encode_image_to_base64(image_path):
@@ -40,74 +112,94 @@ def encode_image_to_base64(image_path):
         return base64.b64encode(image_file.read()).decode('utf-8')
 
 
+RESUME_PROMPT = "Проанализируй это резюме. Извлеки ключевые навыки, опыт работы и предпочтения по работе. Составь краткое описание (summary) для поиска вакансий. Верни ответ в формате JSON: {\"skills\": \"...\", \"experience\": \"...\", \"preferences\": \"...\", \"full_summary\": \"...\"}"
+
+
+def _resume_messages(pdf_path):
+    """
+    Convert the first 2 pages of the PDF to images and build the Qwen VL message.
+    Returns None if the PDF produced no images.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir, span('pdf_render'):
+        from pdf2image import convert_from_path
+        images = convert_from_path(pdf_path, output_folder=temp_dir, fmt='png', last_page=2)
+        if not images:
+            print("No images generated from PDF")
+            return None
+        
+        # Save images and encode to base64
+        image_contents = []
+        for i, image in enumerate(images):
+            img_path = os.path.join(temp_dir, f'page_{i+1}.png')
+            image.save(img_path, 'PNG')
+            
+            # Encode image to base64
+            base64_image = encode_image_to_base64(img_path)
+            image_contents.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/png;base64,{base64_image}"
+                }
+            })
+    
+    # Construct message with images and text prompt
+    content = image_contents + [{
+        "type": "text",
+        "text": RESUME_PROMPT
+    }]
+    
+    return [
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
+
+
+def _parse_resume_response(result_text):
+    """Parse the JSON answer of Qwen VL, falling back to raw text."""
+    try:
+        # Sometimes the model wraps JSON in markdown code blocks
+        if '```json' in result_text:
+            result_text = result_text.split('```json')[1].split('```')[0].strip()
+        elif '```' in result_text:
+            result_text = result_text.split('```')[1].split('```')[0].strip()
+        
+        parsed = json.loads(result_text)
+        return parsed
+    except json.JSONDecodeError:
+        # If JSON parsing fails, return raw text
+        print(f"Could not parse JSON, returning raw text: {result_text}")
+        return {
+            'skills': '',
+            'experience': '',
+            'preferences': '',
+            'full_summary': result_text
+        }
+
+
 def summarize_resume(pdf_path):
     """
     Extracts summary from a PDF resume using Qwen-VL-Plus via OpenAI-compatible API.
-    Returns a dictionary with 'skills', 'experience', 'preferences', and 'full_summary'.
+    Returns a dictionary with 'skills', 'experience', 'preferences', 'full_summary' and
+    'chunks' (OCR text of the resume split for embedding, see utils.embeddings.resume_chunks).
     """
     try:
-        # Convert first 2 pages of PDF to images
-        with tempfile.TemporaryDirectory() as temp_dir:
-            images = convert_from_path(pdf_path, output_folder=temp_dir, fmt='png', last_page=2)
-            if not images:
-                print("No images generated from PDF")
-                return None
-            
-            # Save images and encode to base64
-            image_contents = []
-            for i, image in enumerate(images):
-                img_path = os.path.join(temp_dir, f'page_{i+1}.png')
-                image.save(img_path, 'PNG')
-                
-                # Encode image to base64
-                base64_image = encode_image_to_base64(img_path)
-                image_contents.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}"
-                    }
-                })
-            
-            # Construct message with images and text prompt
-            content = image_contents + [{
-                "type": "text",
-                "text": "Проанализируй это резюме. Извлеки ключевые навыки, опыт работы и предпочтения по работе. Составь краткое описание (summary) для поиска вакансий. Верни ответ в формате JSON: {\"skills\": \"...\", \"experience\": \"...\", \"preferences\": \"...\", \"full_summary\": \"...\"}"
-            }]
-            
-            messages = [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
+        messages = _resume_messages(pdf_path)
+        if messages is None:
+            return None
 
-            # Call Qwen VL Plus via OpenAI-compatible API
-            completion = client.chat.completions.create(
+        # Call Qwen VL Plus via OpenAI-compatible API
+        with span('qwen_vl'):
+            completion = get_client().chat.completions.create(
                 model="qwen-vl-plus",
                 messages=messages
             )
 
-            result_text = completion.choices[0].message.content
-            
-            # Try to parse JSON from response
-            try:
-                # Sometimes the model wraps JSON in markdown code blocks
-                if '```json' in result_text:
-                    result_text = result_text.split('```json')[1].split('```')[0].strip()
-                elif '```' in result_text:
-                    result_text = result_text.split('```')[1].split('```')[0].strip()
-                
-                parsed = json.loads(result_text)
-                return parsed
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return raw text
-                print(f"Could not parse JSON, returning raw text: {result_text}")
-                return {
-                    'skills': '',
-                    'experience': '',
-                    'preferences': '',
-                    'full_summary': result_text
-                }
+        resume_data = _parse_resume_response(completion.choices[0].message.content)
+        if isinstance(resume_data, dict):
+            resume_data['chunks'] = split_resume_sections(ocr_resume_text(pdf_path))
+        return resume_data
 
     except Exception as e:
         print(f"Exception in summarize_resume: {e}")
@@ -116,6 +208,37 @@ def summarize_resume(pdf_path):
         return None
 
 
+async def asummarize_resume(pdf_path):
+    """
+    Async version of summarize_resume; PDF rendering runs in a worker thread, and the
+    OCR for the chunks runs in another one while Qwen VL answers.
+    """
+    ocr = asyncio.ensure_future(asyncio.to_thread(ocr_resume_text, pdf_path))
+    try:
+        messages = await asyncio.to_thread(_resume_messages, pdf_path)
+        if messages is None:
+            resume_data = None
+        else:
+            with span('qwen_vl'):
+                completion = await get_async_client().chat.completions.create(
+                    model="qwen-vl-plus",
+                    messages=messages
+                )
+            resume_data = _parse_resume_response(completion.choices[0].message.content)
+
+    except Exception as e:
+        print(f"Exception in asummarize_resume: {e}")
+        import traceback
+        traceback.print_exc()
+        resume_data = None
+
+    # Waited for even when the summary failed: the caller deletes the PDF next
+    text = await ocr
+    if isinstance(resume_data, dict):
+        resume_data['chunks'] = split_resume_sections(text)
+    return resume_data
+
+
 def summarize_results(resume_summary, jobs):
     """
     Generates a natural language explanation of why these jobs fit the resume.
@@ -133,7 +256,7 @@ def summarize_results(resume_summary, jobs):
 
 Объясни кратко, почему эти вакансии подходят кандидату. Выдели ключевые совпадения."""
 
-        completion = client.chat.completions.create(
+        completion = get_client().chat.completions.create(
             model="qwen-plus",
             messages=[
                 {"role": "system", "content": "Ты помощник по подбору вакансий. Отвечай кратко и по делу на русском языке."},
@@ -150,31 +273,50 @@ def summarize_results(resume_summary, jobs):
         return None
 
 
+def _explain_messages(resume_summary, job):
+    prompt = f"""Резюме кандидата: {resume_summary}
+
+Вакансия: {job.title} в {job.company} ({job.city})
+Требования: {job.knoladge[:200]}...
+
+Объясни в 2-3 предложениях, почему эта вакансия подходит кандидату."""
+
+    return [
+        {"role": "system", "content": "Ты помощник по подбору вакансий. Отвечай очень кратко, 2-3 предложения."},
+        {"role": "user", "content": prompt}
+    ]
+
+
 def explain_job_match(resume_summary, job):
     """
     Generates explanation for why a single job matches the resume.
     Used for individual job cards.
     """
     try:
-        prompt = f"""Резюме кандидата: {resume_summary}
+        completion = get_client().chat.completions.create(
+            model="qwen-plus",
+            messages=_explain_messages(resume_summary, job)
+        )
 
-Вакансия: {job.title} в {job.company} ({job.city})
-Требования: {job.knoladge[:200]}...
+        return completion.choices[0].message.content
 
-Объясни в 2-3 предложениях, почему эта вакансия подходит кандидату."""
+    except Exception as e:
+        print(f"Exception in explain_job_match: {e}")
+        return None
 
-        completion = client.chat.completions.create(
+
+async def aexplain_job_match(resume_summary, job):
+    """Async version of explain_job_match."""
+    try:
+        completion = await get_async_client().chat.completions.create(
             model="qwen-plus",
-            messages=[
-                {"role": "system", "content": "Ты помощник по подбору вакансий. Отвечай очень кратко, 2-3 предложения."},
-                {"role": "user", "content": prompt}
-            ]
+            messages=_explain_messages(resume_summary, job)
         )
 
         return completion.choices[0].message.content
 
     except Exception as e:
-        print(f"Exception in explain_job_match: {e}")
+        print(f"Exception in aexplain_job_match: {e}")
         return None
 
 
@@ -195,6 +337,7 @@ def test_extract_bbox(pdf_path, keyword):
         
         # Convert PDF to images
         with tempfile.TemporaryDirectory() as temp_dir:
+            from pdf2image import convert_from_path
             images = convert_from_path(pdf_path, output_folder=temp_dir, fmt='png', last_page=2)
             if not images:
                 print("No images generated from PDF")
@@ -239,7 +382,7 @@ The bbox coordinates should be normalized to 0-1000 range relative to the image
                 print(f"Trying page {page_num}...")
                 
                 # Call Qwen VL
-                completion = client.chat.completions.create(
+                completion = get_client().chat.completions.create(
                     model="qwen-vl-max",  # Using max for better grounding
                     messages=messages
                 )
@@ -294,7 +437,7 @@ Rules:
 
 Explanation: {explanation}"""
 
-        completion = client.chat.completions.create(
+        completion = get_client().chat.completions.create(
             model="qwen-plus",
             messages=[
                 {"role": "system", "content": "Extract ONE specific hard skill, tool, or location as evidence. Return only JSON array."},
@@ -317,19 +460,36 @@ Explanation: {explanation}"""
         print(f"Error extracting keywords: {e}")
         return []
 
-import pytesseract
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+def _ocr_word(text):
+    """An OCR word (or a word of a keyword form) lowercased, ё folded, punctuation stripped."""
+    return text.strip().lower().replace('ё', 'е').strip('.,;:()«»"')
+
 
 def extract_resume_crops(pdf_path, keywords_list, output_dir):
-    import os
-    import pytesseract
+    """
+    Crop the first place each keyword appears on the first two pages.
+    keywords_list: list of words, or {word form: keyword} to find a keyword by any
+    of its forms (e.g. city inflections from utils.cities). Returns {keyword: path}.
+    """
     from pdf2image import convert_from_path
-    from PIL import Image
+
+    pytesseract = _pytesseract()
 
     crops = {}
     os.makedirs(output_dir, exist_ok=True)
 
-    keywords_list = ['Москву']
+    if not isinstance(keywords_list, dict):
+        keywords_list = {keyword: keyword for keyword in keywords_list}
+    # OCR yields single words: a multi-word form ("нижнем новгороде") must match as many
+    # consecutive words, and the crop covers all of them
+    forms = {}
+    for form, keyword in keywords_list.items():
+        words = tuple(_ocr_word(word) for word in form.split())
+        if all(words):
+            forms.setdefault(words, keyword)
+    if not forms:
+        return crops
+    longest = max(len(words) for words in forms)
 
     try:
         images = convert_from_path(pdf_path, dpi=300, first_page=1, last_page=2)
@@ -338,38 +498,37 @@ def extract_resume_crops(pdf_path, keywords_list, output_dir):
 
         for page_num, img in enumerate(images, 1):
             data = pytesseract.image_to_data(img, lang="rus", output_type=pytesseract.Output.DICT)
-            n = len(data["text"])
-
-            for keyword in keywords_list:
-                if keyword in crops:
+            # Positions of the recognised words, in reading order
+            positions = [i for i, text in enumerate(data["text"]) if _ocr_word(text)]
+            page_words = [_ocr_word(data["text"][i]) for i in positions]
+
+            for start in range(len(positions)):
+                for size in range(min(longest, len(positions) - start), 0, -1):
+                    keyword = forms.get(tuple(page_words[start:start + size]))
+                    if keyword is not None:
+                        break
+                if keyword is None or keyword in crops:
                     continue
 
-                kw = keyword.lower()
-
-                for i in range(n):
-                    word = data["text"][i].strip().lower()
-                    if not word or kw not in word:
-                        continue
-
-                    x = data["left"][i]
-                    y = data["top"][i]
-                    w = data["width"][i]
-                    h = data["height"][i]
+                boxes = positions[start:start + size]
+                x = min(data["left"][i] for i in boxes)
+                y = min(data["top"][i] for i in boxes)
+                w = max(data["left"][i] + data["width"][i] for i in boxes) - x
+                h = max(data["top"][i] + data["height"][i] for i in boxes) - y
 
-                    pad_x, pad_y = 30, 20
-                    x1 = max(0, x - pad_x)
-                    y1 = max(0, y - pad_y)
-                    x2 = min(img.width, x + w + pad_x)
-                    y2 = min(img.height, y + h + pad_y)
+                pad_x, pad_y = 30, 20
+                x1 = max(0, x - pad_x)
+                y1 = max(0, y - pad_y)
+                x2 = min(img.width, x + w + pad_x)
+                y2 = min(img.height, y + h + pad_y)
 
-                    crop = img.crop((x1, y1, x2, y2))
+                crop = img.crop((x1, y1, x2, y2))
 
-                    name = f"crop_{keyword.replace(' ', '_')}_{page_num}.png"
-                    path = os.path.join(output_dir, name)
-                    crop.save(path)
+                name = f"crop_{keyword.replace(' ', '_')}_{page_num}.png"
+                path = os.path.join(output_dir, name)
+                crop.save(path)
 
-                    crops[keyword] = path
-                    break
+                crops[keyword] = path
 
         return crops
 
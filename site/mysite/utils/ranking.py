@@ -0,0 +1,183 @@
+# utils/ranking.py
+import heapq
+import itertools
+import numpy as np
+
+
+def top_k_indices(scores, k: int, mask=None):
+    """
+    Indices of the k highest scores, best first.
+    argpartition finds the top k in O(n); only those k are sorted.
+    Jobs outside the mask (and -inf scores) are never returned.
+    """
+    scores = np.asarray(scores)
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+
+    valid = int(np.count_nonzero(scores > -np.inf))
+    k = min(k, valid)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def additions_mask(additions, selected_additions):
+    """
+    Boolean mask of jobs whose addition text contains any selected addition.
+    Same substring test as the views used, vectorised with np.char.
+    """
+    additions = np.asarray([a or '' for a in additions], dtype=str)
+    mask = np.zeros(len(additions), dtype=bool)
+    for selected in selected_additions:
+        mask |= np.char.find(additions, selected) >= 0
+    return mask
+
+
+def boost_pool(scores, k: int, max_boost: float, limit: int, mask=None):
+    """
+    Candidates that can still reach the top k after an additive boost in [0, max_boost].
+    A job whose score is more than max_boost below the k-th best score can never
+    overtake it, so only the remaining jobs need the (Python-side) boost computed.
+    limit caps the pool for very flat score distributions.
+    """
+    scores = np.asarray(scores)
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+
+    ranked = top_k_indices(scores, limit)
+    if len(ranked) <= k:
+        return ranked
+
+    threshold = scores[ranked[k - 1]] - max_boost
+    return ranked[scores[ranked] >= threshold]
+
+
+# Approximate retrieval: shortlist on a prefix of the embedding, rescore exactly
+APPROX_DIMS = 128
+APPROX_OVERSAMPLE = 10
+
+
+def approximate_scores(job_matrix, query_vec, k: int, dims: int = APPROX_DIMS,
+                       oversample: int = APPROX_OVERSAMPLE, mask=None):
+    """
+    Cheaper stand-in for job_matrix @ query_vec when only the top k matter.
+    Scores every job on the first `dims` components, keeps the best k * oversample
+    and computes exact scores for those only; every other job gets -inf.
+    """
+    coarse = np.dot(job_matrix[:, :dims], query_vec[:dims])
+    shortlist = top_k_indices(coarse, k * oversample, mask=mask)
+
+    scores = np.full(len(job_matrix), -np.inf)
+    scores[shortlist] = np.dot(job_matrix[shortlist], query_vec)
+    return scores
+
+
+def salary_mask(money, min_salary=None, max_salary=None, include_negotiable=True):
+    """
+    Boolean mask of jobs whose salary is within [min_salary, max_salary].
+    import_jobs stores "по договорённости" (and unparseable values) as -1; those and
+    missing salaries (also expected as -1 here) pass only when include_negotiable is set.
+    """
+    money = np.asarray(money, dtype=np.int64)
+    negotiable = money < 0
+    mask = ~negotiable
+    if min_salary is not None:
+        mask &= money >= min_salary
+    if max_salary is not None:
+        mask &= money <= max_salary
+    if include_negotiable:
+        mask |= negotiable
+    return mask
+
+
+def effective_salary(money, predicted):
+    """
+    Salary used by filters and sorting: the listed salary where there is one, else the
+    model's estimate (Job.predicted_money, -1 where missing), else -1 as for "по договорённости".
+    """
+    money = np.asarray(money, dtype=np.int64)
+    predicted = np.asarray(predicted, dtype=np.int64)
+    return np.where(money > 0, money, np.where(predicted > 0, predicted, -1))
+
+
+def scores_below(head_scores, count: int):
+    """
+    Descending scores for `count` items ranked after head_scores, strictly below its
+    minimum and spaced by the head's average gap. Lets a tail ranked by another
+    scorer (fusion scores under cross-encoder logits) keep its order on the head's scale.
+    """
+    head_scores = np.asarray(head_scores, dtype=float)
+    if not len(head_scores):
+        return -np.arange(1, count + 1, dtype=float)
+    spread = head_scores.max() - head_scores.min()
+    step = spread / len(head_scores) if spread > 0 else 1.0
+    return head_scores.min() - step * np.arange(1, count + 1)
+
+
+def mmr_order(relevance, vectors, k: int, lambda_: float):
+    """
+    Maximal marginal relevance: greedily pick k items maximising
+    lambda * relevance - (1 - lambda) * (max cosine similarity to the items already picked).
+    relevance is min-max normalised first so lambda weighs comparable ranges.
+    Returns positions into relevance/vectors in pick order.
+    """
+    relevance = np.asarray(relevance, dtype=float)
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(n)
+
+    vectors = np.asarray(vectors, dtype=float)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+
+    picked = np.zeros(n, dtype=bool)
+    order = [int(np.argmax(relevance))]
+    picked[order[0]] = True
+    max_similarity = similarity[order[0]].copy()
+    for _ in range(k - 1):
+        mmr = lambda_ * relevance - (1 - lambda_) * max_similarity
+        mmr[picked] = -np.inf
+        choice = int(np.argmax(mmr))
+        order.append(choice)
+        picked[choice] = True
+        np.maximum(max_similarity, similarity[choice], out=max_similarity)
+    return np.array(order, dtype=np.int64)
+
+
+def shard_bounds(n: int, shards: int):
+    """(start, end) row ranges of `shards` near-equal contiguous shards."""
+    edges = np.linspace(0, n, max(1, min(shards, n)) + 1).astype(np.int64)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def sharded_top_k(score_rows, n: int, k: int, executor, shards: int, mask=None):
+    """
+    Score n rows in contiguous shards on an executor and select the top k.
+    score_rows(start, end) returns the scores of rows [start, end); NumPy releases the
+    GIL in the matrix products and the partitioning, so a thread pool runs shards on
+    separate cores. Each shard keeps its own top k, and the sorted shard lists are
+    merged with a heap. Returns (indices best first, scores of all n rows, float32).
+    """
+    scores = np.empty(n, dtype=np.float32)
+
+    def run_shard(bounds):
+        start, end = bounds
+        shard_scores = score_rows(start, end)
+        scores[start:end] = shard_scores
+        top = top_k_indices(shard_scores, k, mask=None if mask is None else mask[start:end])
+        return list(zip(shard_scores[top], top + start))
+
+    shard_tops = executor.map(run_shard, shard_bounds(n, shards))
+    merged = heapq.merge(*shard_tops, key=lambda pair: -pair[0])
+    indices = np.fromiter((int(index) for _, index in itertools.islice(merged, k)), dtype=np.int64)
+    return indices, scores
@@ -0,0 +1,128 @@
+# utils/salary.py
+import json
+import os
+import zlib
+import numpy as np
+from utils.lexical import job_tokens
+
+# Artifacts live next to the old CatBoost experiment (model/Salary_Prediction)
+SALARY_MODEL_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    'model', 'Salary_Prediction'
+)
+SALARY_MODEL_PATH = os.path.join(SALARY_MODEL_DIR, 'salary_model.npz')
+
+# Features: the job embedding, hashed title/requirement tokens (the notebook's word
+# indicators without the vocabulary) and a hashed city indicator, plus a bias
+TOKEN_BUCKETS = 1024
+CITY_BUCKETS = 128
+RIDGE_ALPHA = 1.0
+CHUNK_ROWS = 4096  # Rows featurised at a time, bounds the float32 feature block
+CLIP_PERCENTILES = (1, 99)  # Predictions stay within the range of the salaries seen in training
+
+_salary_model = None  # (path, SalaryModel or None) loaded by this process
+
+
+def _bucket(text, buckets):
+    # crc32, not hash(): the buckets must be the same in every process
+    return zlib.crc32(text.encode('utf-8')) % buckets
+
+
+def salary_features(jobs, embedding_dim):
+    """
+    Feature matrix for job rows (dicts with title, knoladge, addition, city, city_ref and
+    content_embedding). A job without an embedding keeps only its text and city features.
+    """
+    features = np.zeros((len(jobs), embedding_dim + TOKEN_BUCKETS + CITY_BUCKETS + 1), dtype=np.float32)
+    token_offset = embedding_dim
+    city_offset = token_offset + TOKEN_BUCKETS
+    for row, job in enumerate(jobs):
+        embedding = job.get('content_embedding')
+        if embedding is not None and len(embedding) == embedding_dim:
+            features[row, :embedding_dim] = embedding
+
+        buckets = {token_offset + _bucket(token, TOKEN_BUCKETS)
+                   for token in job_tokens(job.get('title', ''), job.get('knoladge', ''), job.get('addition', ''))}
+        if buckets:
+            features[row, list(buckets)] = 1.0 / np.sqrt(len(buckets))
+
+        city = job.get('city_ref')
+        city = f'id:{city}' if city is not None else (job.get('city') or '').strip().lower()
+        if city:
+            features[row, city_offset + _bucket(city, CITY_BUCKETS)] = 1.0
+        features[row, -1] = 1.0
+    return features
+
+
+def salary_errors(actual, predicted):
+    """MAPE, median APE and MAE of predicted against known salaries."""
+    actual = np.asarray(actual, dtype=np.float64)
+    errors = np.abs(np.asarray(predicted, dtype=np.float64) - actual)
+    relative = errors / actual
+    return {'mape': float(100 * relative.mean()), 'median_ape': float(100 * np.median(relative)),
+            'mae': float(errors.mean()), 'jobs': int(len(actual))}
+
+
+class SalaryModel:
+    """
+    Ridge regression of log salary on salary_features. Training accumulates X^T X over
+    chunks, so the feature matrix of the whole catalogue is never held at once;
+    prediction is one matrix-vector product per chunk.
+    """
+
+    def __init__(self, embedding_dim, weights=None, low=None, high=None, meta=None):
+        self.embedding_dim = embedding_dim
+        self.weights = weights
+        self.low = low
+        self.high = high
+        self.meta = meta or {}
+
+    def fit(self, jobs, salaries, alpha=RIDGE_ALPHA):
+        """jobs: row dicts; salaries: the known (positive) salaries in Job.money units."""
+        salaries = np.asarray(salaries, dtype=np.float64)
+        dims = self.embedding_dim + TOKEN_BUCKETS + CITY_BUCKETS + 1
+        gram = np.zeros((dims, dims))
+        moment = np.zeros(dims)
+        target = np.log(salaries)
+        for start in range(0, len(jobs), CHUNK_ROWS):
+            block = salary_features(jobs[start:start + CHUNK_ROWS], self.embedding_dim).astype(np.float64)
+            gram += block.T @ block
+            moment += block.T @ target[start:start + CHUNK_ROWS]
+
+        penalty = np.full(dims, alpha)
+        penalty[-1] = 0.0  # The bias is not shrunk
+        self.weights = np.linalg.solve(gram + np.diag(penalty), moment).astype(np.float32)
+        self.low, self.high = (float(value) for value in np.percentile(salaries, CLIP_PERCENTILES))
+        self.meta.update({'alpha': alpha, 'trained_on': int(len(salaries))})
+        return self
+
+    def predict(self, jobs):
+        """Predicted salaries (int64, Job.money units) for job rows."""
+        predictions = np.empty(len(jobs), dtype=np.int64)
+        for start in range(0, len(jobs), CHUNK_ROWS):
+            block = salary_features(jobs[start:start + CHUNK_ROWS], self.embedding_dim)
+            values = np.exp(block @ self.weights)
+            predictions[start:start + len(block)] = np.rint(np.clip(values, self.low, self.high))
+        return predictions
+
+    def save(self, path=SALARY_MODEL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, weights=self.weights, bounds=np.array([self.low, self.high]),
+                 embedding_dim=self.embedding_dim, meta=json.dumps(self.meta, ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=SALARY_MODEL_PATH):
+        with np.load(path) as data:
+            low, high = data['bounds'].tolist()
+            return cls(int(data['embedding_dim']), weights=data['weights'], low=low, high=high,
+                       meta=json.loads(str(data['meta'])))
+
+
+def get_salary_model(path=SALARY_MODEL_PATH):
+    """The trained salary model, loaded once per process; None when none has been trained."""
+    global _salary_model
+    if _salary_model is None or _salary_model[0] != path:
+        _salary_model = (path, SalaryModel.load(path) if os.path.exists(path) else None)
+    return _salary_model[1]